@@ -0,0 +1,193 @@
+"""
+Módulo de agrupamento de pedidos em regiões
+
+Contém o motor de clusterização usado por agrupar_por_regiao:
+  - as coordenadas são projetadas em km antes do K-Means (graus de latitude e
+    longitude não têm o mesmo comprimento fora do equador);
+  - para entradas grandes é usado o MiniBatchKMeans;
+  - os centróides de uma execução anterior podem ser reaproveitados como
+    ponto de partida (warm start) quando poucos pedidos mudaram;
+  - opcionalmente, as regiões são equilibradas para que a demanda de cada
+    uma caiba em aproximadamente uma carga de caminhão.
+"""
+
+import logging
+
+import numpy as np
+from scipy.spatial import cKDTree
+from sklearn.cluster import KMeans, MiniBatchKMeans
+
+from config import endereco_partida_coords
+from distancias import RAIO_TERRA_KM
+from instrumentacao import etapa
+
+# A partir deste número de pedidos o modo "auto" usa o MiniBatchKMeans
+LIMITE_MINIBATCH = 5000
+
+# Máximo de regiões criadas pelo agrupamento por capacidade
+MAX_REGIOES = 500
+
+# Centróides mais próximos consultados para cada ponto no balanceamento
+VIZINHOS_BALANCEAMENTO = 8
+
+
+def projetar_coordenadas(coords, referencia=endereco_partida_coords, metodo="equiretangular"):
+    """
+    Projeta coordenadas (lat, lon) em graus para um plano em km.
+
+    Parâmetros:
+      coords (array-like): Coordenadas (N, 2) em graus.
+      referencia (tuple): Ponto de referência da projeção equiretangular.
+      metodo (str): "equiretangular" (sem dependências) ou "utm" (requer pyproj).
+
+    Retorna:
+      np.ndarray: Coordenadas (N, 2) em km.
+    """
+    coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    if metodo == "equiretangular":
+        lat0, lon0 = np.radians(referencia)
+        x = (np.radians(coords[:, 1]) - lon0) * np.cos(lat0) * RAIO_TERRA_KM
+        y = (np.radians(coords[:, 0]) - lat0) * RAIO_TERRA_KM
+        return np.column_stack([x, y])
+    if metodo == "utm":
+        from pyproj import Transformer
+
+        lat0, lon0 = referencia
+        zona = int((lon0 + 180) // 6) + 1
+        epsg = (32600 if lat0 >= 0 else 32700) + zona
+        transformador = Transformer.from_crs("EPSG:4326", f"EPSG:{epsg}", always_xy=True)
+        x, y = transformador.transform(coords[:, 1], coords[:, 0])
+        return np.column_stack([x, y]) / 1000
+    raise ValueError(f"Projeção não suportada: {metodo}")
+
+
+def balancear_por_capacidade(pontos, centroides, demandas, capacidade, iteracoes=10):
+    """
+    Reatribui os pontos às regiões respeitando a capacidade de cada uma.
+
+    Os pontos com maior arrependimento (diferença entre a distância ao
+    segundo centróide mais próximo e ao mais próximo) escolhem primeiro;
+    cada ponto vai para o centróide mais próximo que ainda tenha capacidade.
+    Os centróides são recalculados e o processo se repete até estabilizar.
+
+    Cada ponto consulta somente os VIZINHOS_BALANCEAMENTO centróides mais
+    próximos (KD-tree); a lista completa só é calculada para os pontos que
+    não cabem em nenhum deles. A memória fica em O(N·k), e não em O(N·K).
+
+    Parâmetros:
+      pontos (np.ndarray): Coordenadas projetadas (N, 2).
+      centroides (np.ndarray): Centróides iniciais (K, 2).
+      demandas (np.ndarray): Demanda de cada ponto (ex.: peso).
+      capacidade (float): Demanda máxima por região.
+
+    Retorna:
+      tuple: (rótulos, centróides).
+    """
+    demandas = np.nan_to_num(np.asarray(demandas, dtype=np.float64))
+    n_regioes = len(centroides)
+    k = min(VIZINHOS_BALANCEAMENTO, n_regioes)
+    rotulos = np.full(len(pontos), -1, dtype=np.int64)
+    for _ in range(iteracoes):
+        distancias, preferencias = cKDTree(centroides).query(pontos, k=k)
+        distancias = distancias.reshape(len(pontos), k)
+        preferencias = preferencias.reshape(len(pontos), k)
+        if k > 1:
+            arrependimento = distancias[:, 1] - distancias[:, 0]
+        else:
+            arrependimento = np.zeros(len(pontos))
+        livre = np.full(n_regioes, float(capacidade))
+        novos = np.empty(len(pontos), dtype=np.int64)
+        for ponto in np.lexsort((-demandas, -arrependimento)):
+            candidatas = preferencias[ponto]
+            cabe = livre[candidatas] >= demandas[ponto]
+            if not cabe.any() and k < n_regioes:
+                # Nenhuma das mais próximas tem capacidade: consulta todas as regiões
+                candidatas = np.argsort(np.linalg.norm(centroides - pontos[ponto], axis=1))
+                cabe = livre[candidatas] >= demandas[ponto]
+            # Sem região com capacidade, o ponto fica na que tiver mais folga
+            regiao = int(candidatas[np.argmax(cabe)]) if cabe.any() else int(np.argmax(livre))
+            novos[ponto] = regiao
+            livre[regiao] -= demandas[ponto]
+        if np.array_equal(novos, rotulos):
+            break
+        rotulos = novos
+        contagem = np.bincount(rotulos, minlength=n_regioes)
+        somas = np.column_stack([np.bincount(rotulos, weights=pontos[:, eixo], minlength=n_regioes)
+                                 for eixo in range(pontos.shape[1])])
+        ocupadas = contagem > 0
+        centroides = centroides.copy()
+        centroides[ocupadas] = somas[ocupadas] / contagem[ocupadas, None]
+    return rotulos, centroides
+
+
+@etapa("agrupamento")
+def agrupar_coordenadas(coords, n_clusters, modo="auto", centroides_iniciais=None, demandas=None,
+                        capacidade=None, projecao="equiretangular", random_state=42, batch_size=1024,
+                        max_regioes=MAX_REGIOES):
+    """
+    Agrupa coordenadas (lat, lon) em n_clusters regiões.
+
+    Parâmetros:
+      coords (array-like): Coordenadas (N, 2) em graus.
+      modo (str): "kmeans", "minibatch" ou "auto" (minibatch acima de LIMITE_MINIBATCH pontos).
+      centroides_iniciais (array-like): Centróides (K, 2) em graus de uma execução
+        anterior; usados como ponto de partida quando K == n_clusters.
+      demandas (array-like): Demanda de cada ponto, usada com 'capacidade'.
+      capacidade (float): Se informada, equilibra as regiões para que a demanda
+        de cada uma não passe da capacidade (ex.: uma carga de caminhão). Se a
+        demanda total não couber em n_clusters regiões, mais regiões são usadas,
+        até 'max_regioes'; acima disso, ValueError.
+      projecao (str): Projeção usada antes do agrupamento (ver projetar_coordenadas).
+
+    Retorna:
+      tuple: (rótulos de cada ponto, centróides (K, 2) em graus); K pode ser
+      maior que n_clusters no agrupamento por capacidade.
+    """
+    coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    if modo == "auto":
+        modo = "minibatch" if len(coords) >= LIMITE_MINIBATCH else "kmeans"
+    if modo not in ("kmeans", "minibatch"):
+        raise ValueError(f"Modo de agrupamento não suportado: {modo}")
+
+    if capacidade is not None:
+        if demandas is None:
+            raise ValueError("Informe as demandas para o agrupamento por capacidade.")
+        # A capacidade pedida é mantida: faltando regiões, o número delas aumenta
+        total = float(np.nansum(demandas))
+        necessarias = int(np.ceil(total / capacidade)) if capacidade > 0 else n_clusters
+        if min(necessarias, len(coords)) > max(max_regioes, n_clusters):
+            raise ValueError(f"A demanda total ({total:.0f}) exige {necessarias} regiões com capacidade "
+                             f"{capacidade:.0f} cada, acima do limite de {max_regioes}. Agrupe sem limitar "
+                             "a demanda por região ou aumente a capacidade.")
+        if necessarias > n_clusters:
+            logging.warning(f"Demanda total acima da capacidade de {n_clusters} regiões; "
+                            f"usando {min(necessarias, len(coords))} regiões.")
+            n_clusters = min(necessarias, len(coords))
+
+    pontos = projetar_coordenadas(coords, metodo=projecao)
+    inicial = None
+    if centroides_iniciais is not None:
+        centroides_iniciais = np.asarray(centroides_iniciais, dtype=np.float64)
+        if centroides_iniciais.shape == (n_clusters, 2):
+            inicial = projetar_coordenadas(centroides_iniciais, metodo=projecao)
+        else:
+            logging.info("Centróides anteriores incompatíveis com o número de regiões; ignorando o warm start.")
+
+    parametros = {"n_clusters": n_clusters, "random_state": random_state}
+    if inicial is not None:
+        parametros.update(init=inicial, n_init=1)
+    if modo == "minibatch":
+        modelo = MiniBatchKMeans(batch_size=batch_size, **parametros)
+    else:
+        modelo = KMeans(**parametros)
+    rotulos = modelo.fit_predict(pontos)
+    centros = modelo.cluster_centers_
+
+    if capacidade is not None:
+        rotulos, _ = balancear_por_capacidade(pontos, centros, demandas, capacidade)
+
+    # Centróides em graus: a média das coordenadas de cada região
+    centroides = np.vstack([coords[rotulos == r].mean(axis=0) if np.any(rotulos == r)
+                            else (centroides_iniciais[r] if inicial is not None else coords.mean(axis=0))
+                            for r in range(n_clusters)])
+    return rotulos, centroides
@@ -1,7 +1,17 @@
-def agrupar_por_regiao(pedidos_df, n_clusters=3):
+from agrupamento import agrupar_coordenadas
+
+def agrupar_por_regiao(pedidos_df, n_clusters=3, modo="auto", centroides_iniciais=None, capacidade=None,
+                       coluna_demanda='Peso dos Itens'):
     """
-    Agrupa os pedidos em regiões utilizando K-Means com base em Latitude e Longitude.
-    Adiciona a coluna 'Regiao' no DataFrame.
+    Agrupa os pedidos em regiões utilizando K-Means com base em Latitude e Longitude
+    (projetadas em km). Adiciona a coluna 'Regiao' no DataFrame e guarda os
+    centróides, em graus, em pedidos_df.attrs['centroides_regioes'] para que a
+    próxima execução possa partir deles (centroides_iniciais).
+
+    Parâmetros:
+      modo (str): "kmeans", "minibatch" ou "auto".
+      capacidade (float): Se informada, a demanda de cada região (coluna_demanda)
+        fica limitada a aproximadamente uma carga de caminhão.
     """
     required_columns = ['Latitude', 'Longitude']
     
@@ -16,10 +26,14 @@ def agrupar_por_regiao(pedidos_df, n_clusters=3):
         raise ValueError("O DataFrame está vazio após remover valores nulos.")
     
     coords = pedidos_df[required_columns].values
+    demandas = pedidos_df[coluna_demanda].values if capacidade is not None else None
 
     try:
-        kmeans = KMeans(n_clusters=n_clusters, random_state=42)
-        pedidos_df['Regiao'] = kmeans.fit_predict(coords)
+        rotulos, centroides = agrupar_coordenadas(coords, n_clusters, modo=modo,
+                                                  centroides_iniciais=centroides_iniciais,
+                                                  demandas=demandas, capacidade=capacidade)
+        pedidos_df['Regiao'] = rotulos
+        pedidos_df.attrs['centroides_regioes'] = centroides
     except Exception as e:
         raise RuntimeError(f"Erro ao executar o K-Means: {e}")
     
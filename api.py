@@ -1,10 +1,12 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Response, request, jsonify, send_file
 import os
 import io
 import folium
 import pandas as pd
 import numpy as np
 import random
+import hashlib
+import json
 from datetime import datetime
 import logging
 
@@ -12,6 +14,11 @@ from geocoding import converter_enderecos
 from preprocessor import preprocessar_dados
 from optimization import run_genetic_algorithm
 from config import DATABASE_FOLDER
+from jobs import FilaJobs
+from instrumentacao import etapa, incrementar, metricas
+from ingestao import ESQUEMA_CAMINHOES, ESQUEMA_PEDIDOS, concatenar_lotes, ler_em_lotes, montar_endereco_completo
+from mapas import criar_mapa, html_mapa
+from snapshot_planilhas import carregar_snapshot, hash_arquivo, salvar_snapshot
 
 # Configuração de logging para a API
 logging.basicConfig(level=logging.INFO, filename="api.log", filemode="a",
@@ -22,40 +29,115 @@ app = Flask(__name__)
 if not os.path.exists(DATABASE_FOLDER):
     os.makedirs(DATABASE_FOLDER)
 
-def ler_planilha(nome_arquivo, colunas_obrigatorias):
+fila_jobs = FilaJobs()
+
+COLUNAS_ENDERECO = ["Endereço de Entrega", "Bairro de Entrega", "Cidade de Entrega"]
+COLUNAS_PEDIDOS = COLUNAS_ENDERECO + ["Peso dos Itens"]
+COLUNAS_CAMINHOES = ["Placa", "Capac. Kg", "Capac. Cx", "Disponível"]
+PARAMETROS_GA = {"geracoes": int, "tamanho_pop": int, "seed": int, "n_ilhas": int}
+
+# Esquema de colunas e tipos compactos de cada planilha (ver ingestao)
+ESQUEMAS = {"Pedidos.xlsx": ESQUEMA_PEDIDOS, "Caminhoes.xlsx": ESQUEMA_CAMINHOES}
+
+def ler_em_lotes_planilha(nome_arquivo, colunas_obrigatorias, conteudo=None):
     """
-    Lê um arquivo .xlsx a partir da pasta de dados e valida as colunas obrigatórias.
+    Lê um arquivo .xlsx a partir da pasta de dados (ou dos bytes em 'conteudo')
+    em lotes, validando as colunas obrigatórias.
+    """
+    origem = io.BytesIO(conteudo) if conteudo is not None else os.path.join(DATABASE_FOLDER, nome_arquivo)
+    try:
+        yield from ler_em_lotes(origem, ESQUEMAS.get(nome_arquivo), colunas_obrigatorias, formato="xlsx")
+    except ValueError as e:
+        logging.error(f"{nome_arquivo}: {e}")
+        raise
+
+def ler_planilha(nome_arquivo, colunas_obrigatorias, conteudo=None):
+    """
+    Lê um arquivo .xlsx a partir da pasta de dados (ou dos bytes em 'conteudo')
+    e valida as colunas obrigatórias.
+    """
+    return concatenar_lotes(ler_em_lotes_planilha(nome_arquivo, colunas_obrigatorias, conteudo),
+                            ESQUEMAS.get(nome_arquivo))
+
+def validar_colunas(df, nome_arquivo, colunas_obrigatorias):
+    """
+    Valida as colunas obrigatórias de um DataFrame já carregado.
     """
-    caminho = os.path.join(DATABASE_FOLDER, nome_arquivo)
-    df = pd.read_excel(caminho, engine="openpyxl")
     for coluna in colunas_obrigatorias:
         if coluna not in df.columns:
             logging.error(f"Coluna obrigatória '{coluna}' não encontrada em {nome_arquivo}.")
             raise ValueError(f"Coluna obrigatória '{coluna}' não encontrada em {nome_arquivo}.")
     return df
 
+def preparar_pedidos(pedidos_df):
+    """
+    Cria a coluna 'Endereço Completo' e geocodifica os pedidos.
+    """
+    pedidos_df["Endereço Completo"] = montar_endereco_completo(pedidos_df)
+    return converter_enderecos(pedidos_df)
+
+# Snapshot gerado para cada planilha: (nome do snapshot, colunas validadas no upload, preparação)
+SNAPSHOTS = {
+    "Pedidos.xlsx": ("pedidos", COLUNAS_ENDERECO, preparar_pedidos),
+    "Caminhoes.xlsx": ("caminhoes", COLUNAS_CAMINHOES, None),
+}
+
+@etapa("snapshot")
+def atualizar_snapshot(nome_arquivo):
+    """
+    Lê, valida e prepara a planilha uma única vez e grava o snapshot colunar.
+    A preparação (geocodificação dos pedidos) é feita lote a lote, à medida
+    que a planilha é lida.
+    """
+    nome_snapshot, colunas, preparar = SNAPSHOTS[nome_arquivo]
+    caminho = os.path.join(DATABASE_FOLDER, nome_arquivo)
+    lotes = ler_em_lotes_planilha(nome_arquivo, colunas)
+    if preparar is not None:
+        lotes = (preparar(lote) for lote in lotes)
+    df = concatenar_lotes(lotes, ESQUEMAS.get(nome_arquivo))
+    salvar_snapshot(nome_snapshot, df, hash_arquivo(caminho), caminho_origem=caminho)
+    return df
+
+def carregar_planilha(nome_arquivo, colunas_obrigatorias):
+    """
+    Retorna a planilha a partir do snapshot vigente, reconstruindo-o se não
+    existir ou se o arquivo tiver sido alterado sem passar pelo upload.
+    O DataFrame retornado é compartilhado: copie antes de alterá-lo.
+    """
+    nome_snapshot = SNAPSHOTS[nome_arquivo][0]
+    snapshot = carregar_snapshot(nome_snapshot, caminho_origem=os.path.join(DATABASE_FOLDER, nome_arquivo))
+    if snapshot is None:
+        atualizar_snapshot(nome_arquivo)
+        snapshot = carregar_snapshot(nome_snapshot)
+    return validar_colunas(snapshot[0], nome_arquivo, colunas_obrigatorias)
+
 def gerar_mapa(pedidos_df):
     """
     Gera um mapa interativo com Folium exibindo os pedidos.
     """
-    if pedidos_df.empty:
-        return folium.Map(location=[0, 0], zoom_start=2)
-    centro = [pedidos_df.iloc[0]['Latitude'], pedidos_df.iloc[0]['Longitude']]
-    mapa = folium.Map(location=centro, zoom_start=12)
-    for _, row in pedidos_df.iterrows():
-        folium.Marker(
-            location=[row['Latitude'], row['Longitude']],
-            popup=row.get("Endereço Completo", "Sem endereço"),
-            icon=folium.Icon(color="blue")
-        ).add_to(mapa)
-    return mapa
+    return criar_mapa(pedidos_df)
 
 # ---------- Endpoints da API REST ----------
 
+@app.after_request
+def contar_requisicao(resposta):
+    incrementar("requisicoes_http", endpoint=request.endpoint or "desconhecido",
+                metodo=request.method, status=resposta.status_code)
+    return resposta
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """
+    GET /metrics: Tempos por etapa e contadores do processo, no formato texto do Prometheus.
+    """
+    return Response(metricas.prometheus(), mimetype="text/plain; version=0.0.4; charset=utf-8")
+
 @app.route('/upload', methods=['POST'])
 def upload_files():
     """
     POST /upload: Recebe os arquivos Pedidos.xlsx, Caminhoes.xlsx, IA.xlsx e os salva na pasta DATABASE_FOLDER.
+    Pedidos e Caminhões são lidos, validados (e os pedidos geocodificados) uma única vez
+    aqui; os endpoints de leitura usam o snapshot gerado.
     """
     result = {}
     for nome in ["Pedidos.xlsx", "Caminhoes.xlsx", "IA.xlsx"]:
@@ -64,6 +146,12 @@ def upload_files():
             caminho = os.path.join(DATABASE_FOLDER, nome)
             file.save(caminho)
             result[nome] = "Arquivo enviado com sucesso"
+            if nome in SNAPSHOTS:
+                try:
+                    atualizar_snapshot(nome)
+                except Exception as e:
+                    logging.error(f"Erro ao processar {nome}: {e}")
+                    result[nome] = f"Arquivo enviado, mas inválido: {str(e)}"
         else:
             result[nome] = "Arquivo não enviado"
     return jsonify(result)
@@ -75,18 +163,65 @@ def get_resultado():
     Retorna a melhor solução encontrada.
     """
     try:
-        pedidos_df = ler_planilha("Pedidos.xlsx", ["Endereço de Entrega", "Bairro de Entrega", "Cidade de Entrega", "Peso dos Itens"])
-        caminhoes_df = ler_planilha("Caminhoes.xlsx", ["Placa", "Capac. Kg", "Capac. Cx", "Disponível"])
+        pedidos_df = carregar_planilha("Pedidos.xlsx", COLUNAS_PEDIDOS).copy()
+        caminhoes_df = carregar_planilha("Caminhoes.xlsx", COLUNAS_CAMINHOES).copy()
     except Exception as e:
         logging.error(f"Erro na leitura dos arquivos: {e}")
         return jsonify({"error": f"Erro na leitura dos arquivos: {str(e)}"}), 400
 
-    pedidos_df["Endereço Completo"] = pedidos_df["Endereço de Entrega"] + ", " + pedidos_df["Bairro de Entrega"] + ", " + pedidos_df["Cidade de Entrega"]
-    pedidos_df = converter_enderecos(pedidos_df)
+    solucao = calcular_resultado(pedidos_df, caminhoes_df)
+    return jsonify(solucao)
+
+def calcular_resultado(pedidos_df, caminhoes_df, progresso=None, **parametros):
+    """
+    Pré-processa os pedidos já geocodificados e executa o algoritmo genético.
+    """
     pedidos_df = preprocessar_dados(pedidos_df)
+    return run_genetic_algorithm(pedidos_df, caminhoes_df, progresso=progresso, **parametros)
 
-    solucao = run_genetic_algorithm(pedidos_df, caminhoes_df)
-    return jsonify(solucao)
+def executar_job_resultado(conteudo_pedidos, conteudo_caminhoes, progresso=None, **parametros):
+    """
+    Tarefa do job de resultado: usa os bytes das planilhas lidos no envio,
+    para que um novo upload não altere um job já enfileirado.
+    """
+    pedidos_df = preparar_pedidos(ler_planilha("Pedidos.xlsx", COLUNAS_PEDIDOS, conteudo=conteudo_pedidos))
+    caminhoes_df = ler_planilha("Caminhoes.xlsx", COLUNAS_CAMINHOES, conteudo=conteudo_caminhoes)
+    return calcular_resultado(pedidos_df, caminhoes_df, progresso=progresso, **parametros)
+
+@app.route('/jobs', methods=['POST'])
+def criar_job():
+    """
+    POST /jobs: Enfileira o cálculo do resultado para as planilhas enviadas.
+    Aceita um JSON opcional com geracoes, tamanho_pop, seed e n_ilhas.
+    Entradas idênticas reaproveitam o job existente.
+    """
+    try:
+        with open(os.path.join(DATABASE_FOLDER, "Pedidos.xlsx"), "rb") as f:
+            conteudo_pedidos = f.read()
+        with open(os.path.join(DATABASE_FOLDER, "Caminhoes.xlsx"), "rb") as f:
+            conteudo_caminhoes = f.read()
+        corpo = request.get_json(silent=True) or {}
+        parametros = {nome: tipo(corpo[nome]) for nome, tipo in PARAMETROS_GA.items() if corpo.get(nome) is not None}
+    except (OSError, TypeError, ValueError) as e:
+        logging.error(f"Erro ao criar job: {e}")
+        return jsonify({"error": f"Erro ao criar job: {str(e)}"}), 400
+
+    chave = hashlib.sha256()
+    for parte in (conteudo_pedidos, conteudo_caminhoes, json.dumps(parametros, sort_keys=True).encode("utf-8")):
+        chave.update(hashlib.sha256(parte).digest())
+    id_job, novo = fila_jobs.enviar("resultado", chave.hexdigest(), executar_job_resultado,
+                                    conteudo_pedidos, conteudo_caminhoes, **parametros)
+    return jsonify({"id": id_job, "novo": novo}), 202 if novo else 200
+
+@app.route('/jobs/<id_job>', methods=['GET'])
+def consultar_job(id_job):
+    """
+    GET /jobs/<id>: Retorna status, progresso e, quando concluído, o resultado do job.
+    """
+    job = fila_jobs.obter(id_job)
+    if job is None:
+        return jsonify({"error": "Job não encontrado"}), 404
+    return jsonify(job)
 
 @app.route('/mapa', methods=['GET'])
 def get_mapa():
@@ -94,15 +229,13 @@ def get_mapa():
     GET /mapa: Gera e retorna uma página HTML com o mapa interativo dos pedidos.
     """
     try:
-        pedidos_df = ler_planilha("Pedidos.xlsx", ["Endereço de Entrega", "Bairro de Entrega", "Cidade de Entrega"])
-        pedidos_df["Endereço Completo"] = pedidos_df["Endereço de Entrega"] + ", " + pedidos_df["Bairro de Entrega"] + ", " + pedidos_df["Cidade de Entrega"]
-        pedidos_df = converter_enderecos(pedidos_df)
+        pedidos_df = carregar_planilha("Pedidos.xlsx", COLUNAS_ENDERECO)
     except Exception as e:
         logging.error(f"Erro ao ler ou processar os pedidos: {e}")
         return jsonify({"error": f"Erro ao ler ou processar os pedidos: {str(e)}"}), 400
 
-    mapa = gerar_mapa(pedidos_df)
-    return mapa._repr_html_()
+    # O HTML fica em cache pelo hash dos dados desenhados
+    return html_mapa(pedidos_df)
 
 if __name__ == '__main__':
     app.run(host="0.0.0.0", port=5000)
\ No newline at end of file
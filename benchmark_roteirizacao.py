@@ -0,0 +1,335 @@
+"""
+Módulo de benchmark da roteirização
+
+Gera instâncias sintéticas reprodutíveis em torno do ponto de partida
+(config.endereco_partida_coords), de 100 a 50 mil pedidos e com frotas de
+tamanhos variados, executa cada solver do projeto medindo tempo e pico de
+memória e registra a distância, os veículos utilizados e os pedidos não
+atendidos. O relatório é gravado em JSON e CSV.
+
+O tempo e a memória são medidos em execuções separadas (o tracemalloc
+deixa a execução várias vezes mais lenta; processos filhos dos pools não
+entram na medida de memória). Cada execução usa um cache de distâncias
+vazio em uma pasta temporária: o cache de produção não é alterado e a
+ordem dos solvers não influencia os tempos. Os solvers de TSP resolvem a
+mesma instância, com o ponto de partida, e a distância inclui o retorno a ele.
+
+Uso:
+    python benchmark_roteirizacao.py --tamanhos 100 1000 5000 --frotas 5 20 --saida benchmark
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+import cache_distancias
+from config import METODO_DISTANCIA, endereco_partida_coords
+
+TAMANHOS = [100, 1000, 5000, 20000, 50000]
+FROTAS = [5, 20, 50]
+
+# Capacidades (kg, caixas) dos modelos de caminhão sorteados para a frota
+MODELOS_CAMINHAO = [(3000, 150), (6000, 300), (12000, 600)]
+
+KM_POR_GRAU = 111.32
+
+
+def gerar_instancia(n_pedidos, n_caminhoes, seed=0, raio_km=60, n_polos=8, deposito=endereco_partida_coords,
+                    locais_distintos=None):
+    """
+    Gera pedidos e frota sintéticos e reprodutíveis.
+
+    Os pedidos se concentram em 'n_polos' polos (cidades) espalhados em até
+    ~'raio_km' do ponto de partida; pesos seguem uma lognormal. Com
+    'locais_distintos', os pedidos se repetem nesse número de endereços
+    (na planilha real, 23.816 pedidos caem em 1.437 coordenadas).
+
+    Retorna:
+      tuple: (pedidos_df, caminhoes_df).
+    """
+    # Pedidos e frota usam sementes separadas: a mesma quantidade de pedidos
+    # gera os mesmos pedidos para qualquer tamanho de frota
+    rng = np.random.default_rng([seed, n_pedidos])
+    escala = np.array([1.0, 1.0 / np.cos(np.radians(deposito[0]))]) / KM_POR_GRAU
+    polos = np.asarray(deposito) + rng.normal(scale=raio_km / 2, size=(n_polos, 2)) * escala
+    polo = rng.integers(n_polos, size=n_pedidos)
+    coords = polos[polo] + rng.normal(scale=raio_km / 12, size=(n_pedidos, 2)) * escala
+    pesos = np.clip(rng.lognormal(mean=4.0, sigma=1.0, size=n_pedidos), 1, 2500).round(1)
+    if locais_distintos is not None and locais_distintos < n_pedidos:
+        local = rng.integers(locais_distintos, size=n_pedidos)
+        coords, polo = coords[local], polo[local]
+
+    pedidos_df = pd.DataFrame({
+        "Nº Pedido": np.arange(1, n_pedidos + 1),
+        "Endereço Completo": [f"Pedido {i}, Polo {p}" for i, p in enumerate(polo.tolist(), start=1)],
+        "Latitude": coords[:, 0],
+        "Longitude": coords[:, 1],
+        "Peso dos Itens": pesos,
+        "Qtde. dos Itens": np.ceil(pesos / 20).astype(int),
+    })
+    rng_frota = np.random.default_rng([seed, n_caminhoes, 1])
+    modelos = np.asarray(MODELOS_CAMINHAO)[rng_frota.integers(len(MODELOS_CAMINHAO), size=n_caminhoes)]
+    caminhoes_df = pd.DataFrame({
+        "Placa": [f"BEN{i:04d}" for i in range(1, n_caminhoes + 1)],
+        "Capac. Kg": modelos[:, 0].astype(float),
+        "Capac. Cx": modelos[:, 1].astype(float),
+        "Disponível": "Sim",
+    })
+    return pedidos_df, caminhoes_df
+
+
+# ---------- Adaptadores dos solvers ----------
+# Cada adaptador recebe (pedidos_df, caminhoes_df, seed) e retorna as métricas
+# {"distancia_km", "veiculos_usados", "nao_atendidos", ...}; None quando não se aplica.
+
+def _com_deposito(pedidos_df, deposito=endereco_partida_coords):
+    """
+    Pedidos precedidos de uma linha com o ponto de partida (índice 0).
+    """
+    partida = pd.DataFrame({"Latitude": [deposito[0]], "Longitude": [deposito[1]]})
+    return pd.concat([partida, pedidos_df[["Latitude", "Longitude"]]], ignore_index=True)
+
+
+def _ga_alocacao(pedidos_df, caminhoes_df, seed):
+    from optimization import run_genetic_algorithm
+
+    resultado = run_genetic_algorithm(pedidos_df, caminhoes_df, seed=seed)
+    alocacao = np.fromiter(resultado["solucao"].values(), dtype=np.int64, count=len(pedidos_df))
+    cargas = np.bincount(alocacao, weights=pedidos_df["Peso dos Itens"].to_numpy(), minlength=len(caminhoes_df))
+    excesso = np.maximum(cargas - caminhoes_df["Capac. Kg"].to_numpy(), 0).sum()
+    return {"distancia_km": None, "veiculos_usados": int(np.count_nonzero(cargas)),
+            "nao_atendidos": None, "excesso_kg": float(excesso), "fitness": resultado["fitness"]}
+
+
+def _tsp_genetico(pedidos_df, caminhoes_df, seed):
+    from main import criar_grafo_tsp, resolver_tsp_genetico
+
+    _, distancia = resolver_tsp_genetico(criar_grafo_tsp(pedidos_df), seed=seed)
+    return {"distancia_km": distancia / 1000, "veiculos_usados": 1, "nao_atendidos": 0}
+
+
+def _tsp_vizinho_2opt(pedidos_df, caminhoes_df, seed):
+    from melhorias_roterizacao import gerar_matriz_distancias, otimizacao_2opt, route_distance, tsp_nearest_neighbor
+
+    pontos_df = _com_deposito(pedidos_df)
+    matriz = gerar_matriz_distancias(pontos_df)
+    rota = otimizacao_2opt(tsp_nearest_neighbor(pontos_df), matriz, vetorizado=True)
+    # Caminho aberto a partir do depósito; a distância inclui o retorno
+    return {"distancia_km": float(route_distance(rota + rota[:1], matriz)), "veiculos_usados": 1,
+            "nao_atendidos": 0}
+
+
+def _tsp_busca_local(pedidos_df, caminhoes_df, seed):
+    from busca_local_tsp import resolver_tsp_matriz
+
+    coords = _com_deposito(pedidos_df).to_numpy(dtype=np.float64)
+    _, distancia = resolver_tsp_matriz(cache_distancias.matriz_distancias_cache(coords, metodo=METODO_DISTANCIA))
+    return {"distancia_km": float(distancia), "veiculos_usados": 1, "nao_atendidos": 0}
+
+
+def _frota_bin_packing(pedidos_df, caminhoes_df, seed):
+    from otimizar_aproveitamento_frota import otimizar_aproveitamento_frota
+
+    resultado = otimizar_aproveitamento_frota(pedidos_df.copy(), caminhoes_df, percentual_frota=100,
+                                              max_pedidos=30, n_clusters=3)
+    # Um caminhão pode fazer uma carga por região: conta as placas, não as cargas
+    placas = resultado["Placa"].fillna("").astype(str).str.strip()
+    return {"distancia_km": None, "veiculos_usados": int(placas[placas != ""].nunique()),
+            "nao_atendidos": int((resultado["Carga"] == 0).sum())}
+
+
+def _vrp_ortools(pedidos_df, caminhoes_df, seed):
+    from roteirizacao_vrp import resolver_vrp
+
+    resultado = resolver_vrp(pedidos_df, caminhoes_df, max_pedidos=30, tempo_limite=30)
+    return {"distancia_km": resultado["distancia_total"] / 1000, "veiculos_usados": len(resultado["rotas"]),
+            "nao_atendidos": len(resultado["nao_atendidos"])}
+
+
+def _decomposicao_regional(pedidos_df, caminhoes_df, seed):
+    from agrupar_por_regiao import agrupar_por_regiao
+    from decomposicao_regional import roteirizar_por_regiao
+
+    n_regioes = max(1, min(len(caminhoes_df), len(pedidos_df)))
+    _, distancias = roteirizar_por_regiao(agrupar_por_regiao(pedidos_df.copy(), n_regioes))
+    return {"distancia_km": float(sum(distancias.values())), "veiculos_usados": len(distancias),
+            "nao_atendidos": 0}
+
+
+# Solver: (adaptador, maior instância executada; None = sem limite)
+SOLVERS = {
+    "ga_alocacao": (_ga_alocacao, None),
+    "tsp_genetico": (_tsp_genetico, 300),
+    "tsp_vizinho_2opt": (_tsp_vizinho_2opt, 2000),
+    "tsp_busca_local": (_tsp_busca_local, 5000),
+    "frota_bin_packing": (_frota_bin_packing, None),
+    "vrp_ortools": (_vrp_ortools, 1000),
+    "decomposicao_regional": (_decomposicao_regional, 20000),
+}
+
+
+@contextmanager
+def cache_temporario():
+    """
+    Substitui o cache de distâncias do processo por um cache vazio em uma
+    pasta temporária, restaurando o original ao sair.
+    """
+    anterior = (cache_distancias._cache, cache_distancias._cache_pid)
+    with tempfile.TemporaryDirectory(prefix="benchmark_distancias_") as pasta:
+        cache = cache_distancias.CacheDistancias(pasta)
+        with cache_distancias._cache_lock:
+            cache_distancias._cache, cache_distancias._cache_pid = cache, os.getpid()
+        try:
+            yield cache
+        finally:
+            with cache_distancias._cache_lock:
+                cache_distancias._cache, cache_distancias._cache_pid = anterior
+            cache.fechar()
+
+
+def medir(funcao, *args, memoria=True):
+    """
+    Executa funcao(*args) medindo o tempo de parede e, em uma segunda
+    execução sob o tracemalloc, o pico de memória alocada. Cada execução
+    parte de um cache de distâncias temporário e vazio.
+
+    Retorna:
+      tuple: (retorno da função, segundos, pico em MB ou None).
+    """
+    with cache_temporario():
+        inicio = time.perf_counter()
+        retorno = funcao(*args)
+        segundos = time.perf_counter() - inicio
+    if not memoria:
+        return retorno, segundos, None
+
+    with cache_temporario():
+        tracemalloc.start()
+        try:
+            funcao(*args)
+            _, pico = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    return retorno, segundos, pico / 1e6
+
+
+def executar_benchmark(tamanhos=TAMANHOS, frotas=FROTAS, solvers=None, seed=42, memoria=True):
+    """
+    Executa cada solver em cada combinação de tamanho e frota; com
+    memoria=False, a execução sob o tracemalloc é omitida.
+
+    Retorna:
+      list: Uma linha por execução, com o status ("ok", "ignorado" ou "erro"),
+      tempo, memória e métricas da solução.
+    """
+    solvers = solvers or list(SOLVERS)
+    resultados = []
+    for n_pedidos in tamanhos:
+        for n_caminhoes in frotas:
+            pedidos_df, caminhoes_df = gerar_instancia(n_pedidos, n_caminhoes, seed=seed)
+            for nome in solvers:
+                adaptador, limite = SOLVERS[nome]
+                linha = {"solver": nome, "pedidos": n_pedidos, "caminhoes": n_caminhoes, "seed": seed,
+                         "status": "ok", "segundos": None, "memoria_mb": None,
+                         "distancia_km": None, "veiculos_usados": None, "nao_atendidos": None}
+                if limite is not None and n_pedidos > limite:
+                    linha["status"] = "ignorado"
+                    linha["erro"] = f"acima do limite de {limite} pedidos"
+                else:
+                    try:
+                        metricas, segundos, pico = medir(adaptador, pedidos_df, caminhoes_df, seed, memoria=memoria)
+                        linha.update(metricas, segundos=round(segundos, 4),
+                                     memoria_mb=None if pico is None else round(pico, 2))
+                    except Exception as e:
+                        logging.error(f"Benchmark {nome} ({n_pedidos} pedidos): {e}")
+                        linha["status"] = "erro"
+                        linha["erro"] = str(e)
+                logging.info(f"{nome}: {n_pedidos} pedidos, {n_caminhoes} caminhões -> {linha['status']} "
+                             f"({linha['segundos']} s)")
+                resultados.append(linha)
+    return resultados
+
+
+def _verificacao_tsp(pedidos_df):
+    from busca_local_tsp import resolver_tsp_matriz
+
+    with cache_temporario():
+        coords = _com_deposito(pedidos_df).to_numpy(dtype=np.float64)
+        resolver_tsp_matriz(cache_distancias.matriz_distancias_cache(coords, metodo=METODO_DISTANCIA))
+
+
+def _verificacao_regioes(pedidos_df):
+    from agrupar_por_regiao import agrupar_por_regiao
+    from decomposicao_regional import roteirizar_por_regiao
+
+    with cache_temporario():
+        roteirizar_por_regiao(agrupar_por_regiao(pedidos_df.copy(), 3), max_workers=1)
+
+
+def verificar_pontos_repetidos(n_pedidos=1000, locais_distintos=300, limite_segundos=60, seed=0):
+    """
+    Verificação de regressão: a busca local (TSP único e por região) precisa
+    terminar quando há paradas repetidas. Com as matrizes float32 do cache,
+    distâncias empatadas já fizeram o 2-opt alternar entre rotas sem parar.
+    Cada verificação roda em um processo separado, encerrado no limite.
+
+    Retorna:
+      dict: {verificação: segundos, ou None se não terminou no limite}.
+    """
+    pedidos_df, _ = gerar_instancia(n_pedidos, 1, seed=seed, locais_distintos=locais_distintos)
+    resultados = {}
+    for nome, funcao in (("tsp_busca_local", _verificacao_tsp), ("decomposicao_regional", _verificacao_regioes)):
+        processo = multiprocessing.Process(target=funcao, args=(pedidos_df,))
+        inicio = time.perf_counter()
+        processo.start()
+        processo.join(limite_segundos)
+        if processo.is_alive():
+            processo.terminate()
+            processo.join()
+            logging.error(f"Verificação {nome}: não terminou em {limite_segundos} s.")
+            resultados[nome] = None
+        elif processo.exitcode != 0:
+            raise RuntimeError(f"Verificação {nome} falhou (código {processo.exitcode}).")
+        else:
+            resultados[nome] = round(time.perf_counter() - inicio, 3)
+    return resultados
+
+
+def salvar_relatorio(resultados, prefixo="benchmark"):
+    """
+    Grava o relatório em <prefixo>.json e <prefixo>.csv.
+    """
+    with open(f"{prefixo}.json", "w", encoding="utf-8") as f:
+        json.dump(resultados, f, ensure_ascii=False, indent=2)
+    pd.DataFrame(resultados).to_csv(f"{prefixo}.csv", index=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark dos solvers de roteirização.")
+    parser.add_argument("--tamanhos", type=int, nargs="+", default=TAMANHOS)
+    parser.add_argument("--frotas", type=int, nargs="+", default=FROTAS)
+    parser.add_argument("--solvers", nargs="+", choices=list(SOLVERS), default=None)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--saida", default="benchmark")
+    parser.add_argument("--sem-memoria", action="store_true", help="Não mede o pico de memória.")
+    parser.add_argument("--verificar-repetidos", action="store_true",
+                        help="Somente verifica se a busca local termina com paradas repetidas.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    if args.verificar_repetidos:
+        verificacao = verificar_pontos_repetidos(seed=args.seed)
+        print(verificacao)
+        raise SystemExit(0 if all(v is not None for v in verificacao.values()) else 1)
+    resultados = executar_benchmark(args.tamanhos, args.frotas, args.solvers, args.seed, memoria=not args.sem_memoria)
+    salvar_relatorio(resultados, args.saida)
+    print(pd.DataFrame(resultados).to_string(index=False))
@@ -0,0 +1,378 @@
+"""
+Módulo de busca local para o TSP
+
+Resolve o TSP sobre uma matriz de distâncias em duas etapas:
+  1. construção de uma rota inicial (vizinho mais próximo ou economias de
+     Clarke-Wright restritas às listas de vizinhos);
+  2. melhoria por 2-opt e Or-opt, avaliando apenas os k vizinhos mais
+     próximos de cada nó e usando "don't-look bits" (fila de nós ativos), de
+     modo que cada passada custa aproximadamente O(n·k) avaliações.
+
+As rotas são ciclos fechados; a rota retornada começa no nó 'inicio'
+(a partida). Os movimentos invertem trechos da rota e supõem matriz
+simétrica; resolver_tsp_matriz aceita matrizes assimétricas (malha viária,
+ruas de mão única) otimizando sobre a média (M + Mᵀ) / 2 e escolhendo o
+sentido de percurso de menor custo real.
+
+A busca trabalha sempre em float64 e só aceita melhorias acima de uma
+tolerância relativa ao tamanho das arestas: com as matrizes float32 do
+cache, o arredondamento entre distâncias empatadas (paradas repetidas)
+parecia uma melhoria e o 2-opt podia alternar entre duas rotas sem parar.
+"""
+
+import time
+from collections import deque
+
+import numpy as np
+
+from instrumentacao import incrementar
+
+# Tolerância relativa à maior distância finita da matriz
+EPS = 1e-9
+
+
+def listas_vizinhos(matriz, k=10):
+    """
+    Retorna, para cada nó, os índices dos k nós mais próximos em ordem crescente
+    de distância (sem o próprio nó).
+    """
+    n = len(matriz)
+    k = max(1, min(k, n - 1))
+    distancias = np.array(matriz, dtype=np.float64, copy=True)
+    np.fill_diagonal(distancias, np.inf)
+    candidatos = np.argpartition(distancias, k - 1, axis=1)[:, :k]
+    ordem = np.take_along_axis(distancias, candidatos, axis=1).argsort(axis=1)
+    return np.take_along_axis(candidatos, ordem, axis=1)
+
+
+def vizinho_mais_proximo(matriz, inicio=0):
+    """
+    Constrói uma rota pela heurística do vizinho mais próximo.
+    """
+    n = len(matriz)
+    visitados = np.zeros(n, dtype=bool)
+    rota = np.empty(n, dtype=np.int64)
+    atual = inicio
+    for passo in range(n):
+        rota[passo] = atual
+        visitados[atual] = True
+        if passo == n - 1:
+            break
+        linha = np.where(visitados, np.inf, matriz[atual])
+        atual = int(np.argmin(linha))
+    return rota
+
+
+def economias(matriz, inicio=0, vizinhos=None, k=10):
+    """
+    Constrói uma rota pelas economias de Clarke-Wright, considerando apenas
+    os pares presentes nas listas de vizinhos. Os fragmentos que restarem são
+    unidos pelo extremo mais próximo.
+    """
+    n = len(matriz)
+    if n <= 3:
+        return np.arange(n, dtype=np.int64)
+    if vizinhos is None:
+        vizinhos = listas_vizinhos(matriz, k)
+
+    i = np.repeat(np.arange(n), vizinhos.shape[1])
+    j = vizinhos.ravel()
+    validos = (i < j) & (i != inicio) & (j != inicio)
+    i, j = i[validos], j[validos]
+    ganho = matriz[inicio, i] + matriz[inicio, j] - matriz[i, j]
+    ordem = np.argsort(-ganho, kind="stable")
+
+    grau = np.zeros(n, dtype=np.int64)
+    pai = list(range(n))
+    ligacoes = [[] for _ in range(n)]
+
+    def raiz(x):
+        while pai[x] != x:
+            pai[x] = pai[pai[x]]
+            x = pai[x]
+        return x
+
+    for a, b in zip(i[ordem].tolist(), j[ordem].tolist()):
+        if grau[a] < 2 and grau[b] < 2 and raiz(a) != raiz(b):
+            pai[raiz(a)] = raiz(b)
+            grau[a] += 1
+            grau[b] += 1
+            ligacoes[a].append(b)
+            ligacoes[b].append(a)
+
+    # Percorre cada fragmento (caminho) a partir de um extremo
+    fragmentos = []
+    vistos = np.zeros(n, dtype=bool)
+    vistos[inicio] = True
+    for no in range(n):
+        if vistos[no] or grau[no] == 2:
+            continue
+        caminho = [no]
+        vistos[no] = True
+        anterior, atual = None, no
+        while True:
+            proximos = [x for x in ligacoes[atual] if x != anterior]
+            if not proximos:
+                break
+            anterior, atual = atual, proximos[0]
+            vistos[atual] = True
+            caminho.append(atual)
+        fragmentos.append(caminho)
+
+    # Une os fragmentos partindo do início, sempre pelo extremo mais próximo
+    rota = [inicio]
+    while fragmentos:
+        ultimo = rota[-1]
+        custos = [min(matriz[ultimo, f[0]], matriz[ultimo, f[-1]]) for f in fragmentos]
+        f = fragmentos.pop(int(np.argmin(custos)))
+        rota.extend(f if matriz[ultimo, f[0]] <= matriz[ultimo, f[-1]] else f[::-1])
+    return np.asarray(rota, dtype=np.int64)
+
+
+def distancia_ciclo(rota, matriz):
+    """
+    Distância total da rota fechada.
+    """
+    rota = np.asarray(rota)
+    if len(rota) < 2:
+        return 0.0
+    return float(matriz[rota, np.roll(rota, -1)].sum(dtype=np.float64))
+
+
+class _Rota:
+    """
+    Rota circular em arrays: tour[posição] = nó e pos[nó] = posição.
+    """
+
+    def __init__(self, rota):
+        self.tour = np.asarray(rota, dtype=np.int64).copy()
+        self.n = len(self.tour)
+        self.pos = np.empty(self.n, dtype=np.int64)
+        self.pos[self.tour] = np.arange(self.n)
+
+    def suc(self, no):
+        return int(self.tour[(self.pos[no] + 1) % self.n])
+
+    def ant(self, no):
+        return int(self.tour[self.pos[no] - 1])
+
+    def inverter(self, i, j):
+        """
+        Inverte o trecho tour[i..j] (posições, i <= j).
+        """
+        trecho = self.tour[i:j + 1][::-1].copy()
+        self.tour[i:j + 1] = trecho
+        self.pos[trecho] = np.arange(i, j + 1)
+
+    def mover_trecho(self, nos, depois_de, invertido):
+        """
+        Remove os nós consecutivos 'nos' e os reinsere após 'depois_de'.
+        """
+        inicio = int(self.pos[nos[0]])
+        indices = (np.arange(inicio, inicio + len(nos))) % self.n
+        restante = np.delete(self.tour, indices)
+        alvo = int(np.flatnonzero(restante == depois_de)[0]) + 1
+        trecho = np.asarray(nos[::-1] if invertido else nos, dtype=np.int64)
+        self.tour = np.concatenate([restante[:alvo], trecho, restante[alvo:]])
+        self.pos[self.tour] = np.arange(self.n)
+
+
+def tolerancia(matriz):
+    """
+    Menor melhoria considerada pela busca local: EPS vezes a maior distância finita.
+    """
+    finitas = matriz[np.isfinite(matriz)]
+    return EPS * max(float(finitas.max()), 1.0) if finitas.size else EPS
+
+
+def _melhorar_2opt(rota, matriz, vizinhos, ativo, fila, prazo, eps=EPS):
+    """
+    Uma rodada de 2-opt sobre os nós da fila; retorna True se houve melhoria.
+    """
+    melhorou = False
+    while fila:
+        if prazo is not None and time.monotonic() > prazo:
+            return melhorou
+        a = fila.popleft()
+        ativo[a] = False
+        for direcao in (1, -1):
+            b = rota.suc(a) if direcao == 1 else rota.ant(a)
+            d_ab = matriz[a, b]
+            aplicado = False
+            for c in vizinhos[a]:
+                c = int(c)
+                d_ac = matriz[a, c]
+                if d_ac >= d_ab - eps:
+                    break
+                d = rota.suc(c) if direcao == 1 else rota.ant(c)
+                if c == b or d == a:
+                    continue
+                delta = d_ac + matriz[b, d] - d_ab - matriz[c, d]
+                if delta < -eps:
+                    if direcao == 1:
+                        # remove (a,b) e (c,d): inverte b..c ou d..a
+                        pa, pc = rota.pos[a], rota.pos[c]
+                        if pa < pc:
+                            rota.inverter(pa + 1, pc)
+                        else:
+                            rota.inverter(pc + 1, pa)
+                    else:
+                        # remove (b,a) e (d,c): inverte a..d ou c..b
+                        pa, pc = rota.pos[a], rota.pos[c]
+                        if pa < pc:
+                            rota.inverter(pa, pc - 1)
+                        else:
+                            rota.inverter(pc, pa - 1)
+                    for no in (a, b, c, d):
+                        if not ativo[no]:
+                            ativo[no] = True
+                            fila.append(no)
+                    melhorou = aplicado = True
+                    break
+            if aplicado:
+                break
+    return melhorou
+
+
+def _melhorar_or_opt(rota, matriz, vizinhos, tamanho_max=3, prazo=None, eps=EPS):
+    """
+    Uma passada de Or-opt: move trechos de 1 a 'tamanho_max' nós para perto de
+    um de seus vizinhos, na orientação direta ou invertida.
+
+    Retorna:
+      set: Nós afetados pelas movimentações (vazio se nada mudou).
+    """
+    afetados = set()
+    n = rota.n
+    if n < 5:
+        return afetados
+    for primeiro in rota.tour.tolist():
+        if prazo is not None and time.monotonic() > prazo:
+            break
+        for tamanho in range(1, min(tamanho_max, n - 3) + 1):
+            p0 = int(rota.pos[primeiro])
+            nos = [int(rota.tour[(p0 + t) % n]) for t in range(tamanho)]
+            ultimo = nos[-1]
+            anterior, seguinte = rota.ant(primeiro), rota.suc(ultimo)
+            ganho_remocao = matriz[anterior, primeiro] + matriz[ultimo, seguinte] - matriz[anterior, seguinte]
+            if ganho_remocao <= eps:
+                continue
+            no_trecho = set(nos)
+
+            melhor = None
+            melhor_delta = -eps
+            for extremo in (primeiro, ultimo):
+                for x in vizinhos[extremo]:
+                    x = int(x)
+                    if x in no_trecho:
+                        continue
+                    # x antes do trecho: x, [trecho], suc(x)
+                    y = rota.suc(x)
+                    if y not in no_trecho:
+                        if extremo == primeiro:
+                            custo = matriz[x, primeiro] + matriz[ultimo, y] - matriz[x, y]
+                            invertido = False
+                        else:
+                            custo = matriz[x, ultimo] + matriz[primeiro, y] - matriz[x, y]
+                            invertido = True
+                        delta = custo - ganho_remocao
+                        if delta < melhor_delta:
+                            melhor, melhor_delta = (x, invertido), delta
+                    # x depois do trecho: ant(x), [trecho], x
+                    w = rota.ant(x)
+                    if w not in no_trecho:
+                        if extremo == ultimo:
+                            custo = matriz[w, primeiro] + matriz[ultimo, x] - matriz[w, x]
+                            invertido = False
+                        else:
+                            custo = matriz[w, ultimo] + matriz[primeiro, x] - matriz[w, x]
+                            invertido = True
+                        delta = custo - ganho_remocao
+                        if delta < melhor_delta:
+                            melhor, melhor_delta = (w, invertido), delta
+
+            if melhor is not None:
+                depois_de, invertido = melhor
+                rota.mover_trecho(nos, depois_de, invertido)
+                afetados.update(nos)
+                afetados.update((anterior, seguinte, depois_de, rota.suc(nos[0] if invertido else ultimo)))
+                break
+    return afetados
+
+
+def melhorar_rota(rota, matriz, vizinhos=None, k=10, tempo_limite=None, usar_or_opt=True):
+    """
+    Melhora uma rota fechada com 2-opt e Or-opt até não haver mais melhorias
+    (ou até esgotar o tempo limite, em segundos).
+
+    Retorna:
+      np.ndarray: Rota melhorada.
+    """
+    matriz = np.asarray(matriz, dtype=np.float64)
+    n = len(matriz)
+    rota = _Rota(rota)
+    if n < 4:
+        return rota.tour
+    if vizinhos is None:
+        vizinhos = listas_vizinhos(matriz, k)
+    prazo = time.monotonic() + tempo_limite if tempo_limite else None
+    eps = tolerancia(matriz)
+
+    ativo = np.ones(n, dtype=bool)
+    fila = deque(range(n))
+    rodadas = 0
+    while True:
+        rodadas += 1
+        _melhorar_2opt(rota, matriz, vizinhos, ativo, fila, prazo, eps)
+        if not usar_or_opt or (prazo is not None and time.monotonic() > prazo):
+            break
+        afetados = _melhorar_or_opt(rota, matriz, vizinhos, prazo=prazo, eps=eps)
+        if not afetados:
+            break
+        for no in afetados:
+            if not ativo[no]:
+                ativo[no] = True
+                fila.append(no)
+    incrementar("iteracoes_solver", rodadas, solver="busca_local_tsp")
+    return rota.tour
+
+
+def resolver_tsp_matriz(matriz, inicio=0, construcao="vizinho", k=10, tempo_limite=None):
+    """
+    Resolve o TSP sobre a matriz de distâncias.
+
+    Parâmetros:
+      matriz (np.ndarray): Matriz de distâncias N×N; se assimétrica, a busca
+        usa a matriz simetrizada e a distância retornada é a do sentido escolhido.
+      inicio (int): Nó em que a rota começa (ex.: a partida).
+      construcao (str): "vizinho" (vizinho mais próximo) ou "economias".
+      k (int): Tamanho das listas de vizinhos candidatos.
+      tempo_limite (float): Tempo máximo da busca local, em segundos.
+
+    Retorna:
+      tuple: (rota como lista de índices começando em 'inicio', distância total).
+    """
+    original = np.asarray(matriz, dtype=np.float64)
+    n = len(original)
+    if n == 0:
+        return [], 0.0
+    # 2-opt e Or-opt invertem trechos: com matriz assimétrica, a busca usa a
+    # média dos dois sentidos, calculada em float64 (como a matriz original)
+    assimetrica = not np.allclose(original, original.T)
+    matriz = (original + original.T) / 2 if assimetrica else original
+    vizinhos = listas_vizinhos(matriz, k) if n > 1 else None
+    if construcao == "vizinho":
+        rota = vizinho_mais_proximo(matriz, inicio)
+    elif construcao == "economias":
+        rota = economias(matriz, inicio, vizinhos)
+    else:
+        raise ValueError(f"Construção não suportada: {construcao}")
+
+    if n > 1:
+        rota = melhorar_rota(rota, matriz, vizinhos, tempo_limite=tempo_limite)
+    rota = np.roll(rota, -int(np.flatnonzero(rota == inicio)[0]))
+    if assimetrica:
+        invertida = np.concatenate([rota[:1], rota[:0:-1]])
+        if distancia_ciclo(invertida, original) < distancia_ciclo(rota, original):
+            rota = invertida
+    return rota.tolist(), distancia_ciclo(rota, original)
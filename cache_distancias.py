@@ -0,0 +1,318 @@
+"""
+Módulo de cache de distâncias
+
+Guarda as distâncias entre paradas de um dia para o outro. Cada local
+(coordenada arredondada a 5 casas, ~1 m) recebe um id permanente num
+registro SQLite, e as distâncias ficam numa matriz float32 em memory-map
+(um arquivo por método de distância), indexada por esses ids. A matriz de um
+novo conjunto de pedidos é montada a partir dos pares já conhecidos, e
+somente as linhas e colunas dos locais novos são calculadas.
+
+- Valor 0 fora da diagonal significa par ainda não calculado (o arquivo
+  nasce esparso, preenchido com zeros);
+- Quando faltam ids, a matriz é realocada com o dobro da capacidade;
+- O registro tem no máximo config.MAX_LOCAIS_CACHE_DISTANCIAS locais (8192
+  por padrão, uma matriz de 256 MB por método; o arquivo ocupa 4·N² bytes).
+  Ao atingir o limite, o cache é descartado e recomeça com os locais da
+  consulta atual (nova geração: ids e arquivos novos). Uma consulta com mais
+  locais que o limite é calculada diretamente, sem passar pelo cache;
+- O método "viaria" é guardado pela assinatura da malha, para que um novo
+  extrato OSM não reaproveite distâncias antigas.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+
+import numpy as np
+
+from config import DATABASE_FOLDER, MAX_LOCAIS_CACHE_DISTANCIAS
+from distancias import _validar_coordenadas, matriz_distancias
+from instrumentacao import incrementar
+
+PASTA_CACHE_DISTANCIAS = os.path.join(DATABASE_FOLDER, "cache_distancias")
+CAPACIDADE_INICIAL = 1024
+
+# Métodos de distância simétricos: a coluna de um local novo é a sua linha
+METODOS_SIMETRICOS = ("haversine", "elipsoidal")
+
+_cache = None
+_cache_pid = None
+_cache_lock = threading.Lock()
+
+
+def _cobertura(faltando):
+    """
+    Conjunto pequeno de locais cujas linhas e colunas cobrem todos os pares
+    faltantes (cobertura de vértices gulosa): em geral, apenas os locais novos.
+    """
+    faltando = faltando | faltando.T
+    grau = faltando.sum(axis=1)
+    escolhidos = []
+    while grau.any():
+        i = int(np.argmax(grau))
+        escolhidos.append(i)
+        vizinhos = faltando[i].copy()
+        faltando[i, :] = False
+        faltando[:, i] = False
+        grau[vizinhos] -= 1
+        grau[i] = 0
+    return np.asarray(escolhidos, dtype=np.intp)
+
+
+class CacheDistancias:
+    """
+    Registro de locais (SQLite) e matrizes de distância em memory-map.
+
+    Seguro para threads; entre processos, o registro e o crescimento das
+    matrizes são serializados por transações do SQLite. Cada descarte do
+    cache inicia uma geração; um processo que ainda usa a geração anterior
+    continua consistente (ids e arquivo antigos) até a consulta seguinte.
+    """
+
+    def __init__(self, pasta=PASTA_CACHE_DISTANCIAS, capacidade_inicial=CAPACIDADE_INICIAL,
+                 max_locais=MAX_LOCAIS_CACHE_DISTANCIAS):
+        os.makedirs(pasta, exist_ok=True)
+        self.pasta = pasta
+        self.capacidade_inicial = capacidade_inicial
+        self.max_locais = max_locais
+        self._lock = threading.RLock()
+        self._ids = {}
+        self._abertas = {}
+        self._geracao = 0
+        self._conn = sqlite3.connect(os.path.join(pasta, "locais.db"), check_same_thread=False,
+                                     isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute('''
+        CREATE TABLE IF NOT EXISTS locais (
+            id INTEGER PRIMARY KEY,
+            chave TEXT UNIQUE NOT NULL,
+            latitude REAL NOT NULL,
+            longitude REAL NOT NULL
+        )
+        ''')
+        self._conn.execute("CREATE TABLE IF NOT EXISTS matrizes (metodo TEXT PRIMARY KEY, capacidade INTEGER NOT NULL)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (chave TEXT PRIMARY KEY, valor INTEGER NOT NULL)")
+        self._conn.execute("INSERT OR IGNORE INTO meta (chave, valor) VALUES ('geracao', 0)")
+
+    def _geracao_registrada(self):
+        return self._conn.execute("SELECT valor FROM meta WHERE chave = 'geracao'").fetchone()[0]
+
+    def _sincronizar_geracao(self, geracao):
+        # Outro processo (ou o limite) descartou o cache: ids e matrizes abertas não valem mais
+        if geracao != self._geracao:
+            self._geracao = geracao
+            self._ids.clear()
+            self._abertas.clear()
+
+    def _registrar(self, chaves):
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO locais (chave, latitude, longitude) VALUES (?, ?, ?)",
+            [(c, *(int(v) / 1e5 for v in c.split(","))) for c in chaves]
+        )
+
+    def _remover_geracoes_antigas(self):
+        prefixo = f"g{self._geracao}_"
+        for nome in os.listdir(self.pasta):
+            if nome.endswith(".f32") and not nome.startswith(prefixo):
+                try:
+                    os.remove(os.path.join(self.pasta, nome))
+                except OSError:
+                    pass
+
+    def ids_locais(self, coords):
+        """
+        Id (a partir de 0) de cada coordenada na geração atual; locais novos
+        são registrados. Se o registro passar de 'max_locais', o cache é
+        descartado e recomeça com os locais desta consulta.
+        """
+        inteiros = np.round(np.asarray(coords, dtype=np.float64).reshape(-1, 2) * 1e5).astype(np.int64)
+        chaves = [f"{lat},{lon}" for lat, lon in inteiros.tolist()]
+        with self._lock:
+            self._sincronizar_geracao(self._geracao_registrada())
+            faltantes = [c for c in dict.fromkeys(chaves) if c not in self._ids]
+            descartado = False
+            if faltantes:
+                self._conn.execute("BEGIN IMMEDIATE")
+                try:
+                    self._sincronizar_geracao(self._geracao_registrada())
+                    faltantes = [c for c in dict.fromkeys(chaves) if c not in self._ids]
+                    self._registrar(faltantes)
+                    total = self._conn.execute("SELECT MAX(id) FROM locais").fetchone()[0] or 0
+                    if total > self.max_locais:
+                        logging.warning(f"Cache de distâncias com mais de {self.max_locais} locais; "
+                                        f"descartando os {total - len(faltantes)} locais anteriores.")
+                        self._conn.execute("DELETE FROM locais")
+                        self._conn.execute("DELETE FROM matrizes")
+                        self._conn.execute("UPDATE meta SET valor = valor + 1 WHERE chave = 'geracao'")
+                        self._sincronizar_geracao(self._geracao_registrada())
+                        faltantes = list(dict.fromkeys(chaves))
+                        self._registrar(faltantes)
+                        descartado = True
+                    linhas = self._conn.execute(
+                        "SELECT chave, id FROM locais WHERE chave IN (SELECT value FROM json_each(?))",
+                        (json.dumps(faltantes),)
+                    ).fetchall()
+                    self._conn.execute("COMMIT")
+                except Exception:
+                    self._conn.execute("ROLLBACK")
+                    raise
+                self._ids.update((chave, id_local - 1) for chave, id_local in linhas)
+                if descartado:
+                    self._remover_geracoes_antigas()
+            return np.fromiter((self._ids[c] for c in chaves), dtype=np.int64, count=len(chaves))
+
+    def _arquivo(self, metodo, capacidade):
+        return os.path.join(self.pasta, f"{metodo}_{capacidade}.f32")
+
+    def _matriz(self, metodo, n_necessario):
+        """
+        Memory-map da matriz do método com capacidade para 'n_necessario' locais.
+        """
+        linha = self._conn.execute("SELECT capacidade FROM matrizes WHERE metodo = ?", (metodo,)).fetchone()
+        capacidade = linha[0] if linha else 0
+        if capacidade < n_necessario:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                linha = self._conn.execute("SELECT capacidade FROM matrizes WHERE metodo = ?", (metodo,)).fetchone()
+                anterior = linha[0] if linha else 0
+                capacidade = max(anterior, self.capacidade_inicial)
+                while capacidade < n_necessario:
+                    capacidade *= 2
+                if capacidade != anterior:
+                    nova = np.memmap(self._arquivo(metodo, capacidade), dtype=np.float32, mode="w+",
+                                     shape=(capacidade, capacidade))
+                    if anterior:
+                        velha = np.memmap(self._arquivo(metodo, anterior), dtype=np.float32, mode="r",
+                                          shape=(anterior, anterior))
+                        for i in range(0, anterior, 1024):
+                            fim = min(i + 1024, anterior)
+                            nova[i:fim, :anterior] = velha[i:fim]
+                        del velha
+                    nova.flush()
+                    del nova
+                    self._conn.execute("INSERT OR REPLACE INTO matrizes (metodo, capacidade) VALUES (?, ?)",
+                                       (metodo, capacidade))
+                    logging.info(f"Cache de distâncias '{metodo}' ampliado para {capacidade} locais.")
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            if anterior and anterior != capacidade:
+                try:
+                    os.remove(self._arquivo(metodo, anterior))
+                except OSError:
+                    pass
+
+        aberta = self._abertas.get(metodo)
+        if aberta is None or aberta[0] != capacidade:
+            aberta = (capacidade, np.memmap(self._arquivo(metodo, capacidade), dtype=np.float32, mode="r+",
+                                            shape=(capacidade, capacidade)))
+            self._abertas[metodo] = aberta
+        return aberta[1]
+
+    def matriz(self, coords, metodo="elipsoidal"):
+        """
+        Matriz de distâncias (km, float32) entre as coordenadas, montada a
+        partir do cache; somente os pares ainda não conhecidos são calculados.
+
+        Parâmetros:
+          coords (array-like): Coordenadas (N, 2) com latitude e longitude.
+          metodo (str): Método de distancias.matriz_distancias.
+
+        Retorna:
+          np.ndarray: Matriz N×N com diagonal zero.
+        """
+        if len(coords) == 0:
+            return np.zeros((0, 0), dtype=np.float32)
+        coords = _validar_coordenadas(coords)
+        chave_metodo, metodo = _chave_metodo(metodo)
+        n_locais = len(np.unique(np.round(coords * 1e5).astype(np.int64), axis=0))
+        if n_locais > self.max_locais:
+            logging.warning(f"{n_locais} locais excedem o limite do cache de distâncias ({self.max_locais}); "
+                            "calculando a matriz diretamente.")
+            return matriz_distancias(coords, metodo=metodo)
+        with self._lock:
+            ids = self.ids_locais(coords)
+            # Arquivos e capacidades de cada geração são separados (a geração 0 mantém os nomes antigos)
+            if self._geracao:
+                chave_metodo = f"g{self._geracao}_{chave_metodo}"
+        unicos, primeira, inversa = np.unique(ids, return_index=True, return_inverse=True)
+        pontos = coords[primeira]
+        grade = np.ix_(unicos, unicos)
+
+        with self._lock:
+            memoria = self._matriz(chave_metodo, int(unicos[-1]) + 1)
+            bloco = np.array(memoria[grade])
+        faltando = bloco == 0
+        np.fill_diagonal(faltando, False)
+
+        n_faltando = int(faltando.sum())
+        if n_faltando:
+            # Sem quase nada em cache, calcular tudo é mais barato que a cobertura
+            novos = _cobertura(faltando) if n_faltando < faltando.size // 2 else np.arange(len(unicos))
+            linhas = matriz_distancias(pontos[novos], pontos, metodo=metodo)
+            linhas[np.arange(len(novos)), novos] = 0.0
+            if metodo in METODOS_SIMETRICOS:
+                colunas = linhas.T
+            else:
+                colunas = matriz_distancias(pontos, pontos[novos], metodo=metodo)
+                colunas[novos, np.arange(len(novos))] = 0.0
+            bloco[novos, :] = linhas
+            bloco[:, novos] = colunas
+            with self._lock:
+                memoria[np.ix_(unicos[novos], unicos)] = linhas
+                memoria[np.ix_(unicos, unicos[novos])] = colunas
+                memoria.flush()
+        incrementar("cache_distancias_pares_calculados", n_faltando)
+        incrementar("cache_distancias_pares_reaproveitados", len(unicos) * (len(unicos) - 1) - n_faltando)
+
+        return bloco[np.ix_(inversa, inversa)]
+
+    def fechar(self):
+        with self._lock:
+            self._abertas.clear()
+            self._conn.close()
+
+
+def _chave_metodo(metodo):
+    """
+    (nome usado no cache, método efetivo de cálculo). Sem malha viária
+    disponível, "viaria" é calculado (e guardado) como elipsoidal.
+    """
+    if metodo != "viaria":
+        return metodo, metodo
+    from malha_viaria import obter_malha
+
+    malha = obter_malha()
+    if malha is None:
+        return "elipsoidal", "elipsoidal"
+    return f"viaria_{malha.assinatura[:16]}", "viaria"
+
+
+def obter_cache_distancias():
+    """
+    Retorna o cache de distâncias compartilhado do processo.
+    """
+    global _cache, _cache_pid
+    with _cache_lock:
+        # Processos filhos (pools) abrem a própria conexão, na mesma pasta, em vez de herdar a do pai
+        if _cache is None or _cache_pid != os.getpid():
+            _cache = CacheDistancias(_cache.pasta if _cache is not None else PASTA_CACHE_DISTANCIAS)
+            _cache_pid = os.getpid()
+        return _cache
+
+
+def matriz_distancias_cache(coords, metodo="elipsoidal"):
+    """
+    Matriz N×N (km) pelo cache compartilhado; se o cache estiver indisponível
+    (disco, banco), calcula a matriz diretamente.
+    """
+    try:
+        return obter_cache_distancias().matriz(coords, metodo)
+    except (OSError, sqlite3.Error) as e:
+        logging.warning(f"Cache de distâncias indisponível ({e}); calculando a matriz completa.")
+        return matriz_distancias(coords, metodo=metodo)
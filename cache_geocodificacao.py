@@ -0,0 +1,268 @@
+"""
+Módulo de cache de geocodificação
+
+Armazena as coordenadas já geocodificadas em um banco SQLite (modo WAL),
+indexado pela chave canônica do endereço (normalizacao_enderecos). Substitui
+as planilhas coordenadas_cache.xlsx e coordenadas_salvas.xlsx, que eram
+relidas e regravadas por completo a cada chamada.
+
+- buscar_lote: consulta uma coluna inteira de endereços em uma única query;
+  os endereços não encontrados pela chave canônica são procurados pelo índice
+  secundário (chave aproximada) e, por fim, por similaridade entre endereços
+  com o mesmo CEP e os mesmos números.
+- salvar_lote: grava somente as entradas novas ou alteradas.
+"""
+
+import os
+import json
+import sqlite3
+import logging
+import threading
+from datetime import datetime
+
+import pandas as pd
+
+from config import DATABASE_FOLDER
+from instrumentacao import incrementar
+from normalizacao_enderecos import normalizar_endereco, chave_aproximada, extrair_cep, numeros, similaridade
+
+CACHE_DB = os.path.join(DATABASE_FOLDER, "geocodificacao.db")
+
+# Planilhas utilizadas como cache antes do SQLite; importadas uma única vez
+PLANILHAS_LEGADAS = [
+    os.path.join(DATABASE_FOLDER, "coordenadas_cache.xlsx"),
+    os.path.join(DATABASE_FOLDER, "coordenadas_salvas.xlsx"),
+]
+
+# Versão do esquema, gravada em PRAGMA user_version
+VERSAO_ESQUEMA = 1
+
+# Similaridade mínima para aceitar um endereço com o mesmo CEP (e os mesmos números)
+SIMILARIDADE_MINIMA = 0.9
+
+
+class CacheGeocodificacao:
+    """
+    Cache persistente de coordenadas em SQLite.
+
+    A conexão é compartilhada entre threads (Streamlit e Flask atendem
+    requisições em threads distintas) e protegida por um lock.
+    """
+
+    def __init__(self, caminho=CACHE_DB):
+        self.caminho = caminho
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(caminho, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._criar_tabelas()
+
+    def _criar_tabelas(self):
+        with self._lock, self._conn:
+            self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS geocodificacao (
+                chave TEXT PRIMARY KEY,
+                endereco TEXT NOT NULL,
+                latitude REAL NOT NULL,
+                longitude REAL NOT NULL,
+                atualizado_em TEXT NOT NULL
+            )
+            ''')
+            versao = self._conn.execute("PRAGMA user_version").fetchone()[0]
+            colunas = {linha[1] for linha in self._conn.execute("PRAGMA table_info(geocodificacao)")}
+            for coluna in ("chave_aproximada", "cep"):
+                if coluna not in colunas:
+                    self._conn.execute(f"ALTER TABLE geocodificacao ADD COLUMN {coluna} TEXT")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_geocodificacao_aproximada "
+                               "ON geocodificacao (chave_aproximada)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_geocodificacao_cep ON geocodificacao (cep)")
+            if versao < VERSAO_ESQUEMA:
+                self._recalcular_chaves()
+                self._conn.execute(f"PRAGMA user_version = {VERSAO_ESQUEMA}")
+
+    def _recalcular_chaves(self):
+        """
+        Regrava as chaves de todas as entradas com a normalização atual.
+        Chamado dentro da transação de _criar_tabelas.
+        """
+        linhas = self._conn.execute(
+            "SELECT endereco, latitude, longitude, atualizado_em FROM geocodificacao"
+        ).fetchall()
+        self._conn.execute("DELETE FROM geocodificacao")
+        self._conn.executemany('''
+        INSERT OR REPLACE INTO geocodificacao
+            (chave, endereco, latitude, longitude, atualizado_em, chave_aproximada, cep)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', [
+            (normalizar_endereco(e), e, lat, lon, data, chave_aproximada(e), extrair_cep(e))
+            for e, lat, lon, data in linhas
+        ])
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM geocodificacao").fetchone()[0]
+
+    def buscar_lote(self, enderecos, aproximada=True):
+        """
+        Busca as coordenadas de vários endereços em uma única consulta.
+
+        Parâmetros:
+          enderecos (iterable): Endereços originais (não normalizados).
+          aproximada (bool): Se True, procura os não encontrados pela chave
+            aproximada e por similaridade entre endereços do mesmo CEP
+            e com os mesmos números.
+
+        Retorna:
+          dict: {endereço original: (latitude, longitude)} somente para os encontrados.
+        """
+        por_chave = {}
+        for endereco in enderecos:
+            if pd.isnull(endereco):
+                continue
+            por_chave.setdefault(normalizar_endereco(endereco), []).append(endereco)
+        por_chave.pop("", None)
+        if not por_chave:
+            return {}
+
+        with self._lock:
+            linhas = self._conn.execute(
+                "SELECT chave, latitude, longitude FROM geocodificacao "
+                "WHERE chave IN (SELECT value FROM json_each(?))",
+                (json.dumps(list(por_chave)),)
+            ).fetchall()
+
+        resultado = {}
+        encontradas = set()
+        for chave, lat, lon in linhas:
+            encontradas.add(chave)
+            for endereco in por_chave[chave]:
+                resultado[endereco] = (lat, lon)
+
+        faltantes = {chave: grupo for chave, grupo in por_chave.items() if chave not in encontradas}
+        if aproximada and faltantes:
+            aproximadas = self._buscar_aproximadas(faltantes)
+            for chave, coordenadas in aproximadas.items():
+                for endereco in faltantes[chave]:
+                    resultado[endereco] = coordenadas
+            encontradas.update(aproximadas)
+        incrementar("geocodificacao_cache_acertos", len(encontradas))
+        incrementar("geocodificacao_cache_falhas", len(por_chave) - len(encontradas))
+        return resultado
+
+    def _buscar_aproximadas(self, faltantes):
+        """
+        Resolve chaves canônicas ausentes pelo índice secundário.
+
+        Retorna:
+          dict: {chave canônica: (latitude, longitude)}.
+        """
+        por_aproximada = {}
+        por_cep = {}
+        for chave, grupo in faltantes.items():
+            por_aproximada.setdefault(chave_aproximada(grupo[0]), []).append(chave)
+            cep = extrair_cep(grupo[0])
+            if cep:
+                por_cep.setdefault(cep, []).append(chave)
+
+        with self._lock:
+            linhas = self._conn.execute(
+                "SELECT chave_aproximada, latitude, longitude FROM geocodificacao "
+                "WHERE chave_aproximada IN (SELECT value FROM json_each(?))",
+                (json.dumps(list(por_aproximada)),)
+            ).fetchall()
+            candidatos_cep = self._conn.execute(
+                "SELECT cep, chave, latitude, longitude FROM geocodificacao "
+                "WHERE cep IN (SELECT value FROM json_each(?))",
+                (json.dumps(list(por_cep)),)
+            ).fetchall() if por_cep else []
+
+        resultado = {}
+        for aproximada, lat, lon in linhas:
+            for chave in por_aproximada[aproximada]:
+                resultado[chave] = (lat, lon)
+
+        melhores = {}
+        for cep, chave_candidata, lat, lon in candidatos_cep:
+            for chave in por_cep[cep]:
+                # Números diferentes são outro imóvel, por mais parecido que seja o texto
+                if chave in resultado or numeros(chave) != numeros(chave_candidata):
+                    continue
+                razao = similaridade(chave, chave_candidata)
+                if razao >= SIMILARIDADE_MINIMA and razao > melhores.get(chave, (0, None))[0]:
+                    melhores[chave] = (razao, (lat, lon))
+        resultado.update({chave: coordenadas for chave, (_, coordenadas) in melhores.items()})
+        return resultado
+
+    def salvar_lote(self, coordenadas):
+        """
+        Grava as coordenadas informadas, inserindo apenas entradas novas e
+        atualizando somente as que mudaram.
+
+        Parâmetros:
+          coordenadas (dict): {endereço: (latitude, longitude)}.
+
+        Retorna:
+          int: Número de linhas inseridas ou alteradas.
+        """
+        agora = datetime.now().isoformat(timespec="seconds")
+        registros = [
+            (normalizar_endereco(endereco), str(endereco), float(lat), float(lon), agora,
+             chave_aproximada(endereco), extrair_cep(endereco))
+            for endereco, (lat, lon) in coordenadas.items()
+            if not pd.isnull(endereco) and not pd.isnull(lat) and not pd.isnull(lon)
+            and normalizar_endereco(endereco)
+        ]
+        if not registros:
+            return 0
+
+        with self._lock, self._conn:
+            antes = self._conn.total_changes
+            self._conn.executemany('''
+            INSERT INTO geocodificacao
+                (chave, endereco, latitude, longitude, atualizado_em, chave_aproximada, cep)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(chave) DO UPDATE SET
+                latitude = excluded.latitude,
+                longitude = excluded.longitude,
+                atualizado_em = excluded.atualizado_em
+            WHERE latitude <> excluded.latitude OR longitude <> excluded.longitude
+            ''', registros)
+            alteradas = self._conn.total_changes - antes
+        logging.info(f"Cache de geocodificação: {alteradas} entradas gravadas.")
+        return alteradas
+
+    def importar_planilha(self, caminho):
+        """
+        Importa uma planilha com as colunas 'Endereço', 'Latitude' e 'Longitude'.
+        """
+        planilha = pd.read_excel(caminho, engine="openpyxl")
+        coordenadas = dict(zip(planilha['Endereço'], zip(planilha['Latitude'], planilha['Longitude'])))
+        return self.salvar_lote(coordenadas)
+
+    def fechar(self):
+        with self._lock:
+            self._conn.close()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def obter_cache():
+    """
+    Retorna a instância compartilhada do cache, criando-a na primeira chamada.
+
+    Se o banco estiver vazio, importa as planilhas de cache antigas que existirem.
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = CacheGeocodificacao()
+            if len(_cache) == 0:
+                for planilha in PLANILHAS_LEGADAS:
+                    if os.path.exists(planilha):
+                        try:
+                            _cache.importar_planilha(planilha)
+                        except Exception as e:
+                            logging.error(f"Erro ao importar o cache legado '{planilha}': {e}")
+        return _cache
@@ -0,0 +1,84 @@
+"""
+Módulo de cache por sessão
+
+Cada interação com um widget do Streamlit reexecuta o script inteiro. As
+etapas caras do carregamento (leitura da planilha enviada, geocodificação,
+leitura da frota) são guardadas em st.session_state junto com uma chave
+calculada a partir do conteúdo de entrada (hash dos bytes enviados, data de
+modificação do arquivo da frota, parâmetros). A etapa só é recalculada
+quando a chave muda, e cada etapa guarda apenas o último resultado.
+"""
+
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+PREFIXO_ETAPA = "_etapa_"
+
+
+def hash_conteudo(*partes):
+    """
+    Calcula um hash SHA-256 estável para bytes, textos, arrays, Series,
+    DataFrames, números e tuplas/listas desses tipos.
+    """
+    h = hashlib.sha256()
+    for parte in partes:
+        if isinstance(parte, (bytes, bytearray, memoryview)):
+            h.update(bytes(parte))
+        elif isinstance(parte, str):
+            h.update(parte.encode("utf-8"))
+        elif isinstance(parte, (pd.DataFrame, pd.Series)):
+            if isinstance(parte, pd.DataFrame):
+                h.update(repr(list(parte.columns)).encode("utf-8"))
+            h.update(pd.util.hash_pandas_object(parte, index=True).to_numpy().tobytes())
+        elif isinstance(parte, np.ndarray):
+            h.update(str(parte.dtype).encode("utf-8") + str(parte.shape).encode("utf-8"))
+            h.update(np.ascontiguousarray(parte).tobytes())
+        elif isinstance(parte, (list, tuple)):
+            h.update(hash_conteudo(*parte).encode("utf-8"))
+        else:
+            h.update(repr(parte).encode("utf-8"))
+        h.update(b"\x00")
+    return h.hexdigest()
+
+
+def chave_arquivo(caminho):
+    """
+    Chave de um arquivo em disco a partir do caminho, tamanho e data de
+    modificação. Levanta FileNotFoundError se o arquivo não existir.
+    """
+    info = os.stat(caminho)
+    return hash_conteudo(os.path.abspath(caminho), info.st_size, info.st_mtime_ns)
+
+
+def obter_etapa(nome, chave, padrao=None):
+    """
+    Retorna o resultado guardado da etapa se ele foi calculado para a mesma chave.
+    """
+    guardado = st.session_state.get(PREFIXO_ETAPA + nome)
+    if guardado is not None and guardado[0] == chave:
+        return guardado[1]
+    return padrao
+
+
+def guardar_etapa(nome, chave, valor):
+    """
+    Guarda o resultado da etapa, substituindo o anterior.
+    """
+    st.session_state[PREFIXO_ETAPA + nome] = (chave, valor)
+    return valor
+
+
+def etapa_em_cache(nome, chave, calcular):
+    """
+    Retorna o resultado da etapa para a chave, calculando-o com calcular()
+    apenas se ainda não estiver na sessão. Exceções não são guardadas.
+    """
+    guardado = st.session_state.get(PREFIXO_ETAPA + nome)
+    if guardado is not None and guardado[0] == chave:
+        return guardado[1]
+    return guardar_etapa(nome, chave, calcular())
+
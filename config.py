@@ -18,4 +18,21 @@ OPENCAGE_API_KEY = os.environ.get("OPENCAGE_API_KEY", "6f522c67add14152926990afb
 
 # Parâmetros de rota de partida
 endereco_partida = "Avenida Antonio Ortega, 3604 - Pinhal, Cabreúva - SP, São Paulo, Brasil"
-endereco_partida_coords = (-23.0838, -47.1336)
\ No newline at end of file
+endereco_partida_coords = (-23.0838, -47.1336)
+
+# Distâncias entre paradas: "haversine", "elipsoidal" (linha reta) ou "viaria"
+# (malha viária do extrato OSM, ver malha_viaria)
+METODO_DISTANCIA = os.environ.get("METODO_DISTANCIA", "elipsoidal")
+MALHA_VIARIA_OSM = os.environ.get("MALHA_VIARIA_OSM", os.path.join(DATABASE_FOLDER, "malha_viaria.osm"))
+
+# Jornada dos caminhões para a roteirização com janelas de tempo ("HH:MM"),
+# velocidade média (km/h) para estimar durações sem a malha viária e tempo
+# de descarga (minutos) dos pedidos sem a coluna 'Tempo de Descarga'
+HORARIO_SAIDA = os.environ.get("HORARIO_SAIDA", "07:00")
+HORARIO_RETORNO = os.environ.get("HORARIO_RETORNO", "19:00")
+VELOCIDADE_MEDIA_KMH = float(os.environ.get("VELOCIDADE_MEDIA_KMH", "40"))
+TEMPO_DESCARGA_PADRAO = float(os.environ.get("TEMPO_DESCARGA_PADRAO", "0"))
+
+# Máximo de locais no cache de distâncias (cache_distancias); a matriz de
+# cada método ocupa 4·N² bytes em disco (8192 locais: 256 MB)
+MAX_LOCAIS_CACHE_DISTANCIAS = int(os.environ.get("MAX_LOCAIS_CACHE_DISTANCIAS", "8192"))
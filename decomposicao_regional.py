@@ -0,0 +1,202 @@
+"""
+Módulo de decomposição regional (cluster-first, route-second)
+
+Roteiriza cada região (coluna 'Regiao', criada por agrupar_por_regiao) de
+forma independente, em um pool de processos, cada uma com a sua própria
+submatriz de distâncias que inclui o ponto de partida. Os resultados são
+reunidos no DataFrame e, opcionalmente, uma passada de reparo move pedidos
+de fronteira para a rota de outra região quando isso reduz a distância total.
+As distâncias seguem config.METODO_DISTANCIA e as submatrizes vêm do cache
+de distâncias (cache_distancias).
+
+Como cada região tem tamanho limitado, o tempo total cresce de forma
+aproximadamente linear com o número de pedidos.
+"""
+
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from cache_distancias import matriz_distancias_cache
+from config import METODO_DISTANCIA, endereco_partida_coords
+from distancias import matriz_distancias
+from busca_local_tsp import resolver_tsp_matriz, distancia_ciclo
+from instrumentacao import etapa
+
+
+def _roteirizar_regiao(coords, deposito, k, tempo_limite):
+    """
+    Resolve o TSP de uma região; o depósito ocupa o índice 0 da submatriz.
+
+    Retorna:
+      tuple: (ordem das paradas como posições em 'coords', distância em km).
+    """
+    pontos = np.vstack([np.asarray(deposito, dtype=np.float64).reshape(1, 2), coords])
+    matriz = matriz_distancias_cache(pontos, metodo=METODO_DISTANCIA)
+    rota, distancia = resolver_tsp_matriz(matriz, inicio=0, k=k, tempo_limite=tempo_limite)
+    return [no - 1 for no in rota[1:]], distancia
+
+
+def _custo_insercao(rota_coords, ponto):
+    """
+    Menor custo de inserir 'ponto' na rota fechada (km) e a posição da inserção.
+    """
+    proximos = np.roll(rota_coords, -1, axis=0)
+    ponto = ponto.reshape(1, 2)
+    d_ap = matriz_distancias(rota_coords, ponto, metodo=METODO_DISTANCIA)[:, 0].astype(np.float64)
+    d_pb = np.roll(matriz_distancias(ponto, rota_coords, metodo=METODO_DISTANCIA)[0].astype(np.float64), -1)
+    d_ab = np.diagonal(matriz_distancias(rota_coords, proximos, metodo=METODO_DISTANCIA)).astype(np.float64)
+    custos = d_ap + d_pb - d_ab
+    posicao = int(np.argmin(custos))
+    return float(custos[posicao]), posicao + 1
+
+
+def reparar_fronteiras(rotas, coords, deposito, regioes, limiar=1.1, max_movimentos=None,
+                       caminhoes=None, pesos=None, capacidade=None):
+    """
+    Move pedidos de fronteira entre rotas de regiões vizinhas.
+
+    Um pedido é de fronteira quando a distância ao centróide de outra região é
+    no máximo 'limiar' vezes a distância ao centróide da sua. O pedido é movido
+    se o custo de inserção na outra rota for menor que a economia ao removê-lo.
+
+    Com a frota já alocada ('caminhoes'), o pedido só vai para uma região em
+    que o seu caminhão também atende: a carga, as caixas e o número de
+    pedidos de cada caminhão não mudam.
+
+    Parâmetros:
+      rotas (dict): {região: lista de posições em 'coords', na ordem de visita}.
+      coords (np.ndarray): Coordenadas (N, 2) de todos os pedidos.
+      deposito (tuple): Coordenadas do ponto de partida.
+      regioes (np.ndarray): Região de cada pedido.
+      caminhoes (np.ndarray): Placa (ou carga) de cada pedido; nulos não são movidos.
+      pesos (np.ndarray): Peso de cada pedido, usado com 'capacidade'.
+      capacidade (float): Peso máximo de cada região (ver agrupar_por_regiao).
+
+    Retorna:
+      tuple: (rotas atualizadas, número de pedidos movidos).
+    """
+    deposito = np.asarray(deposito, dtype=np.float64)
+    ids = sorted(rotas)
+    if len(ids) < 2:
+        return rotas, 0
+    centroides = np.vstack([coords[rotas[r]].mean(axis=0) if rotas[r] else deposito for r in ids])
+    # Filtro de fronteira em linha reta: os centróides não são paradas
+    d_centroides = matriz_distancias(coords, centroides, metodo="elipsoidal")
+    coluna = {r: i for i, r in enumerate(ids)}
+    propria = d_centroides[np.arange(len(coords)), [coluna[r] for r in regioes]]
+
+    regiao_atual = np.asarray(regioes).copy()
+    if caminhoes is not None:
+        caminhoes = np.asarray(caminhoes, dtype=object)
+        validos = ~pd.isna(caminhoes) & (np.asarray([str(c).strip() for c in caminhoes]) != "")
+        atendidas = {}
+        for pedido in np.flatnonzero(validos).tolist():
+            atendidas.setdefault(caminhoes[pedido], set()).add(regiao_atual[pedido])
+    if capacidade is not None:
+        pesos = np.nan_to_num(np.asarray(pesos, dtype=np.float64))
+        cargas = {r: float(pesos[rotas[r]].sum()) for r in ids}
+    movidos = 0
+    for pedido in np.argsort(propria)[::-1].tolist():
+        if max_movimentos is not None and movidos >= max_movimentos:
+            break
+        origem = regiao_atual[pedido]
+        candidatas = [r for r in ids
+                      if r != origem and d_centroides[pedido, coluna[r]] <= limiar * propria[pedido]]
+        if caminhoes is not None:
+            regioes_caminhao = atendidas.get(caminhoes[pedido], set()) if validos[pedido] else set()
+            candidatas = [r for r in candidatas if r in regioes_caminhao]
+        if capacidade is not None:
+            candidatas = [r for r in candidatas if cargas[r] + pesos[pedido] <= capacidade]
+        if not candidatas or len(rotas[origem]) <= 1:
+            continue
+
+        # Economia ao retirar o pedido da rota de origem (vizinhos incluem o depósito)
+        rota_origem = rotas[origem]
+        posicao = rota_origem.index(pedido)
+        anterior = coords[rota_origem[posicao - 1]] if posicao > 0 else deposito
+        seguinte = coords[rota_origem[posicao + 1]] if posicao + 1 < len(rota_origem) else deposito
+        d = matriz_distancias(np.vstack([anterior, coords[pedido], seguinte]), metodo=METODO_DISTANCIA)
+        economia = float(d[0, 1] + d[1, 2] - d[0, 2])
+
+        melhor = None
+        for destino in candidatas:
+            rota_coords = np.vstack([deposito] + [coords[p] for p in rotas[destino]])
+            custo, insercao = _custo_insercao(rota_coords, coords[pedido])
+            if custo < economia and (melhor is None or custo < melhor[0]):
+                melhor = (custo, destino, insercao)
+        if melhor is not None:
+            _, destino, insercao = melhor
+            rota_origem.pop(posicao)
+            rotas[destino].insert(insercao - 1, pedido)
+            regiao_atual[pedido] = destino
+            if capacidade is not None:
+                cargas[origem] -= pesos[pedido]
+                cargas[destino] += pesos[pedido]
+            movidos += 1
+    return rotas, movidos
+
+
+@etapa("tsp_regioes")
+def roteirizar_por_regiao(pedidos_df, deposito=endereco_partida_coords, max_workers=None,
+                          reparo=False, k=10, tempo_limite=None, capacidade=None):
+    """
+    Roteiriza todas as regiões em paralelo e reúne os resultados.
+
+    Parâmetros:
+      pedidos_df (DataFrame): Pedidos com 'Latitude', 'Longitude' e 'Regiao'.
+      deposito (tuple): Coordenadas do ponto de partida.
+      max_workers (int): Processos do pool (1 executa sem pool).
+      reparo (bool): Executa a passada de reparo dos pedidos de fronteira. Se a
+        frota já foi alocada (coluna 'Placa'), os pedidos só mudam para
+        regiões atendidas pelo mesmo caminhão.
+      k (int): Tamanho das listas de vizinhos da busca local.
+      tempo_limite (float): Tempo máximo da busca local de cada região (s).
+      capacidade (float): Peso máximo de cada região no reparo.
+
+    Retorna:
+      tuple: (DataFrame com 'Regiao' e 'Ordem na Regiao', {região: distância em km}).
+    """
+    if 'Regiao' not in pedidos_df.columns:
+        raise ValueError("A coluna 'Regiao' não foi encontrada; agrupe os pedidos por região antes.")
+    pedidos_df = pedidos_df.copy()
+    if pedidos_df.empty:
+        pedidos_df['Ordem na Regiao'] = []
+        return pedidos_df, {}
+
+    coords = pedidos_df[['Latitude', 'Longitude']].to_numpy(dtype=np.float64)
+    regioes = pedidos_df['Regiao'].to_numpy()
+    ids = sorted(set(regioes.tolist()))
+    posicoes = {r: np.flatnonzero(regioes == r) for r in ids}
+    argumentos = [(coords[posicoes[r]], deposito, k, tempo_limite) for r in ids]
+
+    if max_workers == 1 or len(ids) == 1:
+        resultados = [_roteirizar_regiao(*args) for args in argumentos]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            resultados = list(executor.map(_roteirizar_regiao, *zip(*argumentos)))
+
+    rotas = {r: posicoes[r][ordem].tolist() for r, (ordem, _) in zip(ids, resultados)}
+    if reparo:
+        caminhoes = pedidos_df['Placa'].to_numpy(dtype=object) if 'Placa' in pedidos_df.columns else None
+        pesos = pedidos_df['Peso dos Itens'].to_numpy(dtype=np.float64) \
+            if capacidade is not None and 'Peso dos Itens' in pedidos_df.columns else None
+        rotas, movidos = reparar_fronteiras(rotas, coords, deposito, regioes, caminhoes=caminhoes,
+                                            pesos=pesos, capacidade=capacidade if pesos is not None else None)
+        logging.info(f"Reparo entre regiões: {movidos} pedidos movidos.")
+
+    distancias = {}
+    regiao_final = regioes.copy()
+    ordem_final = np.zeros(len(pedidos_df), dtype=np.int64)
+    for r, rota in rotas.items():
+        regiao_final[rota] = r
+        ordem_final[rota] = np.arange(1, len(rota) + 1)
+        pontos = np.vstack([np.asarray(deposito, dtype=np.float64).reshape(1, 2), coords[rota]])
+        distancias[r] = distancia_ciclo(np.arange(len(pontos)), matriz_distancias_cache(pontos, metodo=METODO_DISTANCIA))
+
+    pedidos_df['Regiao'] = regiao_final
+    pedidos_df['Ordem na Regiao'] = ordem_final
+    return pedidos_df, distancias
+
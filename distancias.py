@@ -0,0 +1,161 @@
+"""
+Módulo de distâncias
+
+Contém funções que calculam matrizes de distância entre coordenadas
+(latitude, longitude) de forma vetorizada com NumPy, evitando chamadas
+par-a-par ao geodesic().
+
+- metodo="haversine": esfera de raio médio, mais rápido.
+- metodo="elipsoidal": fórmula de Lambert sobre o elipsoide WGS-84,
+  com erro de poucos metros em distâncias urbanas e regionais.
+
+- metodo="viaria": distância pela malha viária do extrato OSM (malha_viaria);
+  sem extrato disponível, usa a fórmula elipsoidal.
+
+Todas as matrizes são retornadas em float32 e em quilômetros.
+"""
+
+import logging
+
+import numpy as np
+
+RAIO_TERRA_KM = 6371.0088
+
+# Elipsoide WGS-84
+WGS84_A_KM = 6378.137
+WGS84_F = 1 / 298.257223563
+
+
+def _validar_coordenadas(coords):
+    """
+    Converte as coordenadas para um array (N, 2) em float64 e valida os limites.
+    """
+    coords = np.asarray(coords, dtype=np.float64)
+    if coords.ndim == 1:
+        coords = coords.reshape(-1, 2)
+    if coords.ndim != 2 or coords.shape[1] != 2:
+        raise ValueError("As coordenadas devem ter o formato (N, 2) com latitude e longitude.")
+    if np.isnan(coords).any():
+        raise ValueError("Existem coordenadas nulas (NaN).")
+    lat, lon = coords[:, 0], coords[:, 1]
+    if ((lat < -90) | (lat > 90) | (lon < -180) | (lon > 180)).any():
+        raise ValueError("Existem coordenadas fora dos limites de latitude/longitude.")
+    return coords
+
+
+def _haversine(lat1, lon1, lat2, lon2):
+    """
+    Distância haversine em km; os argumentos já estão em radianos e são
+    combinados por broadcasting.
+    """
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    return 2 * RAIO_TERRA_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def _lambert(lat1, lon1, lat2, lon2):
+    """
+    Distância elipsoidal (fórmula de Lambert, WGS-84) em km; os argumentos
+    estão em radianos e são combinados por broadcasting.
+    """
+    # Latitudes reduzidas
+    beta1 = np.arctan((1 - WGS84_F) * np.tan(lat1))
+    beta2 = np.arctan((1 - WGS84_F) * np.tan(lat2))
+
+    # Ângulo central sobre a esfera auxiliar (haversine com latitudes reduzidas)
+    dbeta = beta2 - beta1
+    dlon = lon2 - lon1
+    a = np.sin(dbeta / 2) ** 2 + np.cos(beta1) * np.cos(beta2) * np.sin(dlon / 2) ** 2
+    sigma = 2 * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+    p = (beta1 + beta2) / 2
+    q = (beta2 - beta1) / 2
+    sin_sigma = np.sin(sigma)
+    cos_meio = np.cos(sigma / 2) ** 2
+    sin_meio = np.sin(sigma / 2) ** 2
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x = (sigma - sin_sigma) * (np.sin(p) ** 2 * np.cos(q) ** 2) / cos_meio
+        y = (sigma + sin_sigma) * (np.cos(p) ** 2 * np.sin(q) ** 2) / sin_meio
+    # Pontos coincidentes (sigma = 0) ou antipodais geram 0/0
+    x = np.nan_to_num(x, nan=0.0, posinf=0.0, neginf=0.0)
+    y = np.nan_to_num(y, nan=0.0, posinf=0.0, neginf=0.0)
+
+    return WGS84_A_KM * (sigma - WGS84_F / 2 * (x + y))
+
+
+METODOS = {
+    "haversine": _haversine,
+    "elipsoidal": _lambert,
+}
+
+
+def matriz_distancias(origens, destinos=None, metodo="haversine"):
+    """
+    Calcula a matriz de distâncias (em km) entre origens e destinos.
+
+    Parâmetros:
+      origens (array-like): Coordenadas (N, 2) com latitude e longitude.
+      destinos (array-like): Coordenadas (M, 2). Se None, usa as origens (matriz N×N).
+      metodo (str): "haversine", "elipsoidal" ou "viaria".
+
+    Retorna:
+      np.ndarray: Matriz float32 de formato (N, M), com diagonal zero quando
+      destinos é None.
+    """
+    if metodo == "viaria":
+        from malha_viaria import matrizes_viarias
+
+        origens = _validar_coordenadas(origens)
+        destinos = None if destinos is None else _validar_coordenadas(destinos)
+        try:
+            return matrizes_viarias(origens, destinos)[0]
+        except FileNotFoundError as e:
+            logging.warning(f"{e}; usando a distância elipsoidal.")
+            metodo = "elipsoidal"
+    if metodo not in METODOS:
+        raise ValueError(f"Método de distância não suportado: {metodo}")
+
+    origens = np.radians(_validar_coordenadas(origens))
+    quadrada = destinos is None
+    destinos = origens if quadrada else np.radians(_validar_coordenadas(destinos))
+
+    lat1 = origens[:, 0][:, np.newaxis]
+    lon1 = origens[:, 1][:, np.newaxis]
+    lat2 = destinos[:, 0][np.newaxis, :]
+    lon2 = destinos[:, 1][np.newaxis, :]
+
+    matriz = METODOS[metodo](lat1, lon1, lat2, lon2).astype(np.float32)
+    if quadrada:
+        np.fill_diagonal(matriz, 0.0)
+    return matriz
+
+
+def matriz_distancias_df(pedidos_df, deposito=None, metodo="haversine",
+                         colunas=("Latitude", "Longitude")):
+    """
+    Calcula a matriz N×N (em km) a partir das colunas de coordenadas de um DataFrame.
+
+    Se 'deposito' for informado (tupla latitude, longitude), ele é inserido como
+    índice 0 e os pedidos ocupam os índices 1..N.
+    """
+    coords = pedidos_df[list(colunas)].to_numpy(dtype=np.float64)
+    if deposito is not None:
+        coords = np.vstack([np.asarray(deposito, dtype=np.float64).reshape(1, 2), coords])
+    return matriz_distancias(coords, metodo=metodo)
+
+
+def distancia_rota(rota, matriz, fechada=False):
+    """
+    Soma as distâncias consecutivas de uma rota (sequência de índices) na matriz.
+
+    Se 'fechada' for True, inclui o retorno do último ponto ao primeiro.
+    """
+    rota = np.asarray(rota, dtype=np.intp)
+    if len(rota) < 2:
+        return 0.0
+    total = float(matriz[rota[:-1], rota[1:]].sum(dtype=np.float64))
+    if fechada:
+        total += float(matriz[rota[-1], rota[0]])
+    return total
@@ -0,0 +1,180 @@
+"""
+Módulo de exportação dos resultados
+
+Gera em memória os arquivos de download da roteirização (xlsx, CSV ou
+Parquet) e os manifestos por caminhão, sem gravar em disco, a menos que um
+caminho seja informado. O xlsx é escrito com o xlsxwriter em modo
+constant_memory (linha a linha) quando ele está instalado; caso contrário,
+usa o writer padrão do pandas.
+"""
+
+import io
+import logging
+import re
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+from ingestao import PARQUET_DISPONIVEL
+from instrumentacao import etapa
+from janelas_tempo import formatar_janelas
+
+MIME_TIPOS = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv": "text/csv",
+    "parquet": "application/octet-stream",
+    "zip": "application/zip",
+}
+
+# Formatos oferecidos para download; Parquet somente com o pyarrow instalado
+FORMATOS_EXPORTACAO = ["xlsx", "csv"] + (["parquet"] if PARQUET_DISPONIVEL else [])
+
+# Colunas de ordem de visita, em ordem de preferência, para ordenar os manifestos
+COLUNAS_ORDEM = ["Ordem VRP", "Ordem de Entrega TSP", "Ordem na Regiao"]
+
+
+def coluna_manifesto(df):
+    """
+    Coluna que identifica o caminhão de cada pedido: 'Placa VRP' se o VRP foi
+    aplicado, senão 'Placa'.
+    """
+    for coluna in ("Placa VRP", "Placa"):
+        if coluna in df.columns:
+            return coluna
+    raise ValueError("Nenhuma coluna de placa encontrada para gerar os manifestos.")
+
+
+def grupos_por_caminhao(df, coluna=None):
+    """
+    Índices posicionais dos pedidos de cada caminhão, já na ordem de visita,
+    calculados em uma única passada. Pedidos sem placa são ignorados.
+
+    Retorna:
+      dict: {placa: np.ndarray de posições}.
+    """
+    coluna = coluna or coluna_manifesto(df)
+    placas = df[coluna]
+    validos = placas.notna().to_numpy() & (placas.astype(str).str.strip() != "").to_numpy()
+    posicoes = np.flatnonzero(validos)
+    ordem = next((c for c in COLUNAS_ORDEM if c in df.columns), None)
+    chaves = [placas.to_numpy()[posicoes].astype(str)]
+    if ordem is not None:
+        chaves.insert(0, pd.to_numeric(df[ordem], errors="coerce").to_numpy()[posicoes])
+    posicoes = posicoes[np.lexsort(chaves)]
+    rotulos = placas.to_numpy()[posicoes].astype(str)
+    inicios = np.flatnonzero(np.r_[True, rotulos[1:] != rotulos[:-1]])
+    return {rotulos[i]: bloco for i, bloco in zip(inicios, np.split(posicoes, inicios[1:]))}
+
+
+def _nome_planilha(nome, usados):
+    # Nomes de planilhas do Excel: até 31 caracteres, sem []:*?/\
+    base = re.sub(r"[\[\]:*?/\\]", "_", str(nome))[:31] or "Sem placa"
+    nome, i = base, 1
+    while nome.lower() in usados:
+        sufixo = f" ({i})"
+        nome, i = base[:31 - len(sufixo)] + sufixo, i + 1
+    usados.add(nome.lower())
+    return nome
+
+
+def _valores_linhas(df):
+    """
+    Converte o DataFrame em colunas de objetos Python, com nulos como None.
+    """
+    colunas = []
+    for coluna in df.columns:
+        serie = df[coluna]
+        valores = serie.astype(object).to_numpy(copy=True)
+        valores[serie.isna().to_numpy()] = None
+        colunas.append(valores)
+    return colunas
+
+
+def _xlsx_xlsxwriter(saida, planilhas):
+    import xlsxwriter
+
+    livro = xlsxwriter.Workbook(saida, {"constant_memory": True, "default_date_format": "dd/mm/yyyy"})
+    try:
+        negrito = livro.add_format({"bold": True})
+        usados = set()
+        for nome, df in planilhas:
+            aba = livro.add_worksheet(_nome_planilha(nome, usados))
+            aba.write_row(0, 0, [str(c) for c in df.columns], negrito)
+            colunas = _valores_linhas(df)
+            for linha in range(len(df)):
+                aba.write_row(linha + 1, 0, [c[linha] for c in colunas])
+    finally:
+        livro.close()
+
+
+def exportar_xlsx(df, manifestos=False, coluna=None):
+    """
+    Gera o xlsx em memória: a planilha 'Pedidos' com todos os pedidos e,
+    se 'manifestos', uma planilha por caminhão na ordem de visita.
+
+    Retorna:
+      bytes: Conteúdo do arquivo.
+    """
+    planilhas = [("Pedidos", df)]
+    if manifestos:
+        planilhas += [(placa, df.iloc[posicoes]) for placa, posicoes in grupos_por_caminhao(df, coluna).items()]
+    saida = io.BytesIO()
+    try:
+        _xlsx_xlsxwriter(saida, planilhas)
+    except ImportError:
+        logging.info("xlsxwriter não instalado; usando o writer padrão do pandas.")
+        saida = io.BytesIO()
+        usados = set()
+        with pd.ExcelWriter(saida) as writer:
+            for nome, parte in planilhas:
+                parte.to_excel(writer, sheet_name=_nome_planilha(nome, usados), index=False)
+    return saida.getvalue()
+
+
+@etapa("exportacao")
+def exportar(df, formato="xlsx", caminho=None, manifestos=False):
+    """
+    Exporta os pedidos no formato pedido.
+
+    Parâmetros:
+      df (DataFrame): Pedidos roteirizados.
+      formato (str): "xlsx", "csv" ou "parquet".
+      caminho (str): Se informado, o conteúdo também é gravado nesse arquivo.
+      manifestos (bool): No xlsx, inclui uma planilha por caminhão.
+
+    Retorna:
+      bytes: Conteúdo do arquivo.
+    """
+    if formato == "xlsx":
+        conteudo = exportar_xlsx(df, manifestos=manifestos)
+    elif formato == "csv":
+        conteudo = formatar_janelas(df).to_csv(index=False).encode("utf-8-sig")
+    elif formato == "parquet":
+        saida = io.BytesIO()
+        df.to_parquet(saida, index=False)
+        conteudo = saida.getvalue()
+    else:
+        raise ValueError(f"Formato de exportação não suportado: {formato}")
+    if caminho is not None:
+        with open(caminho, "wb") as f:
+            f.write(conteudo)
+        logging.info(f"Resultado exportado para {caminho}.")
+    return conteudo
+
+
+def exportar_manifestos(df, formato="csv", coluna=None):
+    """
+    Gera um arquivo .zip com um manifesto por caminhão (pedidos na ordem de
+    visita), em uma única passada sobre os pedidos.
+
+    Retorna:
+      bytes: Conteúdo do .zip.
+    """
+    saida = io.BytesIO()
+    usados = set()
+    with zipfile.ZipFile(saida, "w", compression=zipfile.ZIP_DEFLATED) as arquivo_zip:
+        for placa, posicoes in grupos_por_caminhao(df, coluna).items():
+            nome = _nome_planilha(placa, usados)
+            arquivo_zip.writestr(f"{nome}.{formato}", exportar(df.iloc[posicoes], formato=formato))
+    return saida.getvalue()
@@ -0,0 +1,250 @@
+"""
+Módulo de geocodificação em lote
+
+Resolve uma coluna inteira de endereços de uma vez:
+  1. remove duplicados, inclusive variações de escrita do mesmo endereço
+     (mesma chave canônica em normalizacao_enderecos);
+  2. consulta o cache de geocodificação em uma única query;
+  3. envia somente os endereços ausentes a um pool de threads, respeitando
+     o limite de requisições de cada provedor (token bucket), com novas
+     tentativas e espera exponencial em caso de erro;
+  4. grava no cache apenas as coordenadas novas.
+
+Os provedores seguem a interface ProvedorGeocodificacao; ProvedorFixo permite
+executar o pipeline sem acesso à rede.
+"""
+
+import time
+import random
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+import requests
+from geopy.geocoders import Nominatim
+
+from config import GEOCODER_USER_AGENT, OPENCAGE_API_KEY
+from cache_geocodificacao import obter_cache
+from instrumentacao import etapa, incrementar
+from normalizacao_enderecos import normalizar_endereco
+
+Coordenadas = Tuple[float, float]
+
+
+class LimitadorTaxa:
+    """
+    Token bucket seguro para threads: libera no máximo 'taxa_por_segundo'
+    requisições por segundo, com rajadas de até 'capacidade' requisições.
+    """
+
+    def __init__(self, taxa_por_segundo: float, capacidade: Optional[float] = None):
+        if taxa_por_segundo <= 0:
+            raise ValueError("A taxa de requisições deve ser positiva.")
+        self.taxa = float(taxa_por_segundo)
+        self.capacidade = float(capacidade if capacidade is not None else max(1.0, taxa_por_segundo))
+        self._tokens = self.capacidade
+        self._ultimo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def aguardar(self) -> None:
+        """
+        Bloqueia até haver um token disponível e o consome.
+        """
+        while True:
+            with self._lock:
+                agora = time.monotonic()
+                self._tokens = min(self.capacidade, self._tokens + (agora - self._ultimo) * self.taxa)
+                self._ultimo = agora
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                espera = (1 - self._tokens) / self.taxa
+            time.sleep(espera)
+
+
+class ProvedorGeocodificacao:
+    """
+    Interface dos provedores de geocodificação.
+
+    geocodificar() deve retornar (latitude, longitude), None quando o endereço
+    não for encontrado, ou lançar exceção em erros transitórios (rede, limite
+    da API), que serão repetidos com espera exponencial.
+    """
+
+    nome = "base"
+    taxa_por_segundo = 1.0
+
+    def __init__(self, taxa_por_segundo: Optional[float] = None):
+        if taxa_por_segundo is not None:
+            self.taxa_por_segundo = taxa_por_segundo
+        self.limitador = LimitadorTaxa(self.taxa_por_segundo)
+
+    def geocodificar(self, endereco: str) -> Optional[Coordenadas]:
+        raise NotImplementedError
+
+
+class ProvedorNominatim(ProvedorGeocodificacao):
+    """
+    Nominatim (OpenStreetMap); a política de uso permite 1 requisição por segundo.
+    """
+
+    nome = "nominatim"
+    taxa_por_segundo = 1.0
+
+    def __init__(self, user_agent: str = GEOCODER_USER_AGENT, taxa_por_segundo: Optional[float] = None):
+        super().__init__(taxa_por_segundo)
+        self.geolocator = Nominatim(user_agent=user_agent)
+
+    def geocodificar(self, endereco):
+        local = self.geolocator.geocode(endereco)
+        if local:
+            return (local.latitude, local.longitude)
+        return None
+
+
+class ProvedorOpenCage(ProvedorGeocodificacao):
+    """
+    API do OpenCage; a chave vem de config.OPENCAGE_API_KEY.
+    """
+
+    nome = "opencage"
+    taxa_por_segundo = 1.0
+    url = "https://api.opencagedata.com/geocode/v1/json"
+
+    def __init__(self, api_key: str = OPENCAGE_API_KEY, taxa_por_segundo: Optional[float] = None, timeout: float = 10):
+        super().__init__(taxa_por_segundo)
+        self.api_key = api_key
+        self.timeout = timeout
+
+    def geocodificar(self, endereco):
+        if not self.api_key:
+            logging.error("Chave da API OpenCage não configurada.")
+            return None
+        response = requests.get(self.url, params={"q": endereco, "key": self.api_key}, timeout=self.timeout)
+        response.raise_for_status()
+        data = response.json()
+        if data.get('results'):
+            location = data['results'][0]['geometry']
+            return location['lat'], location['lng']
+        return None
+
+
+class ProvedorFixo(ProvedorGeocodificacao):
+    """
+    Provedor local baseado em um dicionário, para testes e execuções offline.
+    """
+
+    nome = "fixo"
+    taxa_por_segundo = 1000.0
+
+    def __init__(self, coordenadas: Dict[str, Coordenadas], atraso: float = 0.0,
+                 taxa_por_segundo: Optional[float] = None):
+        super().__init__(taxa_por_segundo)
+        self.coordenadas = dict(coordenadas)
+        self.atraso = atraso
+        self.chamadas = 0
+        self._lock = threading.Lock()
+
+    def geocodificar(self, endereco):
+        with self._lock:
+            self.chamadas += 1
+        if self.atraso:
+            time.sleep(self.atraso)
+        return self.coordenadas.get(endereco)
+
+
+def _geocodificar_com_provedores(endereco, provedores, tentativas, espera_inicial):
+    """
+    Tenta cada provedor em ordem; erros são repetidos até 'tentativas' vezes
+    com espera exponencial (com jitter) antes de passar ao próximo provedor.
+    """
+    for provedor in provedores:
+        for tentativa in range(tentativas):
+            provedor.limitador.aguardar()
+            incrementar("chamadas_api_geocodificacao", provedor=provedor.nome)
+            try:
+                coordenadas = provedor.geocodificar(endereco)
+                break
+            except Exception as e:
+                incrementar("erros_api_geocodificacao", provedor=provedor.nome)
+                espera = espera_inicial * (2 ** tentativa) * (1 + random.random() / 2)
+                logging.warning(f"Erro no provedor {provedor.nome} para '{endereco}' "
+                                f"(tentativa {tentativa + 1}/{tentativas}): {e}")
+                if tentativa + 1 < tentativas:
+                    time.sleep(espera)
+        else:
+            continue
+        if coordenadas is not None:
+            return coordenadas
+    return None
+
+
+@etapa("geocodificacao")
+def geocodificar_lote(enderecos: Iterable[str], provedores: Optional[List[ProvedorGeocodificacao]] = None,
+                      cache=None, conhecidas: Optional[Dict[str, Coordenadas]] = None,
+                      max_workers: int = 4, tentativas: int = 3,
+                      espera_inicial: float = 1.0) -> Dict[str, Coordenadas]:
+    """
+    Geocodifica um conjunto de endereços, consultando a rede somente para os
+    endereços ausentes do cache.
+
+    Parâmetros:
+      enderecos (iterable): Endereços (podem conter duplicados e nulos).
+      provedores (list): Provedores em ordem de preferência. Padrão: Nominatim.
+      cache (CacheGeocodificacao): Cache a utilizar; None usa o cache compartilhado
+        e False desativa a persistência.
+      conhecidas (dict): Coordenadas já resolvidas pelo chamador, que não são consultadas.
+      max_workers (int): Número máximo de requisições simultâneas.
+      tentativas (int): Tentativas por provedor em caso de erro.
+      espera_inicial (float): Espera (s) antes da primeira nova tentativa.
+
+    Retorna:
+      dict: {endereço: (latitude, longitude)} para todos os endereços resolvidos.
+    """
+    if provedores is None:
+        provedores = [ProvedorNominatim()]
+    usar_cache = cache is not False
+    if cache is None:
+        cache = obter_cache()
+    conhecidas = conhecidas or {}
+
+    unicos = [e for e in pd.unique(pd.Series(list(enderecos), dtype=object).dropna())]
+    resultado = {e: conhecidas[e] for e in unicos if e in conhecidas}
+    pendentes = [e for e in unicos if e not in resultado]
+
+    if usar_cache and pendentes:
+        resultado.update(cache.buscar_lote(pendentes))
+        pendentes = [e for e in pendentes if e not in resultado]
+
+    # Variações do mesmo endereço são geocodificadas uma única vez
+    grupos = {}
+    for endereco in pendentes:
+        grupos.setdefault(normalizar_endereco(endereco), []).append(endereco)
+    representantes = [grupo[0] for grupo in grupos.values()]
+
+    novas = {}
+    if representantes:
+        logging.info(f"Geocodificando {len(representantes)} endereços "
+                     f"({len(unicos) - len(pendentes)} já conhecidos).")
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(representantes)))) as executor:
+            respostas = executor.map(
+                lambda e: _geocodificar_com_provedores(e, provedores, tentativas, espera_inicial),
+                representantes
+            )
+            for grupo, coordenadas in zip(grupos.values(), respostas):
+                if coordenadas is None:
+                    logging.warning(f"Coordenadas não encontradas para o endereço: {grupo[0]}")
+                    continue
+                for endereco in grupo:
+                    novas[endereco] = coordenadas
+
+    if usar_cache and novas:
+        try:
+            cache.salvar_lote(novas)
+        except Exception as e:
+            logging.error(f"Erro ao atualizar o cache: {e}")
+
+    resultado.update(novas)
+    return resultado
@@ -2,16 +2,18 @@
 Módulo de geocodificação
 
 Contém funções que convertem endereços em coordenadas.
-Utiliza caching em memória com functools.lru_cache para reduzir chamadas repetitivas.
+Utiliza caching em memória com functools.lru_cache e o cache persistente em SQLite
+(cache_geocodificacao) para reduzir chamadas repetitivas; a conversão de colunas
+inteiras é feita em lote por geocodificacao_lote.
 """
 
-import os
 import pandas as pd
 import numpy as np
 import logging
 from functools import lru_cache
 from geopy.geocoders import Nominatim
-from config import DATABASE_FOLDER, GEOCODER_USER_AGENT, OPENCAGE_API_KEY
+from config import GEOCODER_USER_AGENT, OPENCAGE_API_KEY
+from geocodificacao_lote import geocodificar_lote
 
 logging.basicConfig(level=logging.INFO, filename="geocoding.log", filemode="a",
                     format="%(asctime)s - %(levelname)s - %(message)s")
@@ -34,55 +36,28 @@ def geocode_endereco(endereco):
         logging.error(f"Erro na geocodificação do endereço '{endereco}': {e}")
     return None
 
-def converter_enderecos(df, endereco_coluna="Endereço Completo", cache_filename="coordenadas_cache.xlsx"):
+def converter_enderecos(df, endereco_coluna="Endereço Completo", cache=None, provedores=None, max_workers=4):
     """
     Atualiza o DataFrame com as colunas 'Latitude' e 'Longitude' para cada endereço.
     
-    Utiliza um arquivo de cache para evitar geocodificações repetitivas.
-    Atualiza o cache no disco somente se houver novas entradas.
+    Os endereços são deduplicados e consultados de uma vez no cache SQLite de
+    geocodificação; somente os ausentes são geocodificados, em paralelo e
+    respeitando o limite de requisições do provedor (ver geocodificacao_lote).
     
     Parâmetros:
       df (DataFrame): DataFrame com os endereços.
       endereco_coluna (str): Nome da coluna de endereços.
-      cache_filename (str): Nome do arquivo de cache.
+      cache (CacheGeocodificacao): Cache a utilizar. Se None, usa o cache compartilhado.
+      provedores (list): Provedores de geocodificação. Padrão: Nominatim.
+      max_workers (int): Número máximo de requisições simultâneas.
     
     Retorna:
       DataFrame: com colunas 'Latitude' e 'Longitude' populadas.
     """
-    cache_file = os.path.join(DATABASE_FOLDER, cache_filename)
-    
-    # Tenta carregar cache a partir do disco
-    try:
-        cache_df = pd.read_excel(cache_file, engine="openpyxl")
-        cache = dict(zip(cache_df['Endereço'], zip(cache_df['Latitude'], cache_df['Longitude'])))
-    except Exception as e:
-        logging.info(f"Cache não encontrado ou erro na leitura: {e}")
-        cache = {}
-    
-    latitudes = []
-    longitudes = []
-    for endereco in df[endereco_coluna]:
-        if endereco in cache:
-            lat, lon = cache[endereco]
-        else:
-            latlon = geocode_endereco(endereco)
-            if latlon is None:
-                lat, lon = (np.nan, np.nan)
-            else:
-                lat, lon = latlon
-            cache[endereco] = (lat, lon)
-        latitudes.append(lat)
-        longitudes.append(lon)
+    coordenadas = geocodificar_lote(df[endereco_coluna], provedores=provedores, cache=cache,
+                                    max_workers=max_workers)
 
-    df['Latitude'] = latitudes
-    df['Longitude'] = longitudes
-
-    try:
-        cache_df = pd.DataFrame(list(cache.items()), columns=['Endereço', 'Coordenadas'])
-        cache_df[['Latitude', 'Longitude']] = pd.DataFrame(cache_df['Coordenadas'].tolist(), index=cache_df.index)
-        cache_df.drop(columns=['Coordenadas'], inplace=True)
-        cache_df.to_excel(cache_file, index=False)
-    except Exception as e:
-        logging.error(f"Erro ao atualizar o cache: {e}")
-    
-    return df
\ No newline at end of file
+    sem_coordenadas = (np.nan, np.nan)
+    df['Latitude'] = df[endereco_coluna].map(lambda e: coordenadas.get(e, sem_coordenadas)[0])
+    df['Longitude'] = df[endereco_coluna].map(lambda e: coordenadas.get(e, sem_coordenadas)[1])
+    return df
@@ -1,5 +1,17 @@
 import streamlit as st
 import pandas as pd
+from cache_sessao import chave_arquivo, etapa_em_cache
+
+ARQUIVO_FROTA = "database/caminhoes_frota.xlsx"
+
+def carregar_frota(caminho=ARQUIVO_FROTA):
+    """
+    Lê a frota cadastrada, reaproveitando a leitura da sessão enquanto o
+    arquivo não for modificado. Levanta FileNotFoundError se não houver frota.
+    """
+    caminhoes_df = etapa_em_cache("frota", chave_arquivo(caminho),
+                                  lambda: pd.read_excel(caminho, engine='openpyxl'))
+    return caminhoes_df.copy()
 
 def cadastrar_caminhoes():
     st.title("Cadastro de Caminhões da Frota")
@@ -0,0 +1,172 @@
+"""
+Módulo de grafo sobre matriz
+
+Grafo leve para o TSP: uma lista de nós (endereços), o mapeamento nó → índice
+e uma matriz NumPy de pesos, no lugar de um nx.Graph completo com um objeto
+por aresta. Um peso finito fora da diagonal é uma aresta; np.inf (ou NaN)
+indica ausência de aresta.
+
+As métricas (densidade, diâmetro, grau médio) e a exportação em JSON
+(node-link, como o networkx) ou GML são calculadas a partir da matriz.
+"""
+
+import html
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components, shortest_path
+
+
+class GrafoMatriz:
+    """
+    Grafo com pesos em matriz densa.
+
+    Parâmetros:
+      nos (list): Identificadores dos nós, na ordem das linhas da matriz.
+      matriz (array-like): Pesos N×N; np.inf ou NaN onde não há aresta.
+      posicoes (array-like): Coordenadas (N, 2) de cada nó, opcionais.
+      direcionado (bool): Se False, a aresta (i, j) vale nos dois sentidos.
+    """
+
+    def __init__(self, nos, matriz, posicoes=None, direcionado=False):
+        self.nos = list(nos)
+        self.indice = {no: i for i, no in enumerate(self.nos)}
+        self.matriz = np.asarray(matriz)
+        if self.matriz.shape != (len(self.nos), len(self.nos)):
+            raise ValueError("A matriz de pesos deve ser N×N, com N igual ao número de nós.")
+        self.posicoes = None if posicoes is None else np.asarray(posicoes, dtype=np.float64)
+        self.direcionado = direcionado
+
+    @classmethod
+    def de_networkx(cls, grafo, weight="weight"):
+        """
+        Converte um nx.Graph (ou DiGraph) com pesos para GrafoMatriz.
+        """
+        import networkx as nx
+
+        nos = list(grafo.nodes)
+        matriz = nx.to_numpy_array(grafo, nodelist=nos, weight=weight, nonedge=np.inf)
+        np.fill_diagonal(matriz, 0.0)
+        pos = [grafo.nodes[no].get("pos") for no in nos]
+        posicoes = pos if all(p is not None for p in pos) else None
+        return cls(nos, matriz, posicoes, direcionado=grafo.is_directed())
+
+    @property
+    def nodes(self):
+        return self.nos
+
+    def __len__(self):
+        return len(self.nos)
+
+    def __iter__(self):
+        return iter(self.nos)
+
+    def __contains__(self, no):
+        return no in self.indice
+
+    def peso(self, origem, destino):
+        return float(self.matriz[self.indice[origem], self.indice[destino]])
+
+    def _adjacencia(self):
+        # Arestas: pesos finitos fora da diagonal
+        adjacencia = np.isfinite(self.matriz)
+        np.fill_diagonal(adjacencia, False)
+        if not self.direcionado:
+            adjacencia |= adjacencia.T
+        return adjacencia
+
+    def _completo(self, adjacencia):
+        n = len(self)
+        return int(adjacencia.sum()) == n * (n - 1)
+
+    def number_of_nodes(self):
+        return len(self)
+
+    def number_of_edges(self):
+        total = int(self._adjacencia().sum())
+        return total if self.direcionado else total // 2
+
+    def arestas(self):
+        """
+        Pares (i, j) de índices das arestas: i < j em grafos não direcionados.
+        """
+        adjacencia = self._adjacencia()
+        if not self.direcionado:
+            adjacencia = np.triu(adjacencia, k=1)
+        return np.nonzero(adjacencia)
+
+    def densidade(self):
+        n = len(self)
+        if n < 2:
+            return 0.0
+        m = self.number_of_edges()
+        return m / (n * (n - 1)) if self.direcionado else 2 * m / (n * (n - 1))
+
+    def grau_medio(self):
+        # Em grafos direcionados, grau = entrada + saída (como no networkx)
+        n = len(self)
+        return 2 * self.number_of_edges() / n if n else 0.0
+
+    def diametro(self):
+        """
+        Maior número de arestas no caminho mínimo entre dois nós (sem pesos,
+        como nx.diameter); None se o grafo não for conexo.
+        """
+        n = len(self)
+        if n == 0:
+            return None
+        adjacencia = self._adjacencia()
+        if self._completo(adjacencia):
+            return 1 if n > 1 else 0
+        esparsa = csr_matrix(adjacencia)
+        n_componentes, _ = connected_components(esparsa, directed=self.direcionado, connection="strong")
+        if n_componentes > 1:
+            return None
+        return int(shortest_path(esparsa, directed=self.direcionado, unweighted=True).max())
+
+    def node_link(self):
+        """
+        Dados no formato node-link do networkx (nx.node_link_data).
+        """
+        nos = []
+        for i, no in enumerate(self.nos):
+            dados = {"id": no}
+            if self.posicoes is not None:
+                dados["pos"] = tuple(self.posicoes[i].tolist())
+            nos.append(dados)
+        origens, destinos = self.arestas()
+        pesos = self.matriz[origens, destinos].tolist()
+        arestas = [{"weight": w, "source": self.nos[i], "target": self.nos[j]}
+                   for i, j, w in zip(origens.tolist(), destinos.tolist(), pesos)]
+        return {"directed": self.direcionado, "multigraph": False, "graph": {}, "nodes": nos, "edges": arestas}
+
+    def gml(self):
+        """
+        Linhas do grafo em GML (mesma estrutura de nx.generate_gml).
+        """
+        yield "graph ["
+        if self.direcionado:
+            yield "  directed 1"
+        for i, no in enumerate(self.nos):
+            yield "  node ["
+            yield f"    id {i}"
+            yield f'    label "{html.escape(str(no))}"'
+            if self.posicoes is not None:
+                for valor in self.posicoes[i].tolist():
+                    yield f"    pos {valor!r}"
+            yield "  ]"
+        origens, destinos = self.arestas()
+        for i, j, w in zip(origens.tolist(), destinos.tolist(), self.matriz[origens, destinos].tolist()):
+            yield "  edge ["
+            yield f"    source {i}"
+            yield f"    target {j}"
+            yield f"    weight {w!r}"
+            yield "  ]"
+        yield "]"
+
+
+def como_grafo_matriz(grafo):
+    """
+    Retorna o próprio GrafoMatriz ou converte um grafo do networkx.
+    """
+    return grafo if isinstance(grafo, GrafoMatriz) else GrafoMatriz.de_networkx(grafo)
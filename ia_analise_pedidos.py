@@ -2,9 +2,16 @@ import streamlit as st
 import pandas as pd
 from streamlit_folium import folium_static
 from database.db.database import Database  # Caminho corrigido
-from subir_pedidos import processar_pedidos, salvar_coordenadas
-import ia_analise_pedidos as ia
-from gerenciamento_frota import cadastrar_caminhoes
+from subir_pedidos import processar_pedidos
+from geocodificacao_lote import geocodificar_lote, ProvedorOpenCage
+import main as ia
+from decomposicao_regional import roteirizar_por_regiao
+from gerenciamento_frota import cadastrar_caminhoes, carregar_frota
+from cache_sessao import guardar_etapa, hash_conteudo, obter_etapa
+from exportacao import FORMATOS_EXPORTACAO, MIME_TIPOS, exportar, exportar_manifestos
+from instrumentacao import etapa, metricas, perfilar
+from janelas_tempo import formatar_horario
+from reotimizacao import carregar_solucao, reotimizar, salvar_solucao
 
 def carregar_dados_pedidos():
     """
@@ -22,20 +29,33 @@ def carregar_dados_pedidos():
         st.error("A coluna 'Endereço Completo' está ausente na planilha enviada. Verifique os dados.")
         return None
 
+    # Geocodifica em lote somente os endereços que não estão no cache;
+    # as novas coordenadas são gravadas no cache pelo próprio lote.
+    # Na sessão, a geocodificação só é refeita quando os endereços mudam.
+    chave = hash_conteudo(pedidos_df['Endereço Completo'])
     with st.spinner("Obtendo coordenadas..."):
         try:
-            pedidos_df['Latitude'] = pedidos_df['Endereço Completo'].apply(
-                lambda x: ia.obter_coordenadas_com_fallback(x, coordenadas_salvas)[0] if pd.notnull(x) else None
+            coordenadas = obter_etapa("geocodificacao", chave)
+            if coordenadas is None:
+                coordenadas = geocodificar_lote(
+                    pedidos_df['Endereço Completo'],
+                    provedores=[ProvedorOpenCage()],
+                    conhecidas=coordenadas_salvas
+                )
+                # Só guarda quando todos os endereços foram encontrados,
+                # para que uma nova tentativa consulte os que faltaram
+                if len(coordenadas) == pedidos_df['Endereço Completo'].nunique():
+                    guardar_etapa("geocodificacao", chave, coordenadas)
+            pedidos_df['Latitude'] = pedidos_df['Endereço Completo'].map(
+                lambda x: coordenadas.get(x, (None, None))[0]
             )
-            pedidos_df['Longitude'] = pedidos_df['Endereço Completo'].apply(
-                lambda x: ia.obter_coordenadas_com_fallback(x, coordenadas_salvas)[1] if pd.notnull(x) else None
+            pedidos_df['Longitude'] = pedidos_df['Endereço Completo'].map(
+                lambda x: coordenadas.get(x, (None, None))[1]
             )
         except Exception as e:
             st.error(f"Erro ao obter coordenadas: {e}")
             return None
 
-    salvar_coordenadas(coordenadas_salvas)
-
     # Verifica se alguma coordenada não foi encontrada
     if pedidos_df['Latitude'].isnull().any() or pedidos_df['Longitude'].isnull().any():
         st.warning("Alguns endereços não obtiveram coordenadas. Verifique os dados e tente novamente.")
@@ -52,12 +72,87 @@ def configurar_roterizacao(pedidos_df, caminhoes_df):
     percentual_frota = st.slider("Capacidade da frota a ser usada (%)", min_value=0, max_value=100, value=100)
     max_pedidos = st.slider("Número máximo de pedidos por veículo", min_value=1, max_value=30, value=12)
     aplicar_tsp = st.checkbox("Aplicar TSP")
+    tsp_por_regiao = st.checkbox("Roteirizar cada região separadamente (paralelo)", value=True)
+    regioes_por_carga = st.checkbox("Limitar cada região a uma carga de caminhão")
     aplicar_vrp = st.checkbox("Aplicar VRP")
+    formato_exportacao = st.selectbox("Formato do arquivo de resultado", FORMATOS_EXPORTACAO)
+    salvar_em_disco = st.checkbox("Salvar também uma cópia no servidor")
+    capturar_perfil = st.sidebar.checkbox("Capturar perfil (cProfile) da roteirização")
 
     if st.button("Executar Roteirização"):
-        executar_roterizacao(pedidos_df, caminhoes_df, n_clusters, percentual_frota, max_pedidos, aplicar_tsp, aplicar_vrp)
+        with perfilar("roteirizacao", ativo=capturar_perfil), etapa("roteirizacao"):
+            executar_roterizacao(pedidos_df, caminhoes_df, n_clusters, percentual_frota, max_pedidos, aplicar_tsp,
+                                 aplicar_vrp, tsp_por_regiao, regioes_por_carga, formato_exportacao, salvar_em_disco)
+
+def reotimizar_solucao():
+    """
+    Atualiza a última roteirização com pedidos novos, pedidos cancelados e
+    caminhões indisponíveis, alterando somente as rotas afetadas.
+    """
+    solucao_df = carregar_solucao()
+    if solucao_df is None:
+        st.info("Nenhuma roteirização salva. Execute a roteirização pelo Dashboard.")
+        return
+    try:
+        caminhoes_df = carregar_frota()
+    except FileNotFoundError:
+        st.error("Nenhum caminhão cadastrado. Cadastre a frota na opção 'Cadastro da Frota'.")
+        return
+
+    st.write(f"Última roteirização: {len(solucao_df)} pedidos.")
+    pedidos = solucao_df['Nº Pedido'].dropna().tolist() if 'Nº Pedido' in solucao_df.columns \
+        else solucao_df.index.tolist()
+    cancelados = st.multiselect("Pedidos cancelados", pedidos)
+    indisponiveis = st.multiselect("Caminhões indisponíveis", caminhoes_df['Placa'].astype(str).tolist())
+    max_pedidos = st.slider("Número máximo de pedidos por veículo", min_value=1, max_value=30, value=12)
+    tempo_limite = st.slider("Tempo máximo da busca local (s)", min_value=1, max_value=30, value=5)
+    novos_df = carregar_dados_pedidos() if st.checkbox("Adicionar pedidos novos") else None
+
+    if st.button("Reotimizar"):
+        try:
+            pedidos_df, resumo = reotimizar(solucao_df, caminhoes_df, novos_df, cancelados, indisponiveis,
+                                            max_pedidos=max_pedidos, tempo_limite=tempo_limite)
+            salvar_solucao(pedidos_df)
+        except Exception as e:
+            st.error(f"Erro na reotimização: {e}")
+            return
+        st.write(f"{resumo['inseridos']} pedidos inseridos; rotas alteradas: "
+                 f"{', '.join(resumo['rotas_alteradas']) or 'nenhuma'} ({resumo['segundos']:.2f} s).")
+        if resumo['nao_atendidos']:
+            st.warning(f"{len(resumo['nao_atendidos'])} pedidos sem caminhão.")
+        st.dataframe(pedidos_df)
+        folium_static(ia.criar_mapa(pedidos_df))
+        st.download_button(
+            "Baixar planilha",
+            data=exportar(pedidos_df, formato="xlsx"),
+            file_name="roterizacao_resultado.xlsx",
+            mime=MIME_TIPOS["xlsx"]
+        )
 
-def executar_roterizacao(pedidos_df, caminhoes_df, n_clusters, percentual_frota, max_pedidos, aplicar_tsp, aplicar_vrp):
+def exibir_metricas():
+    """
+    Mostra na barra lateral o tempo de cada etapa, os contadores e o último
+    perfil capturado.
+    """
+    with st.sidebar.expander("Desempenho"):
+        etapas = metricas.resumo_etapas()
+        if not etapas:
+            st.write("Nenhuma etapa executada ainda.")
+            return
+        st.dataframe(pd.DataFrame(etapas).set_index("etapa")[
+            ["execucoes", "segundos_ultima", "segundos_media", "segundos_max", "erros"]
+        ].round(3))
+        contadores = metricas.resumo_contadores()
+        if contadores:
+            st.dataframe(pd.DataFrame(contadores))
+        for nome, texto in metricas.perfis.items():
+            st.write(f"Perfil: {nome}")
+            st.code(texto)
+        if st.button("Zerar métricas"):
+            metricas.limpar()
+
+def executar_roterizacao(pedidos_df, caminhoes_df, n_clusters, percentual_frota, max_pedidos, aplicar_tsp, aplicar_vrp,
+                         tsp_por_regiao=False, regioes_por_carga=False, formato_exportacao="xlsx", salvar_em_disco=False):
     """
     Executa a roteirização com base nas configurações fornecidas.
     """
@@ -80,25 +175,48 @@ def executar_roterizacao(pedidos_df, caminhoes_df, n_clusters, percentual_frota,
         st.error("O número de clusters não pode ser maior que o número de pedidos.")
         return
 
-    # Agrupamento por região
+    # Agrupamento por região, partindo dos centróides da execução anterior
+    capacidade = None
+    if regioes_por_carga:
+        disponiveis = caminhoes_df[caminhoes_df['Disponível'] == 'Sim']
+        if not disponiveis.empty:
+            capacidade = disponiveis['Capac. Kg'].max() * percentual_frota / 100
     try:
-        pedidos_df = ia.agrupar_por_regiao(pedidos_df, n_clusters)
+        pedidos_df = ia.agrupar_por_regiao(pedidos_df, n_clusters,
+                                           centroides_iniciais=st.session_state.get('centroides_regioes'),
+                                           capacidade=capacidade)
+        st.session_state['centroides_regioes'] = pedidos_df.attrs.get('centroides_regioes')
     except Exception as e:
         st.error(f"Erro ao agrupar pedidos por região: {e}")
         return
+    # Com uma carga por região, a demanda pode exigir mais regiões que as escolhidas
+    n_regioes = int(pedidos_df['Regiao'].nunique())
+    if n_regioes != n_clusters:
+        st.warning(f"A demanda dos pedidos exigiu {n_regioes} regiões (escolhidas: {n_clusters}) "
+                   "para que cada uma caiba em uma carga.")
 
     # Otimização da frota
     try:
-        pedidos_df = ia.otimizar_aproveitamento_frota(pedidos_df, caminhoes_df, percentual_frota, max_pedidos, n_clusters)
+        pedidos_df = ia.otimizar_aproveitamento_frota(pedidos_df, caminhoes_df, percentual_frota, max_pedidos, n_regioes)
     except Exception as e:
         st.error(f"Erro ao otimizar frota: {e}")
         return
 
+    # Aplicação TSP por região: cada região é roteirizada em paralelo
+    if aplicar_tsp and tsp_por_regiao:
+        try:
+            pedidos_df, distancias_regioes = roteirizar_por_regiao(pedidos_df)
+            for regiao, distancia in sorted(distancias_regioes.items()):
+                st.write(f"Região {regiao}: {distancia:.2f} km")
+            pedidos_df['Ordem de Entrega TSP'] = pedidos_df['Ordem na Regiao']
+        except Exception as e:
+            st.error(f"Erro ao resolver o TSP por região: {e}")
+
     # Aplicação TSP
-    if aplicar_tsp:
+    elif aplicar_tsp:
         try:
             G = ia.criar_grafo_tsp(pedidos_df)
-            melhor_rota, menor_distancia = ia.resolver_tsp_genetico(G)
+            melhor_rota, menor_distancia = ia.resolver_tsp(G)
             st.write("Melhor rota TSP:")
             st.write("\n".join(melhor_rota))
             st.write(f"Menor distância TSP: {menor_distancia}")
@@ -109,8 +227,17 @@ def executar_roterizacao(pedidos_df, caminhoes_df, n_clusters, percentual_frota,
     # Aplicação VRP
     if aplicar_vrp:
         try:
-            rota_vrp = ia.resolver_vrp(pedidos_df, caminhoes_df)
-            st.write(f"Melhor rota VRP: {rota_vrp}")
+            rota_vrp = ia.resolver_vrp(pedidos_df, caminhoes_df, max_pedidos=max_pedidos)
+            st.write(f"Distância total VRP: {rota_vrp['distancia_total'] / 1000:.2f} km")
+            for rota in rota_vrp['rotas']:
+                st.write(f"{rota['placa']}: {len(rota['pedidos'])} pedidos, "
+                         f"{rota['peso']:.1f} kg, {rota['distancia'] / 1000:.2f} km")
+                pedidos_df.loc[rota['pedidos'], 'Placa VRP'] = rota['placa']
+                pedidos_df.loc[rota['pedidos'], 'Ordem VRP'] = list(range(1, len(rota['pedidos']) + 1))
+                if 'horarios' in rota:
+                    pedidos_df.loc[rota['pedidos'], 'Horário VRP'] = [formatar_horario(h) for h in rota['horarios']]
+            if rota_vrp['nao_atendidos']:
+                st.warning(f"{len(rota_vrp['nao_atendidos'])} pedidos não couberam em nenhum veículo.")
         except Exception as e:
             st.error(f"Erro ao resolver o VRP: {e}")
 
@@ -120,17 +247,37 @@ def executar_roterizacao(pedidos_df, caminhoes_df, n_clusters, percentual_frota,
     mapa = ia.criar_mapa(pedidos_df)
     folium_static(mapa)
 
-    # Exportar resultados
-    output_file_path = "roterizacao_resultado.xlsx"
-    pedidos_df.to_excel(output_file_path, index=False)
-    st.write(f"Arquivo salvo: {output_file_path}")
-    with open(output_file_path, "rb") as file:
+    # Guarda a solução como ponto de partida da reotimização
+    try:
+        salvar_solucao(pedidos_df)
+    except OSError as e:
+        st.warning(f"Não foi possível salvar a solução para reotimização: {e}")
+
+    # Exportar resultados: o arquivo é gerado em memória e só vai para o disco se pedido
+    output_file_path = f"roterizacao_resultado.{formato_exportacao}"
+    try:
+        conteudo = exportar(pedidos_df, formato=formato_exportacao,
+                            caminho=output_file_path if salvar_em_disco else None)
+    except Exception as e:
+        st.error(f"Erro ao exportar o resultado: {e}")
+        return
+    if salvar_em_disco:
+        st.write(f"Arquivo salvo: {output_file_path}")
+    st.download_button(
+        "Baixar planilha",
+        data=conteudo,
+        file_name=output_file_path,
+        mime=MIME_TIPOS[formato_exportacao]
+    )
+    try:
         st.download_button(
-            "Baixar planilha",
-            data=file,
-            file_name="roterizacao_resultado.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+            "Baixar manifestos por caminhão",
+            data=exportar_manifestos(pedidos_df),
+            file_name="manifestos.zip",
+            mime=MIME_TIPOS["zip"]
         )
+    except ValueError:
+        pass
 
 def main():
     st.title("Roteirizador de Pedidos")
@@ -140,6 +287,7 @@ def main():
         "Dashboard",
         "Cadastro da Frota",
         "IA Análise",
+        "Reotimização",
         "API REST"
     ])
 
@@ -151,7 +299,7 @@ def main():
         if pedidos_df is not None:
             # Carrega a frota cadastrada
             try:
-                caminhoes_df = pd.read_excel("database/caminhoes_frota.xlsx", engine="openpyxl")
+                caminhoes_df = carregar_frota()
             except FileNotFoundError:
                 st.error("Nenhum caminhão cadastrado. Cadastre a frota na opção 'Cadastro da Frota'.")
                 return
@@ -181,13 +329,21 @@ def main():
                     mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
                 )
 
+    elif menu_opcao == "Reotimização":
+        st.header("Reotimização")
+        st.write("Aplique pedidos novos, cancelamentos e caminhões indisponíveis à última roteirização:")
+        reotimizar_solucao()
+
     elif menu_opcao == "API REST":
         st.header("Interação com API REST")
         st.write("Teste os endpoints:")
         st.markdown("""
         - **POST /upload**: Faz upload dos arquivos (Pedidos.xlsx, Caminhoes.xlsx, IA.xlsx).
         - **GET /resultado**: Retorna a solução do algoritmo genético.
+        - **POST /jobs**: Enfileira o cálculo do resultado e retorna o id do job.
+        - **GET /jobs/<id>**: Retorna o status, o progresso e o resultado do job.
         - **GET /mapa**: Exibe o mapa interativo.
+        - **GET /metrics**: Tempos por etapa e contadores, no formato do Prometheus.
         """)
         if st.button("Testar /resultado"):
             try:
@@ -196,5 +352,7 @@ def main():
             except Exception as e:
                 st.error(f"Erro na requisição: {e}")
 
+    exibir_metricas()
+
 if __name__ == "__main__":
     main()
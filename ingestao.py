@@ -0,0 +1,234 @@
+"""
+Módulo de ingestão de planilhas
+
+Lê planilhas de pedidos e de frota em xlsx/xlsm (openpyxl em modo read-only,
+linha a linha), CSV ou Parquet. Apenas as colunas conhecidas do esquema
+são lidas, já com tipos compactos (categorias para bairro/cidade, float32
+para pesos e quantidades), e a validação é feita lote a lote. Os lotes são
+entregues por um gerador para que as etapas seguintes (consulta ao cache e
+geocodificação) comecem sem esperar o arquivo inteiro.
+"""
+
+import csv
+import importlib.util
+import io
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+COLUNAS_ENDERECO = ["Endereço de Entrega", "Bairro de Entrega", "Cidade de Entrega"]
+
+# Colunas lidas de cada planilha e o tipo compacto de cada uma (None mantém o tipo lido)
+ESQUEMA_PEDIDOS = {
+    "Placa": "category",
+    "Nº Carga": "Int64",
+    "Nº Pedido": "Int64",
+    "Cód. Cliente": "Int64",
+    "Nome Cliente": None,
+    "Grupo Cliente": "category",
+    "Endereço de Entrega": None,
+    "Bairro de Entrega": "category",
+    "Cidade de Entrega": "category",
+    "Qtde. dos Itens": "float32",
+    "Peso dos Itens": "float32",
+    "Latitude": "float64",
+    "Longitude": "float64",
+    # Horários e durações em formatos variados; convertidos por janelas_tempo.preparar_janelas
+    "Janela Início": None,
+    "Janela Fim": None,
+    "Tempo de Descarga": None,
+}
+
+ESQUEMA_CAMINHOES = {
+    "Placa": None,
+    "Transportador": "category",
+    "Descrição Veículo": "category",
+    "Capac. Cx": "float32",
+    "Capac. Kg": "float32",
+    "Disponível": "category",
+    "Máx. Pedidos": "float32",
+}
+
+FORMATOS = {".xlsx": "xlsx", ".xlsm": "xlsx", ".csv": "csv", ".parquet": "parquet"}
+
+# Parquet depende do pyarrow, que é opcional (fora do requirements.txt)
+PARQUET_DISPONIVEL = importlib.util.find_spec("pyarrow") is not None
+
+TAMANHO_LOTE = 5000
+
+
+def formato_arquivo(origem):
+    """
+    Deduz o formato ("xlsx", "csv" ou "parquet") pela extensão do caminho
+    ou do atributo 'name' de um arquivo enviado.
+    """
+    nome = origem if isinstance(origem, (str, os.PathLike)) else getattr(origem, "name", "")
+    extensao = os.path.splitext(str(nome))[1].lower()
+    if extensao not in FORMATOS:
+        raise ValueError(f"Formato de arquivo não suportado: '{extensao or nome}'.")
+    return FORMATOS[extensao]
+
+
+def _selecionar_colunas(cabecalho, esquema, obrigatorias):
+    ausentes = [coluna for coluna in obrigatorias if coluna not in cabecalho]
+    if ausentes:
+        raise ValueError(f"As seguintes colunas necessárias não foram encontradas: {', '.join(ausentes)}")
+    if esquema is None:
+        return [c for c in cabecalho if c is not None]
+    return [c for c in cabecalho if c in esquema]
+
+
+def _validar_lote(lote, esquema, inicio):
+    """
+    Converte o lote para os tipos do esquema. Valores numéricos inválidos ou
+    negativos viram nulos e são registrados no log com a linha de origem.
+    """
+    for coluna in lote.columns:
+        tipo = esquema.get(coluna) if esquema else None
+        if tipo is None:
+            continue
+        if tipo == "category":
+            lote[coluna] = lote[coluna].astype("category")
+            continue
+        valores = pd.to_numeric(lote[coluna], errors="coerce")
+        invalidos = valores.isna() & lote[coluna].notna()
+        if tipo in ("float32", "Int64"):
+            invalidos |= valores < 0
+            valores = valores.mask(valores < 0)
+        if invalidos.any():
+            linhas = (np.flatnonzero(invalidos.to_numpy()) + inicio + 2)[:5].tolist()
+            logging.warning(f"Coluna '{coluna}': {int(invalidos.sum())} valores inválidos "
+                            f"descartados (linhas {linhas}...).")
+        if tipo == "Int64":
+            valores = valores.round()
+        lote[coluna] = valores.astype(tipo)
+    return lote
+
+
+def _lotes_xlsx(origem, esquema, obrigatorias, tamanho_lote):
+    from openpyxl import load_workbook
+
+    livro = load_workbook(origem, read_only=True, data_only=True)
+    try:
+        linhas = livro.worksheets[0].iter_rows(values_only=True)
+        cabecalho = list(next(linhas, ()))
+        colunas = _selecionar_colunas(cabecalho, esquema, obrigatorias)
+        indices = [cabecalho.index(c) for c in colunas]
+        bloco = []
+        produziu = False
+        for linha in linhas:
+            if linha is None or all(v is None for v in linha):
+                continue
+            bloco.append([linha[i] if i < len(linha) else None for i in indices])
+            if len(bloco) >= tamanho_lote:
+                yield pd.DataFrame(bloco, columns=colunas)
+                produziu = True
+                bloco = []
+        if bloco or not produziu:
+            yield pd.DataFrame(bloco, columns=colunas)
+    finally:
+        livro.close()
+
+
+def _lotes_csv(origem, esquema, obrigatorias, tamanho_lote, separador, encoding):
+    if isinstance(origem, (bytes, bytearray)):
+        origem = io.BytesIO(origem)
+    if separador is None:
+        # Planilhas exportadas no Brasil costumam usar ';'
+        if hasattr(origem, "read"):
+            posicao = origem.tell()
+            amostra = origem.readline()
+            origem.seek(posicao)
+        else:
+            with open(origem, "rb") as f:
+                amostra = f.readline()
+        amostra = amostra.decode(encoding, errors="ignore") if isinstance(amostra, bytes) else amostra
+        try:
+            separador = csv.Sniffer().sniff(amostra, delimiters=";,\t|").delimiter
+        except csv.Error:
+            separador = ","
+    cabecalho = pd.read_csv(origem, sep=separador, encoding=encoding, nrows=0).columns.tolist()
+    if hasattr(origem, "seek"):
+        origem.seek(0)
+    colunas = _selecionar_colunas(cabecalho, esquema, obrigatorias)
+    # Colunas de texto e categorias são lidas como texto; os números são validados depois
+    tipos = {c: str for c in colunas if not esquema or esquema.get(c) in (None, "category")}
+    yield from pd.read_csv(origem, sep=separador, encoding=encoding, usecols=colunas, dtype=tipos,
+                           chunksize=tamanho_lote)
+
+
+def _lotes_parquet(origem, esquema, obrigatorias, tamanho_lote):
+    import pyarrow.parquet as pq
+
+    arquivo = pq.ParquetFile(origem)
+    colunas = _selecionar_colunas(arquivo.schema_arrow.names, esquema, obrigatorias)
+    for lote in arquivo.iter_batches(batch_size=tamanho_lote, columns=colunas):
+        yield lote.to_pandas()
+
+
+def ler_em_lotes(origem, esquema=ESQUEMA_PEDIDOS, obrigatorias=COLUNAS_ENDERECO, formato=None,
+                 tamanho_lote=TAMANHO_LOTE, separador=None, encoding="utf-8-sig"):
+    """
+    Lê a planilha em lotes de DataFrames com tipos compactos.
+
+    Parâmetros:
+      origem (str | file-like | bytes): Caminho ou conteúdo do arquivo.
+      esquema (dict): Colunas a ler e seus tipos; None lê todas as colunas sem conversão.
+      obrigatorias (list): Colunas que precisam existir (ValueError se faltarem).
+      formato (str): "xlsx", "csv" ou "parquet"; se None, é deduzido pelo nome.
+      tamanho_lote (int): Número de linhas por lote.
+      separador (str): Separador do CSV; se None, é detectado pelo cabeçalho.
+
+    Retorna:
+      generator: DataFrames de até 'tamanho_lote' linhas, com índice contínuo.
+    """
+    formato = formato or formato_arquivo(origem)
+    if formato == "xlsx":
+        lotes = _lotes_xlsx(origem, esquema, obrigatorias, tamanho_lote)
+    elif formato == "csv":
+        lotes = _lotes_csv(origem, esquema, obrigatorias, tamanho_lote, separador, encoding)
+    elif formato == "parquet":
+        lotes = _lotes_parquet(origem, esquema, obrigatorias, tamanho_lote)
+    else:
+        raise ValueError(f"Formato de arquivo não suportado: '{formato}'.")
+
+    inicio = 0
+    for lote in lotes:
+        lote.index = pd.RangeIndex(inicio, inicio + len(lote))
+        yield _validar_lote(lote, esquema, inicio)
+        inicio += len(lote)
+
+
+def concatenar_lotes(lotes, esquema=ESQUEMA_PEDIDOS):
+    """
+    Junta os lotes em um único DataFrame, refazendo as categorias (que
+    podem diferir de um lote para outro).
+    """
+    lotes = list(lotes)
+    if not lotes:
+        return pd.DataFrame()
+    df = pd.concat(lotes, ignore_index=True) if len(lotes) > 1 else lotes[0].reset_index(drop=True)
+    for coluna, tipo in (esquema or {}).items():
+        if tipo == "category" and coluna in df.columns and not isinstance(df[coluna].dtype, pd.CategoricalDtype):
+            df[coluna] = df[coluna].astype("category")
+    return df
+
+
+def ler_planilha(origem, esquema=ESQUEMA_PEDIDOS, obrigatorias=COLUNAS_ENDERECO, formato=None, **kwargs):
+    """
+    Lê a planilha inteira (em lotes) e retorna um único DataFrame.
+    """
+    return concatenar_lotes(ler_em_lotes(origem, esquema, obrigatorias, formato, **kwargs), esquema)
+
+
+def montar_endereco_completo(df):
+    """
+    Monta a coluna 'Endereço Completo' a partir de endereço, bairro e cidade.
+    """
+    return (
+        df['Endereço de Entrega'].astype(str) + ', ' +
+        df['Bairro de Entrega'].astype(str) + ', ' +
+        df['Cidade de Entrega'].astype(str)
+    )
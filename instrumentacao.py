@@ -0,0 +1,212 @@
+"""
+Módulo de instrumentação
+
+Mede o tempo de cada etapa do pipeline (upload, geocodificação,
+pré-processamento, agrupamento, alocação, TSP/VRP, mapa e exportação) e
+mantém contadores (acertos e falhas do cache de geocodificação, chamadas às
+APIs, iterações dos solvers). Os valores ficam em memória, no processo, e
+são exibidos na barra lateral do Streamlit e no endpoint /metrics da API
+(formato texto do Prometheus).
+
+- etapa("nome"): gerenciador de contexto (with) ou decorador que cronometra a etapa;
+- incrementar("nome", valor, **rotulos): soma ao contador;
+- perfilar("nome"): captura opcional com cProfile; o relatório fica em metricas.perfis.
+"""
+
+import cProfile
+import io
+import logging
+import math
+import numbers
+import pstats
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+PREFIXO = "roteirizar"
+
+# Descrição (HELP) dos contadores conhecidos; contadores novos usam o próprio nome
+DESCRICOES = {
+    "geocodificacao_cache_acertos": "Endereços encontrados no cache de geocodificação.",
+    "geocodificacao_cache_falhas": "Endereços ausentes do cache de geocodificação.",
+    "chamadas_api_geocodificacao": "Requisições feitas aos provedores de geocodificação.",
+    "erros_api_geocodificacao": "Requisições aos provedores de geocodificação que falharam.",
+    "requisicoes_http": "Requisições atendidas pela API REST.",
+    "iteracoes_solver": "Gerações ou iterações executadas pelos solvers.",
+    "cache_distancias_pares_calculados": "Pares de locais cuja distância precisou ser calculada.",
+    "cache_distancias_pares_reaproveitados": "Pares de locais com distância lida do cache de distâncias.",
+}
+
+
+def _nome_metrica(nome):
+    return re.sub(r"[^a-zA-Z0-9_]", "_", nome)
+
+
+def _rotulos(rotulos):
+    if not rotulos:
+        return ""
+    pares = []
+    for chave, valor in rotulos:
+        valor = str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pares.append(f'{_nome_metrica(chave)}="{valor}"')
+    return "{" + ",".join(pares) + "}"
+
+
+def _valor(valor):
+    # Inteiros exatos e floats com todos os dígitos (repr), sem notação truncada
+    if isinstance(valor, numbers.Integral):
+        return str(int(valor))
+    valor = float(valor)
+    if math.isnan(valor):
+        return "NaN"
+    if math.isinf(valor):
+        return "+Inf" if valor > 0 else "-Inf"
+    return repr(valor)
+
+
+class Metricas:
+    """
+    Registro de tempos por etapa, contadores e perfis, seguro para threads.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.contadores = {}
+        self.etapas = {}
+        self.perfis = {}
+
+    def incrementar(self, nome, valor=1, **rotulos):
+        chave = (nome, tuple(sorted(rotulos.items())))
+        with self._lock:
+            self.contadores[chave] = self.contadores.get(chave, 0) + valor
+
+    def registrar_etapa(self, nome, segundos, erro=False):
+        with self._lock:
+            dados = self.etapas.setdefault(nome, {"execucoes": 0, "erros": 0, "segundos_total": 0.0,
+                                                  "segundos_max": 0.0, "segundos_ultima": 0.0})
+            dados["execucoes"] += 1
+            dados["erros"] += int(erro)
+            dados["segundos_total"] += segundos
+            dados["segundos_max"] = max(dados["segundos_max"], segundos)
+            dados["segundos_ultima"] = segundos
+
+    def guardar_perfil(self, nome, texto):
+        with self._lock:
+            self.perfis[nome] = texto
+
+    def resumo_etapas(self):
+        """
+        Retorna:
+          list: Um dicionário por etapa, com execuções, erros e tempos (s).
+        """
+        with self._lock:
+            return [{"etapa": nome, **dados, "segundos_media": dados["segundos_total"] / dados["execucoes"]}
+                    for nome, dados in sorted(self.etapas.items())]
+
+    def resumo_contadores(self):
+        """
+        Retorna:
+          list: Um dicionário por contador, com os rótulos em texto.
+        """
+        with self._lock:
+            return [{"contador": nome, "rotulos": ", ".join(f"{k}={v}" for k, v in rotulos), "valor": valor}
+                    for (nome, rotulos), valor in sorted(self.contadores.items())]
+
+    def limpar(self):
+        with self._lock:
+            self.contadores.clear()
+            self.etapas.clear()
+            self.perfis.clear()
+
+    def prometheus(self):
+        """
+        Exporta as métricas no formato texto do Prometheus (versão 0.0.4).
+        """
+        with self._lock:
+            etapas = sorted(self.etapas.items())
+            contadores = sorted(self.contadores.items())
+
+        linhas = []
+        series = [
+            ("etapa_execucoes_total", "counter", "Execuções de cada etapa.", "execucoes"),
+            ("etapa_erros_total", "counter", "Execuções de cada etapa que terminaram em erro.", "erros"),
+            ("etapa_segundos_total", "counter", "Tempo acumulado de cada etapa, em segundos.", "segundos_total"),
+            ("etapa_segundos_max", "gauge", "Maior duração de cada etapa, em segundos.", "segundos_max"),
+            ("etapa_segundos_ultima", "gauge", "Duração da última execução de cada etapa, em segundos.",
+             "segundos_ultima"),
+        ]
+        for sufixo, tipo, descricao, campo in series:
+            if not etapas:
+                break
+            nome = f"{PREFIXO}_{sufixo}"
+            linhas += [f"# HELP {nome} {descricao}", f"# TYPE {nome} {tipo}"]
+            linhas += [f"{nome}{_rotulos([('etapa', etapa)])} {_valor(dados[campo])}" for etapa, dados in etapas]
+
+        ultimo = None
+        for (contador, rotulos), valor in contadores:
+            nome = f"{PREFIXO}_{_nome_metrica(contador)}_total"
+            if contador != ultimo:
+                linhas += [f"# HELP {nome} {DESCRICOES.get(contador, contador)}", f"# TYPE {nome} counter"]
+                ultimo = contador
+            linhas.append(f"{nome}{_rotulos(rotulos)} {_valor(valor)}")
+        return "\n".join(linhas) + "\n"
+
+
+metricas = Metricas()
+
+
+def incrementar(nome, valor=1, **rotulos):
+    """
+    Soma 'valor' ao contador 'nome' com os rótulos informados (ex.: provedor="opencage").
+    """
+    metricas.incrementar(nome, valor, **rotulos)
+
+
+@contextmanager
+def etapa(nome):
+    """
+    Cronometra uma etapa do pipeline. Pode ser usado com "with etapa(...)" ou
+    como decorador (@etapa("...")); exceções são contadas como erro e propagadas.
+    """
+    inicio = time.perf_counter()
+    erro = False
+    try:
+        yield
+    except BaseException:
+        erro = True
+        raise
+    finally:
+        segundos = time.perf_counter() - inicio
+        metricas.registrar_etapa(nome, segundos, erro)
+        logging.info(f"Etapa '{nome}' concluída em {segundos:.3f} s{' (com erro)' if erro else ''}.")
+
+
+@contextmanager
+def perfilar(nome, ativo=True, linhas=30, ordenar="cumulative"):
+    """
+    Captura um perfil cProfile do bloco (somente da thread atual) e guarda as
+    'linhas' funções mais custosas em metricas.perfis[nome].
+
+    Parâmetros:
+      ativo (bool): Se False, o bloco roda sem perfil.
+      ordenar (str): Critério do pstats ("cumulative", "tottime"...).
+    """
+    if not ativo:
+        yield None
+        return
+    perfil = cProfile.Profile()
+    try:
+        perfil.enable()
+    except ValueError as e:
+        # Outro perfil já está ativo no processo
+        logging.warning(f"Perfil '{nome}' não capturado: {e}")
+        yield None
+        return
+    try:
+        yield perfil
+    finally:
+        perfil.disable()
+        saida = io.StringIO()
+        pstats.Stats(perfil, stream=saida).sort_stats(ordenar).print_stats(linhas)
+        metricas.guardar_perfil(nome, saida.getvalue())
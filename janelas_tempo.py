@@ -0,0 +1,531 @@
+"""
+Módulo de janelas de tempo
+
+Suporte a janelas de entrega e tempo de descarga na roteirização:
+  - colunas opcionais 'Janela Início', 'Janela Fim' e 'Tempo de Descarga' da
+    planilha de pedidos, convertidas para durações (timedelta; horários
+    contados a partir da meia-noite) e lidas em minutos pelos solvers;
+  - matriz de durações de viagem (minutos), pela malha viária ou pela
+    velocidade média;
+  - AgendaRota: horário mais cedo (propagado para frente) e mais tarde
+    (propagado para trás) de atendimento em cada parada, de modo que inserir,
+    remover ou trocar uma parada é verificado em O(1);
+  - PlanoRotas: inserção mais barata e busca local (realocação e troca de
+    paradas) com essas verificações e com as capacidades dos veículos.
+
+Chegar antes do início da janela gera espera; passar do fim torna a rota inviável.
+"""
+
+import datetime
+import logging
+import re
+import time
+
+import numpy as np
+import pandas as pd
+
+from config import HORARIO_RETORNO, HORARIO_SAIDA, METODO_DISTANCIA, TEMPO_DESCARGA_PADRAO, VELOCIDADE_MEDIA_KMH
+from instrumentacao import incrementar
+
+COLUNAS_JANELA = ["Janela Início", "Janela Fim", "Tempo de Descarga"]
+MINUTOS_DIA = 24 * 60
+EPS = 1e-6
+
+_HORARIO = re.compile(r"^(\d{1,2})[:hH](\d{2})?(?::(\d{2}))?$")
+
+
+def _minutos(valor, duracao=False):
+    """
+    Converte um horário (ou, com duracao=True, uma duração) para minutos.
+
+    Aceita "08:30", "8h30", "8h", datetime.time/datetime/Timestamp,
+    timedelta e textos de timedelta ("0 days 11:00:00", como o pandas grava
+    colunas timedelta em CSV). Números são minutos quando duracao=True; como horário, valores
+    entre 0 e 1 são frações do dia (células de hora do Excel), de 1 a 24 são
+    horas e acima disso já são minutos. Retorna NaN para vazios e inválidos.
+    """
+    if valor is None or (not isinstance(valor, (str, datetime.time, datetime.date, datetime.timedelta))
+                         and pd.isna(valor)):
+        return np.nan
+    if isinstance(valor, datetime.timedelta):
+        return valor.total_seconds() / 60
+    if isinstance(valor, datetime.datetime):
+        valor = valor.time()
+    if isinstance(valor, datetime.time):
+        return valor.hour * 60 + valor.minute + valor.second / 60
+    if isinstance(valor, str):
+        texto = valor.strip().replace(" ", "")
+        correspondencia = _HORARIO.match(texto)
+        if correspondencia:
+            horas, minutos, segundos = correspondencia.groups()
+            return int(horas) * 60 + int(minutos or 0) + int(segundos or 0) / 60
+        if "day" in texto.lower():
+            try:
+                valor = pd.to_timedelta(valor.strip())
+            except ValueError:
+                return np.nan
+            return np.nan if pd.isna(valor) else valor.total_seconds() / 60
+        texto = texto.lower().removesuffix("min").replace(",", ".")
+        try:
+            valor = float(texto)
+        except ValueError:
+            return np.nan
+    try:
+        numero = float(valor)
+    except (TypeError, ValueError):
+        return np.nan
+    if duracao:
+        return numero if numero >= 0 else np.nan
+    if 0 <= numero < 1:
+        return numero * MINUTOS_DIA
+    if 1 <= numero <= 24:
+        return numero * 60
+    return numero if numero <= MINUTOS_DIA else np.nan
+
+
+def _numeros_em_minutos(valores, duracao=False):
+    # Mesma regra de _minutos, vetorizada, para colunas numéricas
+    if duracao:
+        return np.where(valores >= 0, valores, np.nan)
+    return np.select(
+        [(valores >= 0) & (valores < 1), (valores >= 1) & (valores <= 24), (valores > 24) & (valores <= MINUTOS_DIA)],
+        [valores * MINUTOS_DIA, valores * 60, valores],
+        default=np.nan,
+    )
+
+
+def em_minutos(serie, duracao=False):
+    """
+    Converte uma coluna de horários (ou durações) para minutos (float64).
+
+    Colunas timedelta (já preparadas por preparar_janelas) são lidas
+    diretamente; colunas numéricas seguem a mesma regra dos valores de texto
+    (ver _minutos).
+    """
+    if pd.api.types.is_timedelta64_dtype(serie.dtype):
+        return (serie.dt.total_seconds() / 60).to_numpy(dtype=np.float64, na_value=np.nan)
+    if pd.api.types.is_numeric_dtype(serie.dtype) and not pd.api.types.is_bool_dtype(serie.dtype):
+        return _numeros_em_minutos(serie.to_numpy(dtype=np.float64, na_value=np.nan), duracao)
+    valores = serie.astype(object)
+    convertidos = {v: _minutos(v, duracao) for v in pd.unique(valores.dropna())}
+    return valores.map(convertidos).to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+def horario_em_minutos(valor):
+    """
+    Converte um horário como "07:00" para minutos desde a meia-noite.
+    """
+    minutos = _minutos(valor)
+    if np.isnan(minutos):
+        raise ValueError(f"Horário inválido: {valor!r}")
+    return minutos
+
+
+def formatar_horario(minutos):
+    """
+    Formata minutos desde a meia-noite como "HH:MM" ("" para valores nulos).
+    """
+    if minutos is None or pd.isna(minutos):
+        return ""
+    minutos = int(round(minutos))
+    return f"{minutos // 60:02d}:{minutos % 60:02d}"
+
+
+def formatar_janelas(pedidos_df):
+    """
+    Retorna uma cópia do DataFrame com as colunas de janela preparadas
+    (timedelta) em texto: horários como "HH:MM" e descarga em minutos. Usado
+    na exportação para CSV, de modo que o arquivo possa ser carregado de novo.
+    """
+    presentes = [c for c in COLUNAS_JANELA
+                 if c in pedidos_df.columns and pd.api.types.is_timedelta64_dtype(pedidos_df[c].dtype)]
+    if not presentes:
+        return pedidos_df
+    pedidos_df = pedidos_df.copy()
+    for coluna in presentes:
+        minutos = em_minutos(pedidos_df[coluna])
+        if coluna == "Tempo de Descarga":
+            pedidos_df[coluna] = np.round(minutos, 2)
+        else:
+            pedidos_df[coluna] = [formatar_horario(m) for m in minutos]
+    return pedidos_df
+
+
+def _avisar_invalidos(coluna, invalidos, indice):
+    if invalidos.any():
+        linhas = (indice[invalidos][:5] + 2).tolist()
+        logging.warning(f"Coluna '{coluna}': {int(invalidos.sum())} valores inválidos descartados (linhas {linhas}...).")
+
+
+def preparar_janelas(pedidos_df):
+    """
+    Converte as colunas de janela e de descarga presentes no DataFrame (as
+    ausentes continuam ausentes) para timedelta: horários a partir da
+    meia-noite e descarga como duração. Valores inválidos e janelas que
+    terminam antes de começar viram nulos, com aviso no log. Como timedelta,
+    as colunas não são reinterpretadas numa segunda conversão.
+
+    Retorna:
+      DataFrame: O próprio pedidos_df, com as colunas convertidas.
+    """
+    presentes = [c for c in COLUNAS_JANELA if c in pedidos_df.columns]
+    if not presentes:
+        return pedidos_df
+    indice = np.arange(len(pedidos_df))
+    for coluna in presentes:
+        convertidos = em_minutos(pedidos_df[coluna], duracao=coluna == "Tempo de Descarga")
+        _avisar_invalidos(coluna, np.isnan(convertidos) & pedidos_df[coluna].notna().to_numpy(), indice)
+        pedidos_df[coluna] = pd.to_timedelta(convertidos, unit="min")
+    if "Janela Início" in presentes and "Janela Fim" in presentes:
+        invertidas = (pedidos_df["Janela Fim"] < pedidos_df["Janela Início"]).to_numpy()
+        _avisar_invalidos("Janela Fim", invertidas, indice)
+        pedidos_df.loc[invertidas, ["Janela Início", "Janela Fim"]] = np.nan
+    return pedidos_df
+
+
+def tem_janelas(pedidos_df):
+    """
+    Indica se algum pedido tem janela de entrega ou tempo de descarga.
+    """
+    return any(c in pedidos_df.columns and pedidos_df[c].notna().any() for c in COLUNAS_JANELA)
+
+
+def janelas_nos(pedidos_df, saida=None, retorno=None):
+    """
+    Janelas e tempos de descarga por nó, com o depósito no índice 0 e os
+    pedidos em 1..n. Pedidos sem janela podem ser atendidos durante toda a
+    jornada (saída a retorno); sem descarga, usam TEMPO_DESCARGA_PADRAO.
+
+    Parâmetros:
+      saida, retorno (float): Jornada em minutos desde a meia-noite; se None,
+        usam HORARIO_SAIDA e HORARIO_RETORNO.
+
+    Retorna:
+      tuple: (inicio, fim, servico), arrays float64 de tamanho n + 1.
+    """
+    saida = horario_em_minutos(HORARIO_SAIDA) if saida is None else float(saida)
+    retorno = horario_em_minutos(HORARIO_RETORNO) if retorno is None else float(retorno)
+
+    def coluna(nome, padrao):
+        if nome not in pedidos_df.columns:
+            return np.full(len(pedidos_df), padrao, dtype=np.float64)
+        valores = em_minutos(pedidos_df[nome], duracao=nome == "Tempo de Descarga")
+        return np.where(np.isnan(valores), padrao, valores)
+
+    inicio = np.concatenate([[saida], np.maximum(coluna("Janela Início", saida), saida)])
+    fim = np.concatenate([[retorno], np.minimum(coluna("Janela Fim", retorno), retorno)])
+    servico = np.concatenate([[0.0], coluna("Tempo de Descarga", TEMPO_DESCARGA_PADRAO)])
+    return inicio, fim, servico
+
+
+def matriz_duracoes(coords, distancias=None, metodo=METODO_DISTANCIA):
+    """
+    Matriz de durações de viagem (minutos) entre as coordenadas.
+
+    Parâmetros:
+      coords (array-like): Coordenadas (N, 2) com latitude e longitude.
+      distancias (np.ndarray): Matriz em km já calculada, reaproveitada
+        quando a duração é estimada pela velocidade média.
+      metodo (str): Com "viaria" e um extrato OSM disponível, usa os tempos
+        da malha viária; nos demais casos, distância / VELOCIDADE_MEDIA_KMH.
+
+    Retorna:
+      np.ndarray: Matriz N×N float64.
+    """
+    if metodo == "viaria":
+        from malha_viaria import matrizes_viarias
+
+        try:
+            return matrizes_viarias(coords)[1].astype(np.float64)
+        except FileNotFoundError as e:
+            logging.warning(f"{e}; estimando as durações pela velocidade média.")
+            metodo = "elipsoidal"
+    if distancias is None:
+        from cache_distancias import matriz_distancias_cache
+
+        distancias = matriz_distancias_cache(coords, metodo=metodo)
+    return np.asarray(distancias, dtype=np.float64) / VELOCIDADE_MEDIA_KMH * 60
+
+
+class AgendaRota:
+    """
+    Horários de uma rota (depósito → paradas → depósito).
+
+    cedo[k] é o início mais cedo do atendimento na posição k, propagado do
+    depósito para frente; tarde[k] é o início mais tarde na posição k que
+    ainda cumpre as janelas das posições seguintes, propagado do retorno
+    para trás. A rota é viável se cedo[k] <= fim em todas as posições, e uma
+    alteração local é viável se o novo horário na parada seguinte não passa
+    de tarde nessa parada: cada verificação custa O(1).
+
+    Parâmetros:
+      paradas (list): Nós visitados, em ordem, sem o depósito.
+      duracoes (np.ndarray): Tempos de viagem entre nós (minutos); None
+        quando o tempo não restringe as rotas (viagens de duração zero).
+      inicio, fim, servico (np.ndarray): Janela e tempo de descarga de cada nó.
+      deposito (int): Nó do depósito.
+    """
+
+    def __init__(self, paradas, duracoes, inicio, fim, servico, deposito=0):
+        self.nos = [deposito] + list(paradas) + [deposito]
+        self.duracoes = duracoes
+        self.inicio = inicio
+        self.fim = fim
+        self.servico = servico
+
+        m = len(self.nos)
+        cedo = [0.0] * m
+        tarde = [0.0] * m
+        cedo[0] = inicio[deposito]
+        for k in range(1, m):
+            a, b = self.nos[k - 1], self.nos[k]
+            cedo[k] = max(inicio[b], cedo[k - 1] + servico[a] + self._duracao(a, b))
+        tarde[-1] = fim[deposito]
+        for k in range(m - 2, -1, -1):
+            a, b = self.nos[k], self.nos[k + 1]
+            tarde[k] = min(fim[a], tarde[k + 1] - servico[a] - self._duracao(a, b))
+        self.cedo = cedo
+        self.tarde = tarde
+        self.viavel = all(cedo[k] <= fim[no] + EPS for k, no in enumerate(self.nos))
+
+    def _duracao(self, a, b):
+        return 0.0 if self.duracoes is None else self.duracoes[a, b]
+
+    def _inicio_apos(self, k, no):
+        # Início do atendimento em 'no' visitado logo depois da posição k
+        anterior = self.nos[k]
+        return max(self.inicio[no], self.cedo[k] + self.servico[anterior] + self._duracao(anterior, no))
+
+    def _segue_viavel(self, inicio_no, no, k):
+        # A parada da posição k, visitada depois de 'no', continua dentro da folga
+        seguinte = self.nos[k]
+        chegada = max(self.inicio[seguinte], inicio_no + self.servico[no] + self._duracao(no, seguinte))
+        return chegada <= self.tarde[k] + EPS
+
+    def insercao_viavel(self, k, no):
+        """
+        Verifica se 'no' pode ser inserido entre as posições k e k + 1.
+        """
+        inicio_no = self._inicio_apos(k, no)
+        return inicio_no <= self.fim[no] + EPS and self._segue_viavel(inicio_no, no, k + 1)
+
+    def remocao_viavel(self, k):
+        """
+        Verifica se a parada da posição k pode ser retirada.
+        """
+        return self._inicio_apos(k - 1, self.nos[k + 1]) <= self.tarde[k + 1] + EPS
+
+    def troca_viavel(self, k, no):
+        """
+        Verifica se a parada da posição k pode ser substituída por 'no'.
+        """
+        inicio_no = self._inicio_apos(k - 1, no)
+        return inicio_no <= self.fim[no] + EPS and self._segue_viavel(inicio_no, no, k + 1)
+
+    def chegadas(self):
+        """
+        Início do atendimento em cada parada (minutos desde a meia-noite).
+        """
+        return self.cedo[1:-1]
+
+
+class PlanoRotas:
+    """
+    Rotas de vários veículos sobre matrizes de custo e de duração, com as
+    cargas e agendas de cada rota atualizadas a cada alteração.
+
+    Parâmetros:
+      rotas (list): Uma lista de nós (sem o depósito) por veículo.
+      distancias (np.ndarray): Custo de cada arco (metros).
+      duracoes (np.ndarray): Tempo de viagem de cada arco (minutos); None sem janelas.
+      inicio, fim, servico (np.ndarray): Janelas e descarga por nó (janelas_nos).
+      demandas (np.ndarray): Demanda (n_nos, k) de cada nó em k dimensões.
+      capacidades (np.ndarray): Capacidade (n_veiculos, k) de cada veículo.
+      deposito (int): Nó do depósito.
+    """
+
+    def __init__(self, rotas, distancias, duracoes, inicio, fim, servico, demandas, capacidades, deposito=0):
+        self.distancias = np.asarray(distancias, dtype=np.float64)
+        self.duracoes = None if duracoes is None else np.asarray(duracoes, dtype=np.float64)
+        self.inicio, self.fim, self.servico = inicio, fim, servico
+        self.demandas = np.asarray(demandas, dtype=np.float64).reshape(len(self.distancias), -1)
+        self.capacidades = np.asarray(capacidades, dtype=np.float64).reshape(len(rotas), -1)
+        self.deposito = deposito
+        self.rotas = [list(rota) for rota in rotas]
+        self.cargas = np.zeros_like(self.capacidades)
+        self.agendas = [None] * len(self.rotas)
+        for veiculo in range(len(self.rotas)):
+            self._atualizar(veiculo)
+
+    def _atualizar(self, veiculo):
+        rota = self.rotas[veiculo]
+        self.cargas[veiculo] = self.demandas[rota].sum(axis=0)
+        self.agendas[veiculo] = AgendaRota(rota, self.duracoes, self.inicio, self.fim, self.servico, self.deposito)
+
+    def veiculo_de(self, no):
+        return next((v for v, rota in enumerate(self.rotas) if no in rota), None)
+
+    def custo_rota(self, veiculo):
+        nos = self.agendas[veiculo].nos
+        return float(self.distancias[nos[:-1], nos[1:]].sum())
+
+    def custo_total(self):
+        return sum(self.custo_rota(v) for v in range(len(self.rotas)) if self.rotas[v])
+
+    def cabe(self, veiculo, entra, sai=None):
+        carga = self.cargas[veiculo] + self.demandas[entra]
+        if sai is not None:
+            carga = carga - self.demandas[sai]
+        return bool(np.all(carga <= self.capacidades[veiculo] + EPS))
+
+    def _acrescimos(self, nos, no):
+        # Custo de inserir 'no' entre cada par de posições consecutivas
+        anteriores, seguintes = nos[:-1], nos[1:]
+        d = self.distancias
+        return d[anteriores, no] + d[no, seguintes] - d[anteriores, seguintes]
+
+    def melhor_insercao(self, no, veiculos=None):
+        """
+        Inserção viável mais barata de 'no' entre os veículos informados.
+
+        Retorna:
+          tuple: (acréscimo de custo, veículo, posição) ou None se nenhuma for viável.
+        """
+        melhor = None
+        for veiculo in range(len(self.rotas)) if veiculos is None else veiculos:
+            if not self.cabe(veiculo, no):
+                continue
+            agenda = self.agendas[veiculo]
+            acrescimos = self._acrescimos(agenda.nos, no)
+            for k in np.argsort(acrescimos, kind="stable").tolist():
+                if melhor is not None and acrescimos[k] >= melhor[0]:
+                    break
+                if agenda.insercao_viavel(k, no):
+                    melhor = (float(acrescimos[k]), veiculo, k)
+                    break
+        return melhor
+
+    def inserir(self, no, veiculo, posicao):
+        """
+        Insere 'no' entre as posições 'posicao' e 'posicao' + 1 da agenda do veículo.
+        """
+        self.rotas[veiculo].insert(posicao, no)
+        self._atualizar(veiculo)
+
+    def remover(self, no):
+        """
+        Retira 'no' da rota em que está e retorna o veículo (None se não estava em nenhuma).
+        """
+        veiculo = self.veiculo_de(no)
+        if veiculo is not None:
+            self.rotas[veiculo].remove(no)
+            self._atualizar(veiculo)
+        return veiculo
+
+    def inserir_pendentes(self, pendentes, veiculos=None):
+        """
+        Insere os nós pendentes pela inserção mais barata, começando pelos de
+        janela mais apertada (fim mais cedo) e mais distantes do depósito.
+
+        Retorna:
+          list: Nós que não couberam em nenhuma rota.
+        """
+        ordem = sorted(pendentes, key=lambda no: (self.fim[no], -self.distancias[self.deposito, no]))
+        sobras = []
+        for no in ordem:
+            insercao = self.melhor_insercao(no, veiculos)
+            if insercao is None:
+                sobras.append(no)
+            else:
+                self.inserir(no, insercao[1], insercao[2])
+        return sobras
+
+    def _realocar(self, veiculo, k, veiculos):
+        # Move a parada da posição k para a melhor posição viável que reduz o custo
+        agenda = self.agendas[veiculo]
+        nos = agenda.nos
+        no = nos[k]
+        d = self.distancias
+        ganho = d[nos[k - 1], no] + d[no, nos[k + 1]] - d[nos[k - 1], nos[k + 1]]
+        if ganho <= EPS or not agenda.remocao_viavel(k):
+            return False
+        for destino in veiculos:
+            if destino == veiculo:
+                # Na mesma rota, a agenda sem a parada é refeita (O(n)) só se houver ganho
+                restantes = nos[1:k] + nos[k + 1:-1]
+                candidata = [self.deposito] + restantes + [self.deposito]
+                acrescimos = self._acrescimos(candidata, no)
+                if not (acrescimos < ganho - EPS).any():
+                    continue
+                agenda_destino = AgendaRota(restantes, self.duracoes, self.inicio, self.fim, self.servico,
+                                            self.deposito)
+            else:
+                if not self.cabe(destino, no):
+                    continue
+                agenda_destino = self.agendas[destino]
+                acrescimos = self._acrescimos(agenda_destino.nos, no)
+            for posicao in np.argsort(acrescimos, kind="stable").tolist():
+                if acrescimos[posicao] >= ganho - EPS:
+                    break
+                if agenda_destino.insercao_viavel(posicao, no):
+                    self.rotas[veiculo].remove(no)
+                    self.rotas[destino].insert(posicao, no)
+                    self._atualizar(veiculo)
+                    if destino != veiculo:
+                        self._atualizar(destino)
+                    return True
+        return False
+
+    def _trocar(self, veiculo, k, veiculos):
+        # Troca a parada da posição k com uma parada de outra rota, se reduzir o custo
+        agenda = self.agendas[veiculo]
+        a, u, b = agenda.nos[k - 1], agenda.nos[k], agenda.nos[k + 1]
+        d = self.distancias
+        for destino in veiculos:
+            outra = self.agendas[destino]
+            if destino == veiculo or len(outra.nos) <= 2:
+                continue
+            nos = np.asarray(outra.nos)
+            c, x, e = nos[:-2], nos[1:-1], nos[2:]
+            variacao = (d[a, x] + d[x, b] - d[a, u] - d[u, b]) + (d[c, u] + d[u, e] - d[c, x] - d[x, e])
+            for q in np.flatnonzero(variacao < -EPS)[np.argsort(variacao[variacao < -EPS], kind="stable")].tolist():
+                x_q = int(x[q])
+                if (self.cabe(veiculo, x_q, sai=u) and self.cabe(destino, u, sai=x_q)
+                        and agenda.troca_viavel(k, x_q) and outra.troca_viavel(q + 1, u)):
+                    self.rotas[veiculo][k - 1] = x_q
+                    self.rotas[destino][q] = u
+                    self._atualizar(veiculo)
+                    self._atualizar(destino)
+                    return True
+        return False
+
+    def busca_local(self, veiculos=None, tempo_limite=None, max_passadas=50):
+        """
+        Realocação e troca de paradas entre as rotas dos veículos informados
+        (todas, se None), aceitando a primeira melhoria viável. As rotas dos
+        demais veículos não são alteradas.
+
+        Retorna:
+          int: Número de movimentos aplicados.
+        """
+        veiculos = list(range(len(self.rotas))) if veiculos is None else list(veiculos)
+        prazo = None if tempo_limite is None else time.perf_counter() + tempo_limite
+        movimentos = 0
+        passadas = 0
+        melhorou = True
+        while melhorou and passadas < max_passadas:
+            melhorou = False
+            passadas += 1
+            for veiculo in veiculos:
+                k = 1
+                while k < len(self.agendas[veiculo].nos) - 1:
+                    if prazo is not None and time.perf_counter() > prazo:
+                        incrementar("iteracoes_solver", passadas, solver="busca_local_janelas")
+                        return movimentos
+                    if self._realocar(veiculo, k, veiculos) or self._trocar(veiculo, k, veiculos):
+                        movimentos += 1
+                        melhorou = True
+                    else:
+                        k += 1
+        incrementar("iteracoes_solver", passadas, solver="busca_local_janelas")
+        return movimentos
@@ -0,0 +1,134 @@
+"""
+Módulo da fila de jobs da API
+
+Executa tarefas demoradas (como o algoritmo genético de /resultado) em um
+pool local de threads, fora do ciclo de requisição do Flask. O estado, o
+progresso e o resultado de cada job ficam em um banco SQLite, de forma que
+continuam disponíveis após reiniciar a API. Jobs com as mesmas entradas
+(mesmo hash de conteúdo) são deduplicados: o job existente é reaproveitado
+enquanto estiver pendente, em execução ou concluído.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from config import DATABASE_FOLDER
+
+JOBS_DB = os.path.join(DATABASE_FOLDER, "jobs.db")
+
+PENDENTE = "pendente"
+EXECUTANDO = "executando"
+CONCLUIDO = "concluido"
+ERRO = "erro"
+
+
+class FilaJobs:
+    """
+    Fila de jobs com workers locais e persistência em SQLite.
+    """
+
+    def __init__(self, caminho=JOBS_DB, max_workers=2):
+        pasta = os.path.dirname(caminho)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+        self.caminho = caminho
+        self._lock = threading.Lock()
+        self._conexao = sqlite3.connect(caminho, check_same_thread=False)
+        self._conexao.execute("PRAGMA journal_mode=WAL")
+        self._conexao.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                chave TEXT NOT NULL,
+                tipo TEXT NOT NULL,
+                status TEXT NOT NULL,
+                progresso REAL NOT NULL DEFAULT 0,
+                resultado TEXT,
+                erro TEXT,
+                criado_em TEXT NOT NULL,
+                atualizado_em TEXT NOT NULL
+            )
+        """)
+        self._conexao.execute("CREATE INDEX IF NOT EXISTS idx_jobs_chave ON jobs (chave, tipo)")
+        # Jobs interrompidos por um reinício da API não serão retomados
+        self._conexao.execute(
+            "UPDATE jobs SET status = ?, erro = ? WHERE status IN (?, ?)",
+            (ERRO, "Interrompido pelo reinício da API.", PENDENTE, EXECUTANDO)
+        )
+        self._conexao.commit()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+
+    def _atualizar(self, id_job, **campos):
+        campos["atualizado_em"] = datetime.now().isoformat(timespec="seconds")
+        atribuicoes = ", ".join(f"{nome} = ?" for nome in campos)
+        with self._lock:
+            self._conexao.execute(f"UPDATE jobs SET {atribuicoes} WHERE id = ?", (*campos.values(), id_job))
+            self._conexao.commit()
+
+    def enviar(self, tipo, chave, tarefa, *args, **kwargs):
+        """
+        Enfileira tarefa(*args, progresso=callback, **kwargs).
+
+        Parâmetros:
+          tipo (str): Nome do tipo de job (faz parte da deduplicação).
+          chave (str): Hash de conteúdo das entradas.
+          tarefa (callable): Função executada pelo worker; o retorno deve ser
+            serializável em JSON.
+
+        Retorna:
+          tuple: (id do job, True se foi criado ou False se foi reaproveitado).
+        """
+        agora = datetime.now().isoformat(timespec="seconds")
+        with self._lock:
+            existente = self._conexao.execute(
+                "SELECT id FROM jobs WHERE chave = ? AND tipo = ? AND status != ? "
+                "ORDER BY criado_em DESC LIMIT 1",
+                (chave, tipo, ERRO)
+            ).fetchone()
+            if existente:
+                return existente[0], False
+            id_job = uuid.uuid4().hex
+            self._conexao.execute(
+                "INSERT INTO jobs (id, chave, tipo, status, criado_em, atualizado_em) VALUES (?, ?, ?, ?, ?, ?)",
+                (id_job, chave, tipo, PENDENTE, agora, agora)
+            )
+            self._conexao.commit()
+        self._executor.submit(self._executar, id_job, tarefa, args, kwargs)
+        return id_job, True
+
+    def _executar(self, id_job, tarefa, args, kwargs):
+        self._atualizar(id_job, status=EXECUTANDO)
+        try:
+            resultado = tarefa(*args, progresso=lambda fracao: self._atualizar(id_job, progresso=float(fracao)),
+                               **kwargs)
+            self._atualizar(id_job, status=CONCLUIDO, progresso=1.0,
+                            resultado=json.dumps(resultado, default=str))
+        except Exception as e:
+            logging.error(f"Erro no job {id_job}: {e}")
+            self._atualizar(id_job, status=ERRO, erro=str(e))
+
+    def obter(self, id_job):
+        """
+        Retorna o estado do job (status, progresso, resultado ou erro), ou None.
+        """
+        with self._lock:
+            linha = self._conexao.execute(
+                "SELECT id, tipo, status, progresso, resultado, erro, criado_em, atualizado_em "
+                "FROM jobs WHERE id = ?", (id_job,)
+            ).fetchone()
+        if linha is None:
+            return None
+        job = dict(zip(["id", "tipo", "status", "progresso", "resultado", "erro", "criado_em", "atualizado_em"],
+                       linha))
+        job["resultado"] = json.loads(job["resultado"]) if job["resultado"] is not None else None
+        return job
+
+    def fechar(self):
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            self._conexao.close()
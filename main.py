@@ -1,15 +1,22 @@
 import os
 import requests
 import streamlit as st
-import random
-import networkx as nx
-from itertools import permutations
 from geopy.distance import geodesic
 from sklearn.cluster import KMeans
 import folium
+import numpy as np
 import pandas as pd
 import logging
 from typing import List, Tuple, Optional, Dict
+from config import METODO_DISTANCIA
+from grafo_matriz import GrafoMatriz, como_grafo_matriz
+from cache_distancias import matriz_distancias_cache
+from tsp_genetico import resolver_tsp_genetico_matriz
+from busca_local_tsp import resolver_tsp_matriz
+from roteirizacao_vrp import resolver_vrp
+from agrupar_por_regiao import agrupar_por_regiao
+from otimizar_aproveitamento_frota import otimizar_aproveitamento_frota
+import mapas
 
 # Configuração de logs
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -17,7 +24,6 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 # Configurações fixas
 endereco_partida_coords = (-23.0838, -47.1336)  # Coordenadas do ponto de partida
 
-@st.cache_data
 def obter_coordenadas_com_fallback(endereco: str, cache: Dict[str, Tuple[float, float]]) -> Tuple[Optional[float], Optional[float]]:
     """
     Tenta obter coordenadas de um endereço utilizando um cache local como fallback.
@@ -63,106 +69,90 @@ def calcular_distancia(coords_1: Tuple[float, float], coords_2: Tuple[float, flo
         raise ValueError(f"Coordenadas inválidas: {coords_2}")
     return geodesic(coords_1, coords_2).meters
 
-def criar_grafo_tsp(pedidos_df: pd.DataFrame) -> nx.Graph:
+def criar_grafo_tsp(pedidos_df: pd.DataFrame) -> GrafoMatriz:
     """
     Cria um grafo para o problema do caixeiro viajante (TSP).
+
+    O grafo é completo e guardado como matriz de distâncias em metros
+    (grafo_matriz.GrafoMatriz), montada a partir do cache de distâncias.
     """
-    G = nx.Graph()
-    enderecos = pedidos_df['Endereço Completo'].unique()
-    G.add_node("Partida", pos=endereco_partida_coords)
-    
-    for endereco in enderecos:
-        coords = (
-            pedidos_df.loc[pedidos_df['Endereço Completo'] == endereco, 'Latitude'].values[0],
-            pedidos_df.loc[pedidos_df['Endereço Completo'] == endereco, 'Longitude'].values[0]
-        )
-        G.add_node(endereco, pos=coords)
-    
-    for (node1, node2) in permutations(["Partida"] + list(enderecos), 2):
-        distancia = calcular_distancia(G.nodes[node1]['pos'], G.nodes[node2]['pos'])
-        G.add_edge(node1, node2, weight=distancia)
-    
-    return G
+    unicos = pedidos_df.drop_duplicates('Endereço Completo')
+    nos = ["Partida"] + unicos['Endereço Completo'].tolist()
+    posicoes = np.vstack([endereco_partida_coords, unicos[['Latitude', 'Longitude']].to_numpy(dtype=float)])
+    matriz = (matriz_distancias_cache(posicoes, metodo=METODO_DISTANCIA) * 1000).astype(np.float64)
 
-def resolver_tsp_genetico(G: nx.Graph) -> Tuple[List[str], float]:
+    # Distâncias viárias podem diferir entre ida e volta
+    return GrafoMatriz(nos, matriz, posicoes, direcionado=METODO_DISTANCIA == "viaria")
+
+def resolver_tsp_genetico(G: GrafoMatriz, n_ilhas: int = 1, intervalo_migracao: int = 10,
+                          seed: Optional[int] = None) -> Tuple[List[str], float]:
     """
     Resolve o TSP utilizando um algoritmo genético simples.
+
+    A população é avaliada sobre a matriz de pesos do grafo (tsp_genetico); com
+    n_ilhas > 1 as populações evoluem em processos separados, com migração
+    das melhores rotas a cada 'intervalo_migracao' gerações.
     """
-    def fitness(route):
-        return sum(G.edges[route[i], route[i + 1]]['weight'] for i in range(len(route) - 1)) + \
-               G.edges[route[-1], route[0]]['weight']
-
-    def mutate(route):
-        i, j = random.sample(range(len(route)), 2)
-        route[i], route[j] = route[j], route[i]
-        return route
-
-    def crossover(route1, route2):
-        size = len(route1)
-        start, end = sorted(random.sample(range(size), 2))
-        child = [None] * size
-        child[start:end] = route1[start:end]
-        pointer = 0
-        for i in range(size):
-            if route2[i] not in child:
-                while child[pointer] is not None:
-                    pointer += 1
-                child[pointer] = route2[i]
-        return child
-
-    def genetic_algorithm(population, generations=100, mutation_rate=0.01):
-        for _ in range(generations):
-            population = sorted(population, key=lambda route: fitness(route))
-            next_generation = population[:2]
-            for _ in range(len(population) // 2 - 1):
-                parents = random.sample(population[:10], 2)
-                child = crossover(parents[0], parents[1])
-                if random.random() < mutation_rate:
-                    child = mutate(child)
-                next_generation.append(child)
-            population = next_generation
-        return population[0], fitness(population[0])
-
-    nodes = list(G.nodes)
-    population = [random.sample(nodes, len(nodes)) for _ in range(100)]
-    best_route, best_distance = genetic_algorithm(population)
+    G = como_grafo_matriz(G)
+    nodes, matriz = G.nodes, G.matriz
+    inicio = G.indice.get("Partida", 0)
+    rota, best_distance, ilha = resolver_tsp_genetico_matriz(
+        matriz, n_ilhas=n_ilhas, intervalo_migracao=intervalo_migracao, seed=seed, inicio=inicio
+    )
+    best_route = [nodes[i] for i in rota]
 
-    logging.info(f"Melhor rota TSP: {best_route}")
+    logging.info(f"Melhor rota TSP (ilha {ilha}): {best_route}")
     st.write(f"Melhor rota TSP: {best_route}")
     st.write(f"Distância total: {best_distance:.2f} metros")
     
     return best_route, best_distance
 
+def resolver_tsp(G: GrafoMatriz, construcao: str = "vizinho", k: int = 10,
+                 tempo_limite: Optional[float] = None) -> Tuple[List[str], float]:
+    """
+    Resolve o TSP com construção gulosa (vizinho mais próximo ou economias)
+    seguida de busca local 2-opt/Or-opt com listas de vizinhos. Grafos
+    direcionados (distância viária) são otimizados sobre a matriz
+    simetrizada, e a distância retornada é a do sentido percorrido.
+    """
+    G = como_grafo_matriz(G)
+    nodes, matriz = G.nodes, G.matriz
+    inicio = G.indice.get("Partida", 0)
+    rota, best_distance = resolver_tsp_matriz(matriz, inicio=inicio, construcao=construcao,
+                                              k=k, tempo_limite=tempo_limite)
+    best_route = [nodes[i] for i in rota]
+
+    logging.info(f"Melhor rota TSP: {best_route}")
+    st.write(f"Distância total: {best_distance:.2f} metros")
+
+    return best_route, best_distance
+
 def criar_mapa(pedidos_df: pd.DataFrame) -> folium.Map:
     """
-    Cria e retorna um mapa Folium com marcadores para cada pedido.
+    Cria e retorna um mapa Folium com os pedidos coloridos por placa ou região
+    e a rota de cada caminhão (ver mapas.criar_mapa).
     """
-    mapa = folium.Map(location=endereco_partida_coords, zoom_start=12)
-    for _, row in pedidos_df.iterrows():
-        folium.Marker(
-            location=[row['Latitude'], row['Longitude']],
-            popup=f"Pedido: {row['Endereço Completo']}",
-            icon=folium.Icon(color='blue')
-        ).add_to(mapa)
-    return mapa
+    return mapas.criar_mapa(pedidos_df, deposito=endereco_partida_coords)
 
-def exportar_grafo(grafo: nx.Graph, formato: str = "json") -> str:
+def exportar_grafo(grafo: GrafoMatriz, formato: str = "json") -> str:
     """
-    Exporta o grafo em formato JSON ou GML.
+    Exporta o grafo em formato JSON (node-link) ou GML.
     """
+    grafo = como_grafo_matriz(grafo)
     if formato == "json":
-        return nx.node_link_data(grafo)
+        return grafo.node_link()
     elif formato == "gml":
-        return nx.generate_gml(grafo)
+        return grafo.gml()
     else:
         raise ValueError("Formato não suportado.")
 
-def calcular_metricas_grafo(grafo: nx.Graph) -> dict:
+def calcular_metricas_grafo(grafo: GrafoMatriz) -> dict:
     """
     Calcula métricas do grafo, como densidade, diâmetro e grau médio.
     """
+    grafo = como_grafo_matriz(grafo)
     return {
-        "densidade": nx.density(grafo),
-        "diâmetro": nx.diameter(grafo) if nx.is_connected(grafo) else None,
-        "grau_médio": sum(dict(grafo.degree()).values()) / grafo.number_of_nodes()
+        "densidade": grafo.densidade(),
+        "diâmetro": grafo.diametro(),
+        "grau_médio": grafo.grau_medio()
     }
@@ -0,0 +1,396 @@
+"""
+Módulo de malha viária
+
+Motor de rotas offline: lê um extrato OSM em XML (.osm, .osm.bz2 ou .osm.gz)
+com iterparse, monta um grafo dirigido compacto em CSR (scipy.sparse) com as
+vias trafegáveis por caminhão, respeitando mão única e velocidades, e calcula
+em lote as matrizes de distância (km, caminho mais curto) e de duração
+(minutos, caminho mais rápido) entre paradas com o Dijkstra de
+scipy.sparse.csgraph, executado em blocos de origens para limitar a memória.
+
+- O grafo compilado é gravado ao lado do extrato (<extrato>.npz) e reaproveitado
+  enquanto o extrato não mudar;
+- As matrizes ficam em cache no disco (database/matrizes_viarias), pela
+  assinatura da malha e pelas coordenadas das paradas.
+
+O extrato padrão é config.MALHA_VIARIA_OSM; com config.METODO_DISTANCIA =
+"viaria", as matrizes de distancias.matriz_distancias passam a vir daqui.
+"""
+
+import bz2
+import gzip
+import hashlib
+import logging
+import os
+import re
+import threading
+import xml.etree.ElementTree as ET
+from array import array
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components, dijkstra
+from scipy.spatial import cKDTree
+
+from config import DATABASE_FOLDER, MALHA_VIARIA_OSM
+from distancias import _haversine
+
+# Vias trafegáveis e velocidade padrão (km/h) quando não há 'maxspeed'
+VELOCIDADES_KMH = {
+    "motorway": 90, "motorway_link": 50,
+    "trunk": 80, "trunk_link": 40,
+    "primary": 60, "primary_link": 40,
+    "secondary": 50, "secondary_link": 30,
+    "tertiary": 40, "tertiary_link": 30,
+    "unclassified": 30, "residential": 30,
+    "living_street": 10, "service": 15, "road": 30, "track": 15,
+}
+
+# Velocidade e fator de desvio do trecho em linha reta entre a parada e a via
+VELOCIDADE_ACESSO_KMH = 20
+FATOR_DESVIO = 1.3
+
+PASTA_MATRIZES = os.path.join(DATABASE_FOLDER, "matrizes_viarias")
+MAX_MATRIZES_DISCO = 200
+
+# Memória máxima do bloco de origens do Dijkstra (linhas origem × todos os nós)
+LIMITE_BLOCO_BYTES = 256 * 1024 * 1024
+
+_malhas = {}
+_lock = threading.Lock()
+
+
+def _abrir(caminho):
+    if caminho.endswith(".bz2"):
+        return bz2.open(caminho, "rb")
+    if caminho.endswith(".gz"):
+        return gzip.open(caminho, "rb")
+    return open(caminho, "rb")
+
+
+def _velocidade(tags, via):
+    maxspeed = tags.get("maxspeed")
+    if maxspeed:
+        achado = re.match(r"\s*(\d+(?:\.\d+)?)\s*(mph)?", maxspeed)
+        if achado:
+            velocidade = float(achado.group(1)) * (1.609 if achado.group(2) else 1.0)
+            if velocidade > 0:
+                return velocidade
+    return float(VELOCIDADES_KMH[via])
+
+
+def _sentido(tags, via):
+    """
+    1: só no sentido dos nós; -1: só no sentido inverso; 0: mão dupla.
+    """
+    oneway = tags.get("oneway")
+    if oneway in ("yes", "true", "1"):
+        return 1
+    if oneway in ("-1", "reverse"):
+        return -1
+    if oneway == "no":
+        return 0
+    if via in ("motorway", "motorway_link") or tags.get("junction") in ("roundabout", "circular"):
+        return 1
+    return 0
+
+
+def ler_osm(caminho):
+    """
+    Lê os nós e as vias trafegáveis do extrato OSM em uma única passada.
+
+    Retorna:
+      tuple: (ids dos nós, coordenadas (N, 2), origens, destinos, velocidades),
+      com as arestas já expandidas conforme o sentido de cada via.
+    """
+    ids_nos, lats, lons = array("q"), array("d"), array("d")
+    origens, destinos, velocidades = array("q"), array("q"), array("f")
+    with _abrir(caminho) as f:
+        raiz = None
+        for evento, elem in ET.iterparse(f, events=("start", "end")):
+            if evento == "start":
+                if raiz is None:
+                    raiz = elem
+                continue
+            if elem.tag == "node":
+                ids_nos.append(int(elem.get("id")))
+                lats.append(float(elem.get("lat")))
+                lons.append(float(elem.get("lon")))
+            elif elem.tag == "way":
+                tags = {t.get("k"): t.get("v") for t in elem.iter("tag")}
+                via = tags.get("highway")
+                if via in VELOCIDADES_KMH and tags.get("access") not in ("no", "private") \
+                        and tags.get("area") != "yes":
+                    refs = [int(nd.get("ref")) for nd in elem.iter("nd")]
+                    velocidade = _velocidade(tags, via)
+                    sentido = _sentido(tags, via)
+                    for a, b in zip(refs[:-1], refs[1:]):
+                        if sentido >= 0:
+                            origens.append(a)
+                            destinos.append(b)
+                            velocidades.append(velocidade)
+                        if sentido <= 0:
+                            origens.append(b)
+                            destinos.append(a)
+                            velocidades.append(velocidade)
+            else:
+                continue
+            # Libera os elementos já lidos para manter a memória constante
+            raiz.clear()
+
+    coords = np.column_stack([np.frombuffer(lats, dtype=np.float64), np.frombuffer(lons, dtype=np.float64)])
+    return (np.frombuffer(ids_nos, dtype=np.int64), coords, np.frombuffer(origens, dtype=np.int64),
+            np.frombuffer(destinos, dtype=np.int64), np.frombuffer(velocidades, dtype=np.float32))
+
+
+def _csr(u, v, pesos, n):
+    """
+    Matriz CSR n×n com o menor peso de cada par (u, v); arestas paralelas
+    seriam somadas pelo construtor do scipy.
+    """
+    chave = u.astype(np.int64) * n + v
+    ordem = np.lexsort((pesos, chave))
+    primeiro = np.r_[True, chave[ordem][1:] != chave[ordem][:-1]]
+    ordem = ordem[primeiro]
+    # Pesos zero seriam tratados como ausência de aresta
+    return csr_matrix((np.maximum(pesos[ordem], 1e-6), (u[ordem], v[ordem])), shape=(n, n))
+
+
+class MalhaViaria:
+    """
+    Grafo viário dirigido em CSR, com pesos em km (distância) e em minutos (duração).
+    """
+
+    def __init__(self, coords, grafo_distancia, grafo_duracao, assinatura):
+        self.coords = np.asarray(coords, dtype=np.float64)
+        self.grafo_distancia = grafo_distancia.tocsr()
+        self.grafo_duracao = grafo_duracao.tocsr()
+        self.assinatura = assinatura
+        self._arvore = None
+        self._reversos = {}
+
+    def __len__(self):
+        return len(self.coords)
+
+    @classmethod
+    def de_osm(cls, caminho):
+        """
+        Monta a malha a partir do extrato OSM, mantendo apenas a maior
+        componente fortemente conexa (paradas ligadas a ilhas da malha, como
+        estacionamentos isolados, ficariam sem rota).
+        """
+        ids_nos, coords, origens, destinos, velocidades = ler_osm(caminho)
+        ordem = np.argsort(ids_nos)
+        ids_ordenados = ids_nos[ordem]
+
+        # Arestas com nós fora do extrato (cortadas na borda) são descartadas
+        pos_o = np.clip(np.searchsorted(ids_ordenados, origens), 0, max(len(ids_ordenados) - 1, 0))
+        pos_d = np.clip(np.searchsorted(ids_ordenados, destinos), 0, max(len(ids_ordenados) - 1, 0))
+        validas = (ids_ordenados[pos_o] == origens) & (ids_ordenados[pos_d] == destinos) & (origens != destinos)
+        if not validas.any():
+            raise ValueError(f"Nenhuma via trafegável encontrada em {caminho}.")
+        pos_o, pos_d, velocidades = pos_o[validas], pos_d[validas], velocidades[validas]
+
+        usados, inversa = np.unique(np.concatenate([pos_o, pos_d]), return_inverse=True)
+        u, v = inversa[:len(pos_o)], inversa[len(pos_o):]
+        coords = coords[ordem][usados]
+
+        rad = np.radians(coords)
+        km = _haversine(rad[u, 0], rad[u, 1], rad[v, 0], rad[v, 1])
+        minutos = km / velocidades * 60
+        n = len(coords)
+        grafo_distancia = _csr(u, v, km, n)
+
+        _, rotulos = connected_components(grafo_distancia, directed=True, connection="strong")
+        maior = rotulos == np.bincount(rotulos).argmax()
+        mapa = np.cumsum(maior) - 1
+        manter = maior[u] & maior[v]
+        u, v, km, minutos = mapa[u[manter]], mapa[v[manter]], km[manter], minutos[manter]
+        coords = coords[maior]
+        n = len(coords)
+
+        h = hashlib.sha256(coords.tobytes())
+        for parte in (u, v, km, minutos):
+            h.update(np.ascontiguousarray(parte).tobytes())
+        malha = cls(coords, _csr(u, v, km, n), _csr(u, v, minutos, n), h.hexdigest())
+        logging.info(f"Malha viária carregada de {caminho}: {n} nós, {malha.grafo_distancia.nnz} arestas.")
+        return malha
+
+    def salvar(self, caminho):
+        """
+        Grava a malha compilada (.npz), para não reprocessar o XML.
+        """
+        dados = {"coords": self.coords, "assinatura": np.array(self.assinatura)}
+        for nome, grafo in (("distancia", self.grafo_distancia), ("duracao", self.grafo_duracao)):
+            dados[f"{nome}_dados"] = grafo.data
+            dados[f"{nome}_indices"] = grafo.indices
+            dados[f"{nome}_indptr"] = grafo.indptr
+        with open(caminho + ".tmp", "wb") as f:
+            np.savez(f, **dados)
+        os.replace(caminho + ".tmp", caminho)
+
+    @classmethod
+    def carregar(cls, caminho):
+        with np.load(caminho) as dados:
+            n = len(dados["coords"])
+            grafos = [csr_matrix((dados[f"{nome}_dados"], dados[f"{nome}_indices"], dados[f"{nome}_indptr"]),
+                                 shape=(n, n)) for nome in ("distancia", "duracao")]
+            return cls(dados["coords"], grafos[0], grafos[1], str(dados["assinatura"]))
+
+    def no_mais_proximo(self, coords):
+        """
+        Nó da malha mais próximo de cada coordenada e a distância (km) até ele.
+        """
+        coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+        if self._arvore is None:
+            self._escala = np.array([1.0, np.cos(np.radians(self.coords[:, 0].mean()))])
+            self._arvore = cKDTree(np.radians(self.coords) * self._escala)
+        _, nos = self._arvore.query(np.radians(coords) * self._escala)
+        rad_c, rad_n = np.radians(coords), np.radians(self.coords[nos])
+        acesso = _haversine(rad_c[:, 0], rad_c[:, 1], rad_n[:, 0], rad_n[:, 1])
+        return nos, acesso
+
+    def _reverso(self, nome):
+        if nome not in self._reversos:
+            grafo = self.grafo_distancia if nome == "distancia" else self.grafo_duracao
+            self._reversos[nome] = grafo.T.tocsr()
+        return self._reversos[nome]
+
+    def _caminhos(self, grafo, fontes, alvos):
+        """
+        Custos dos caminhos mínimos de cada fonte a cada alvo, com o Dijkstra
+        executado em blocos de fontes para limitar a memória.
+        """
+        custos = np.empty((len(fontes), len(alvos)))
+        bloco = max(1, LIMITE_BLOCO_BYTES // (8 * len(self)))
+        for i in range(0, len(fontes), bloco):
+            custos[i:i + bloco] = dijkstra(grafo, indices=fontes[i:i + bloco])[:, alvos]
+        return custos
+
+    def matrizes(self, origens, destinos=None):
+        """
+        Matrizes de distância (km) e duração (minutos) entre as paradas.
+
+        Cada parada é ligada ao nó mais próximo da malha por um trecho em linha
+        reta; pares sem caminho na malha recebem a distância em linha reta
+        multiplicada por FATOR_DESVIO.
+
+        Retorna:
+          tuple: (distâncias, durações), arrays float32 de formato (N, M).
+        """
+        origens = np.asarray(origens, dtype=np.float64).reshape(-1, 2)
+        quadrada = destinos is None
+        destinos = origens if quadrada else np.asarray(destinos, dtype=np.float64).reshape(-1, 2)
+        nos_o, acesso_o = self.no_mais_proximo(origens)
+        nos_d, acesso_d = (nos_o, acesso_o) if quadrada else self.no_mais_proximo(destinos)
+        unicos_o, inv_o = np.unique(nos_o, return_inverse=True)
+        unicos_d, inv_d = np.unique(nos_d, return_inverse=True)
+
+        if len(unicos_d) < len(unicos_o):
+            # Menos destinos que origens: Dijkstra no grafo reverso, a partir dos destinos
+            dist = self._caminhos(self._reverso("distancia"), unicos_d, unicos_o).T
+            dur = self._caminhos(self._reverso("duracao"), unicos_d, unicos_o).T
+        else:
+            dist = self._caminhos(self.grafo_distancia, unicos_o, unicos_d)
+            dur = self._caminhos(self.grafo_duracao, unicos_o, unicos_d)
+
+        acesso = acesso_o[:, np.newaxis] + acesso_d[np.newaxis, :]
+        distancias = dist[inv_o][:, inv_d] + acesso
+        duracoes = dur[inv_o][:, inv_d] + acesso / VELOCIDADE_ACESSO_KMH * 60
+
+        sem_caminho = ~np.isfinite(distancias) | ~np.isfinite(duracoes)
+        if sem_caminho.any():
+            logging.warning(f"{int(sem_caminho.sum())} pares sem caminho na malha viária; "
+                            f"usando a linha reta × {FATOR_DESVIO}.")
+            rad_o, rad_d = np.radians(origens), np.radians(destinos)
+            reta = _haversine(rad_o[:, 0][:, np.newaxis], rad_o[:, 1][:, np.newaxis],
+                              rad_d[:, 0][np.newaxis, :], rad_d[:, 1][np.newaxis, :]) * FATOR_DESVIO
+            distancias = np.where(sem_caminho, reta, distancias)
+            duracoes = np.where(sem_caminho, reta / VELOCIDADE_ACESSO_KMH * 60, duracoes)
+
+        distancias, duracoes = distancias.astype(np.float32), duracoes.astype(np.float32)
+        if quadrada:
+            np.fill_diagonal(distancias, 0.0)
+            np.fill_diagonal(duracoes, 0.0)
+        return distancias, duracoes
+
+
+def obter_malha(caminho=MALHA_VIARIA_OSM):
+    """
+    Malha do extrato OSM, carregada uma vez por processo. Usa o grafo
+    compilado (<extrato>.npz) quando ele é mais novo que o extrato.
+
+    Retorna:
+      MalhaViaria, ou None se não houver extrato nem grafo compilado.
+    """
+    with _lock:
+        if caminho in _malhas:
+            return _malhas[caminho]
+        compilado = caminho if caminho.endswith(".npz") else caminho + ".npz"
+        if os.path.exists(compilado) and (not os.path.exists(caminho) or
+                                          os.path.getmtime(compilado) >= os.path.getmtime(caminho)):
+            malha = MalhaViaria.carregar(compilado)
+        elif os.path.exists(caminho):
+            malha = MalhaViaria.de_osm(caminho)
+            try:
+                malha.salvar(compilado)
+            except OSError as e:
+                logging.warning(f"Não foi possível gravar a malha compilada: {e}")
+        else:
+            return None
+        _malhas[caminho] = malha
+        return malha
+
+
+def _chave_matrizes(malha, origens, destinos):
+    h = hashlib.sha256(malha.assinatura.encode("utf-8"))
+    h.update(np.round(np.asarray(origens, dtype=np.float64), 6).tobytes())
+    h.update(b"|" if destinos is None else np.round(np.asarray(destinos, dtype=np.float64), 6).tobytes())
+    return h.hexdigest()
+
+
+def _limpar_pasta(pasta):
+    # Mantém apenas os MAX_MATRIZES_DISCO conjuntos de matrizes mais recentes
+    arquivos = sorted((os.path.join(pasta, nome) for nome in os.listdir(pasta) if nome.endswith(".npz")),
+                      key=os.path.getmtime)
+    for caminho in arquivos[:-MAX_MATRIZES_DISCO]:
+        try:
+            os.remove(caminho)
+        except OSError:
+            pass
+
+
+def matrizes_viarias(origens, destinos=None, malha=None, pasta=PASTA_MATRIZES):
+    """
+    Matrizes de distância (km) e duração (minutos) pela malha viária, com
+    cache em disco pelo conjunto de paradas.
+
+    Parâmetros:
+      origens (array-like): Coordenadas (N, 2) com latitude e longitude.
+      destinos (array-like): Coordenadas (M, 2). Se None, usa as origens (N×N).
+      malha (MalhaViaria): Malha a usar; se None, usa obter_malha().
+      pasta (str): Pasta do cache; None desativa o cache.
+
+    Retorna:
+      tuple: (distâncias, durações), arrays float32.
+    """
+    malha = malha or obter_malha()
+    if malha is None:
+        raise FileNotFoundError(f"Extrato OSM não encontrado: {MALHA_VIARIA_OSM}")
+    origens = np.asarray(origens, dtype=np.float64).reshape(-1, 2)
+    if destinos is not None:
+        destinos = np.asarray(destinos, dtype=np.float64).reshape(-1, 2)
+
+    caminho = os.path.join(pasta, f"{_chave_matrizes(malha, origens, destinos)}.npz") if pasta else None
+    if caminho and os.path.exists(caminho):
+        with np.load(caminho) as dados:
+            return dados["distancias"], dados["duracoes"]
+
+    distancias, duracoes = malha.matrizes(origens, destinos)
+    if caminho:
+        os.makedirs(pasta, exist_ok=True)
+        with open(caminho + ".tmp", "wb") as f:
+            np.savez(f, distancias=distancias, duracoes=duracoes)
+        os.replace(caminho + ".tmp", caminho)
+        _limpar_pasta(pasta)
+    return distancias, duracoes
@@ -0,0 +1,254 @@
+"""
+Módulo de mapas
+
+Monta os mapas Folium dos pedidos a partir de arrays (sem iterrows):
+  - os pedidos viram uma única camada GeoJSON de círculos ou, para entradas
+    grandes, um FastMarkerCluster cujos marcadores são criados no navegador;
+  - a cor de cada pedido vem da região ou da placa;
+  - a rota de cada caminhão é desenhada como uma polilinha a partir do
+    ponto de partida, na ordem de visita;
+  - o HTML renderizado fica em cache (memória e disco) pelo hash dos dados
+    desenhados, para que /mapa não refaça o mapa a cada requisição.
+"""
+
+import hashlib
+import html
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import folium
+import numpy as np
+import pandas as pd
+from folium.plugins import FastMarkerCluster
+
+from config import DATABASE_FOLDER, endereco_partida_coords
+from instrumentacao import etapa
+
+PALETA = [
+    "#1f77b4", "#ff7f0e", "#2ca02c", "#d62728", "#9467bd", "#8c564b", "#e377c2", "#7f7f7f",
+    "#bcbd22", "#17becf", "#393b79", "#637939", "#8c6d31", "#843c39", "#7b4173", "#3182bd",
+]
+COR_PADRAO = "#3388ff"
+
+# Acima deste número de pedidos os marcadores são agrupados (FastMarkerCluster)
+LIMITE_AGRUPAMENTO = 1000
+
+# Colunas usadas para colorir os pedidos, em ordem de preferência
+COLUNAS_COR = ["Placa VRP", "Placa", "Regiao"]
+COLUNAS_ORDEM = ["Ordem VRP", "Ordem de Entrega TSP", "Ordem na Regiao"]
+
+PASTA_MAPAS = os.path.join(DATABASE_FOLDER, "mapas")
+MAX_MAPAS_MEMORIA = 8
+MAX_MAPAS_DISCO = 50
+
+# Cache LRU em memória, compartilhado pelas threads do servidor (/mapa)
+_mapas_html = OrderedDict()
+_mapas_lock = threading.Lock()
+
+# Criado no navegador para cada linha [lat, lon, cor, popup] do FastMarkerCluster
+_CALLBACK_MARCADOR = """
+function (linha) {
+    var marcador = L.circleMarker(new L.LatLng(linha[0], linha[1]),
+        {radius: 6, color: linha[2], fillColor: linha[2], fillOpacity: 0.8, weight: 1});
+    marcador.bindPopup(linha[3]);
+    return marcador;
+}
+"""
+
+
+def paleta_grupos(valores):
+    """
+    Cor de cada grupo (região, placa...), em ordem estável dos grupos.
+
+    Retorna:
+      dict: {grupo como texto: cor}.
+    """
+    grupos = pd.Series(valores).dropna().astype(str).str.strip()
+    grupos = sorted(grupos[grupos != ""].unique())
+    return {grupo: PALETA[i % len(PALETA)] for i, grupo in enumerate(grupos)}
+
+
+def cores_por_grupo(valores, paleta):
+    """
+    Cor de cada elemento, de acordo com o grupo a que pertence.
+    """
+    valores = pd.Series(valores)
+    cores = valores.astype(str).map(paleta).where(valores.notna(), COR_PADRAO)
+    return cores.fillna(COR_PADRAO).to_numpy(dtype=object)
+
+
+def _coluna_existente(df, colunas):
+    return next((c for c in colunas if c in df.columns and df[c].notna().any()), None)
+
+
+def _texto(serie):
+    # Nulos viram texto vazio (no pandas 3, astype(str) mantém os NaN)
+    return serie.astype(object).where(serie.notna(), "").astype(str)
+
+
+def _textos_popup(df, coluna_popup, coluna_cor):
+    textos = _texto(df[coluna_popup]) if coluna_popup in df.columns \
+        else pd.Series("Sem endereço", index=df.index)
+    textos = textos.map(html.escape)
+    if coluna_cor is not None:
+        textos = textos + "<br>" + coluna_cor + ": " + _texto(df[coluna_cor]).map(html.escape)
+    return textos.to_numpy()
+
+
+def camada_pedidos(df, coluna_cor=None, coluna_popup="Endereço Completo", agrupar=None, paleta=None):
+    """
+    Camada com um marcador por pedido, montada a partir das colunas.
+
+    Parâmetros:
+      coluna_cor (str): Coluna que define a cor (ex.: 'Regiao' ou 'Placa').
+      agrupar (bool): Usa FastMarkerCluster; se None, agrupa acima de LIMITE_AGRUPAMENTO.
+      paleta (dict): Cores dos grupos; se None, é calculada a partir de coluna_cor.
+    """
+    lat = df['Latitude'].to_numpy(dtype=np.float64)
+    lon = df['Longitude'].to_numpy(dtype=np.float64)
+    validos = np.isfinite(lat) & np.isfinite(lon)
+    df, lat, lon = df[validos], lat[validos], lon[validos]
+    if coluna_cor:
+        cores = cores_por_grupo(df[coluna_cor], paleta if paleta is not None else paleta_grupos(df[coluna_cor]))
+    else:
+        cores = np.full(len(df), COR_PADRAO, dtype=object)
+    popups = _textos_popup(df, coluna_popup, coluna_cor)
+
+    if agrupar is None:
+        agrupar = len(df) > LIMITE_AGRUPAMENTO
+    if agrupar:
+        dados = [list(linha) for linha in zip(lat.tolist(), lon.tolist(), cores.tolist(), popups.tolist())]
+        return FastMarkerCluster(dados, callback=_CALLBACK_MARCADOR, name="Pedidos")
+
+    geojson = {
+        "type": "FeatureCollection",
+        "features": [
+            {"type": "Feature",
+             "geometry": {"type": "Point", "coordinates": [x, y]},
+             "properties": {"cor": c, "popup": p}}
+            for y, x, c, p in zip(lat.tolist(), lon.tolist(), cores.tolist(), popups.tolist())
+        ],
+    }
+    return folium.GeoJson(
+        geojson,
+        name="Pedidos",
+        marker=folium.CircleMarker(radius=6, weight=1, fill_opacity=0.8),
+        style_function=lambda feature: {"color": feature["properties"]["cor"],
+                                        "fillColor": feature["properties"]["cor"]},
+        popup=folium.GeoJsonPopup(fields=["popup"], labels=False),
+    )
+
+
+def camada_rotas(df, coluna_grupo, coluna_ordem, deposito=endereco_partida_coords, paleta=None):
+    """
+    Uma polilinha por caminhão (ou região), saindo e voltando ao ponto de
+    partida na ordem de visita.
+    """
+    camada = folium.FeatureGroup(name="Rotas")
+    # Pedidos sem caminhão (placa nula ou vazia) não entram em nenhuma rota
+    validos = (df[coluna_grupo].notna() & (df[coluna_grupo].astype(str).str.strip() != "")).to_numpy() \
+        & df[coluna_ordem].notna().to_numpy()
+    df = df[validos]
+    if df.empty:
+        return camada
+    grupos = df[coluna_grupo].astype(str).to_numpy()
+    ordem = np.lexsort((pd.to_numeric(df[coluna_ordem], errors="coerce").to_numpy(), grupos))
+    coords = df[['Latitude', 'Longitude']].to_numpy(dtype=np.float64)[ordem]
+    grupos = grupos[ordem]
+    inicios = np.flatnonzero(np.r_[True, grupos[1:] != grupos[:-1]])
+    paleta = paleta if paleta is not None else paleta_grupos(df[coluna_grupo])
+    partida = np.asarray(deposito, dtype=np.float64).reshape(1, 2)
+    for inicio, trecho in zip(inicios, np.split(coords, inicios[1:])):
+        grupo = grupos[inicio]
+        folium.PolyLine(
+            np.vstack([partida, trecho, partida]).tolist(),
+            color=paleta.get(grupo, COR_PADRAO), weight=3, opacity=0.8,
+            tooltip=f"{coluna_grupo}: {html.escape(grupo)} ({len(trecho)} pedidos)"
+        ).add_to(camada)
+    return camada
+
+
+@etapa("mapa")
+def criar_mapa(pedidos_df, coluna_cor=None, rotas=True, agrupar=None, deposito=endereco_partida_coords):
+    """
+    Cria o mapa dos pedidos, coloridos por placa ou região, com as rotas de
+    cada caminhão quando houver uma coluna de ordem de visita.
+
+    Parâmetros:
+      coluna_cor (str): Coluna das cores; se None, usa a primeira de COLUNAS_COR presente.
+      rotas (bool): Desenha as rotas quando houver coluna de ordem.
+      agrupar (bool): Agrupa os marcadores (ver camada_pedidos).
+    """
+    mapa = folium.Map(location=list(deposito), zoom_start=12, prefer_canvas=True)
+    folium.Marker(list(deposito), tooltip="Ponto de partida", icon=folium.Icon(color="black", icon="home")).add_to(mapa)
+    if pedidos_df.empty:
+        return mapa
+
+    coluna_cor = coluna_cor or _coluna_existente(pedidos_df, COLUNAS_COR)
+    paleta = paleta_grupos(pedidos_df[coluna_cor]) if coluna_cor else {}
+    camada_pedidos(pedidos_df, coluna_cor, agrupar=agrupar, paleta=paleta).add_to(mapa)
+    coluna_ordem = _coluna_existente(pedidos_df, COLUNAS_ORDEM)
+    if rotas and coluna_cor and coluna_ordem:
+        camada_rotas(pedidos_df, coluna_cor, coluna_ordem, deposito, paleta=paleta).add_to(mapa)
+
+    lat = pedidos_df['Latitude'].to_numpy(dtype=np.float64)
+    lon = pedidos_df['Longitude'].to_numpy(dtype=np.float64)
+    if np.isfinite(lat).any():
+        mapa.fit_bounds([[np.nanmin(lat), np.nanmin(lon)], [np.nanmax(lat), np.nanmax(lon)]])
+    folium.LayerControl().add_to(mapa)
+    return mapa
+
+
+def hash_mapa(pedidos_df, **opcoes):
+    """
+    Hash dos dados que aparecem no mapa (coordenadas, cores, ordem, popups) e das opções.
+    """
+    colunas = [c for c in ['Latitude', 'Longitude', 'Endereço Completo'] + COLUNAS_COR + COLUNAS_ORDEM
+               if c in pedidos_df.columns]
+    h = hashlib.sha256(json.dumps([colunas, opcoes], sort_keys=True, default=str).encode("utf-8"))
+    h.update(pd.util.hash_pandas_object(pedidos_df[colunas], index=False).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+def _limpar_pasta(pasta):
+    # Mantém apenas os MAX_MAPAS_DISCO mapas mais recentes
+    arquivos = sorted((os.path.join(pasta, nome) for nome in os.listdir(pasta) if nome.endswith(".html")),
+                      key=os.path.getmtime)
+    for caminho in arquivos[:-MAX_MAPAS_DISCO]:
+        try:
+            os.remove(caminho)
+        except OSError:
+            pass
+
+
+def html_mapa(pedidos_df, pasta=PASTA_MAPAS, **opcoes):
+    """
+    HTML do mapa dos pedidos, reaproveitado da memória ou do disco quando os
+    mesmos dados já foram desenhados.
+    """
+    chave = hash_mapa(pedidos_df, **opcoes)
+    with _mapas_lock:
+        if chave in _mapas_html:
+            _mapas_html.move_to_end(chave)
+            return _mapas_html[chave]
+
+    caminho = os.path.join(pasta, f"{chave}.html") if pasta else None
+    if caminho and os.path.exists(caminho):
+        with open(caminho, encoding="utf-8") as f:
+            conteudo = f.read()
+    else:
+        conteudo = criar_mapa(pedidos_df, **opcoes).get_root().render()
+        if caminho:
+            os.makedirs(pasta, exist_ok=True)
+            with open(caminho + ".tmp", "w", encoding="utf-8") as f:
+                f.write(conteudo)
+            os.replace(caminho + ".tmp", caminho)
+            _limpar_pasta(pasta)
+
+    with _mapas_lock:
+        _mapas_html[chave] = conteudo
+        while len(_mapas_html) > MAX_MAPAS_MEMORIA:
+            _mapas_html.popitem(last=False)
+    return conteudo
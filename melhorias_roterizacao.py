@@ -1,8 +1,13 @@
+import time
 import numpy as np
 import pandas as pd
 from geopy.distance import geodesic
-from sklearn.cluster import KMeans
+from agrupamento import agrupar_coordenadas
 import streamlit as st
+from config import METODO_DISTANCIA
+from cache_distancias import matriz_distancias_cache
+from busca_local_tsp import tolerancia
+from decomposicao_regional import roteirizar_por_regiao
 
 def calcular_distancia(coord1, coord2):
     """
@@ -16,18 +21,13 @@ def calcular_distancia(coord1, coord2):
 
 def gerar_matriz_distancias(pedidos_df):
     """
-    Gera uma matriz de distâncias com base nas coordenadas dos pedidos.
+    Gera uma matriz de distâncias (em km, float32) com base nas coordenadas dos pedidos.
+    Os pares já calculados em execuções anteriores vêm do cache de distâncias.
     """
-    coords = list(zip(pedidos_df['Latitude'], pedidos_df['Longitude']))
-    n = len(coords)
-    matriz = np.zeros((n, n))
-    for i in range(n):
-        for j in range(n):
-            if i != j:
-                matriz[i][j] = calcular_distancia(coords[i], coords[j])
-            else:
-                matriz[i][j] = 0
-    return matriz
+    if pedidos_df.empty:
+        return np.zeros((0, 0), dtype=np.float32)
+    return matriz_distancias_cache(pedidos_df[['Latitude', 'Longitude']].to_numpy(dtype=np.float64),
+                                   metodo=METODO_DISTANCIA)
 
 def tsp_nearest_neighbor(pedidos_df):
     """
@@ -62,56 +62,117 @@ def route_distance(rota, matriz):
         dist += matriz[rota[i]][rota[i+1]]
     return dist
 
-def otimizacao_2opt(rota, matriz):
+def _delta_2opt(rota, matriz, i, j):
+    """
+    Variação da distância ao inverter rota[i:j], considerando só as arestas
+    trocadas: (i-1, i) e (j-1, j). Em j == len(rota) não há aresta final.
+    """
+    a, b, c = rota[i - 1], rota[i], rota[j - 1]
+    delta = matriz[a][c] - matriz[a][b]
+    if j < len(rota):
+        d = rota[j]
+        delta += matriz[b][d] - matriz[c][d]
+    return delta
+
+def _deltas_2opt_vetorizado(rota, matriz, i):
+    """
+    Variações de todas as inversões rota[i:j], j = i+2..n, de uma só vez.
+    """
+    a, b = rota[i - 1], rota[i]
+    fins = rota[i + 1:]
+    seguintes = rota[i + 2:]
+    deltas = matriz[a, fins] - matriz[a, b]
+    deltas[:-1] += matriz[b, seguintes] - matriz[fins[:-1], seguintes]
+    return deltas
+
+def otimizacao_2opt(rota, matriz, modo="primeira", tempo_limite=None, vetorizado=False):
     """
     Melhora a rota do TSP utilizando a heurística 2-opt.
+
+    Cada movimento é avaliado apenas pela diferença das duas arestas trocadas
+    (O(1)) e aplicado na própria rota, sem copiá-la. O primeiro ponto da rota
+    (partida) permanece fixo. A avaliação é feita em float64, com tolerância
+    relativa às distâncias (ver busca_local_tsp.tolerancia).
+
+    Parâmetros:
+      rota (list): Ordem dos índices da rota (caminho aberto).
+      matriz (np.ndarray): Matriz de distâncias. O delta supõe simetria: uma
+        matriz assimétrica (METODO_DISTANCIA="viaria") é otimizada pela média
+        dos dois sentidos; a distância real vem de route_distance na matriz original.
+      modo (str): "primeira" aplica a primeira melhoria encontrada;
+        "melhor" aplica a melhor melhoria de cada passada.
+      tempo_limite (float): Tempo máximo em segundos (None para sem limite).
+      vetorizado (bool): Avalia todos os j de cada i de uma vez com NumPy.
+
+    Retorna:
+      list: Rota otimizada.
     """
-    best = rota
+    if modo not in ("primeira", "melhor"):
+        raise ValueError(f"Modo de 2-opt não suportado: {modo}")
+    matriz = np.asarray(matriz, dtype=np.float64)
+    if not np.allclose(matriz, matriz.T):
+        matriz = (matriz + matriz.T) / 2
+    best = np.asarray(rota, dtype=np.intp).copy()
+    n = len(best)
+    prazo = time.monotonic() + tempo_limite if tempo_limite else None
+    eps = tolerancia(matriz) if matriz.size else 1e-9
+
     improved = True
     while improved:
         improved = False
-        for i in range(1, len(rota) - 2):
-            for j in range(i + 1, len(rota)):
-                if j - i == 1:  # segue vizinhos adjacentes sem alteração
-                    continue
-                new_route = best[:]
-                new_route[i:j] = best[j - 1:i - 1:-1]
-                if route_distance(new_route, matriz) < route_distance(best, matriz):
-                    best = new_route
-                    improved = True
-        rota = best
-    return best
+        melhor_delta, melhor_movimento = -eps, None
+        for i in range(1, n - 1):
+            if prazo is not None and time.monotonic() > prazo:
+                return best.tolist()
+            if vetorizado:
+                deltas = _deltas_2opt_vetorizado(best, matriz, i)
+                k = int(np.argmin(deltas))
+                candidatos = [(float(deltas[k]), i + 2 + k)] if len(deltas) else []
+            else:
+                candidatos = ((_delta_2opt(best, matriz, i, j), j) for j in range(i + 2, n + 1))
+            for delta, j in candidatos:
+                if delta < melhor_delta:
+                    if modo == "primeira":
+                        best[i:j] = best[i:j][::-1]
+                        improved = True
+                        break
+                    melhor_delta, melhor_movimento = delta, (i, j)
+        if modo == "melhor" and melhor_movimento is not None:
+            i, j = melhor_movimento
+            best[i:j] = best[i:j][::-1]
+            improved = True
+    return best.tolist()
 
 def agrupar_por_regiao(pedidos_df, n_clusters=3):
     """
-    Agrupa os pedidos em regiões usando K-Means e adiciona a coluna 'Regiao' no DataFrame.
+    Agrupa os pedidos em regiões usando K-Means sobre as coordenadas projetadas
+    e adiciona a coluna 'Regiao' no DataFrame.
     """
     if pedidos_df.empty:
         pedidos_df['Regiao'] = []
         return pedidos_df
     coords = pedidos_df[['Latitude', 'Longitude']].values
-    kmeans = KMeans(n_clusters=n_clusters, random_state=42)
-    pedidos_df['Regiao'] = kmeans.fit_predict(coords)
+    pedidos_df['Regiao'], _ = agrupar_coordenadas(coords, n_clusters)
     return pedidos_df
 
-# Bloco de interface Streamlit para testes do TSP
-try:
-    pedidos_df = pd.read_excel("database/Pedidos.xlsx", engine="openpyxl")
-except Exception as e:
-    st.error("Planilha de Pedidos não encontrada. Envie a planilha de pedidos.")
-    pedidos_df = pd.DataFrame()
+# Bloco de interface Streamlit para testes do TSP (executado com "streamlit run";
+# não roda quando o módulo é importado, ex.: pelo benchmark)
+if __name__ == "__main__":
+    try:
+        pedidos_df = pd.read_excel("database/Pedidos.xlsx", engine="openpyxl")
+    except Exception as e:
+        st.error("Planilha de Pedidos não encontrada. Envie a planilha de pedidos.")
+        pedidos_df = pd.DataFrame()
 
-if st.button("Roteirizar"):
-    st.write("Roteirização em execução...")
-    # Agrupa os pedidos em 3 regiões
-    pedidos_df = agrupar_por_regiao(pedidos_df, n_clusters=3)
-    # Seleciona os pedidos da região 0 para rodar o TSP
-    pedidos_regiao = pedidos_df[pedidos_df['Regiao'] == 0].reset_index(drop=True)
-    if not pedidos_regiao.empty:
-        rota = tsp_nearest_neighbor(pedidos_regiao)
-        matriz = gerar_matriz_distancias(pedidos_regiao)
-        rota_otimizada = otimizacao_2opt(rota, matriz)
-        rota_enderecos = " → ".join(pedidos_regiao.loc[i, 'Endereço Completo'] for i in rota_otimizada)
-        st.success(f"Rota Otimizada: {rota_enderecos}")
-    else:
-        st.error("Não há pedidos na região selecionada para roteirização.")
\ No newline at end of file
+    if st.button("Roteirizar"):
+        st.write("Roteirização em execução...")
+        # Agrupa os pedidos em 3 regiões
+        pedidos_df = agrupar_por_regiao(pedidos_df, n_clusters=3)
+        # Roteiriza todas as regiões em paralelo, cada uma com a sua submatriz
+        if not pedidos_df.empty:
+            pedidos_df, distancias_regioes = roteirizar_por_regiao(pedidos_df)
+            for regiao, pedidos_regiao in pedidos_df.sort_values('Ordem na Regiao').groupby('Regiao'):
+                rota_enderecos = " → ".join(pedidos_regiao['Endereço Completo'])
+                st.success(f"Região {regiao} ({distancias_regioes[regiao]:.1f} km): {rota_enderecos}")
+        else:
+            st.error("Não há pedidos para roteirização.")
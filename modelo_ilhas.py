@@ -0,0 +1,119 @@
+"""
+Módulo do modelo de ilhas
+
+Executa várias populações de um algoritmo genético em paralelo, em um pool de
+processos, com migração periódica dos melhores indivíduos entre ilhas vizinhas
+(topologia em anel).
+
+O algoritmo é informado por duas funções que precisam ser serializáveis
+(funções de módulo ou functools.partial delas):
+  - inicializar(rng=...) -> população (np.ndarray, um indivíduo por linha);
+  - evoluir(populacao, geracoes=..., rng=...) -> (população, fitness), com
+    fitness maior sendo melhor.
+
+Cada ilha usa um gerador derivado de (seed, ilha, época), de modo que o
+resultado é o mesmo com ou sem pool de processos.
+"""
+
+import math
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+
+def _gerador(seed, ilha, epoca):
+    return np.random.default_rng(np.random.SeedSequence([seed, ilha, epoca]))
+
+
+def _executar_epoca(inicializar, evoluir, populacao, geracoes, seed, ilha, epoca):
+    """
+    Executa uma época (intervalo entre migrações) de uma ilha.
+    """
+    rng = _gerador(seed, ilha, epoca)
+    if populacao is None:
+        populacao = inicializar(rng=rng)
+    return evoluir(populacao, geracoes=geracoes, rng=rng)
+
+
+def migrar(populacoes, fitnesses, n_migrantes):
+    """
+    Copia os 'n_migrantes' melhores indivíduos de cada ilha para o lugar dos
+    piores da ilha seguinte no anel.
+    """
+    n_ilhas = len(populacoes)
+    if n_ilhas < 2 or n_migrantes <= 0:
+        return populacoes, fitnesses
+    migrantes = []
+    for populacao, fitness in zip(populacoes, fitnesses):
+        melhores = np.argsort(-fitness)[:n_migrantes]
+        migrantes.append((populacao[melhores].copy(), fitness[melhores].copy()))
+    for origem, (individuos, fitness_migrantes) in enumerate(migrantes):
+        destino = (origem + 1) % n_ilhas
+        piores = np.argsort(fitnesses[destino])[:len(individuos)]
+        populacoes[destino][piores] = individuos
+        fitnesses[destino][piores] = fitness_migrantes
+    return populacoes, fitnesses
+
+
+def executar_ilhas(inicializar, evoluir, n_ilhas=4, geracoes=100, intervalo_migracao=10,
+                   n_migrantes=2, seed=42, max_workers=None, progresso=None):
+    """
+    Executa o modelo de ilhas e retorna o melhor indivíduo encontrado.
+
+    Parâmetros:
+      inicializar (callable): Cria a população inicial de uma ilha.
+      evoluir (callable): Evolui uma população por um número de gerações.
+      n_ilhas (int): Número de populações independentes.
+      geracoes (int): Total de gerações de cada ilha.
+      intervalo_migracao (int): Gerações entre migrações.
+      n_migrantes (int): Indivíduos enviados por ilha a cada migração.
+      seed (int): Semente base; cada ilha deriva a sua a partir dela. Se None, é sorteada.
+      max_workers (int): Processos do pool. Se 1, executa sem pool.
+      progresso (callable): Chamado com a fração concluída ao fim de cada época.
+
+    Retorna:
+      dict: melhor indivíduo, seu fitness, a ilha que o produziu e o melhor
+      fitness final de cada ilha.
+    """
+    if n_ilhas < 1:
+        raise ValueError("O número de ilhas deve ser pelo menos 1.")
+    seed = np.random.SeedSequence().entropy if seed is None else seed
+    intervalo_migracao = max(1, min(intervalo_migracao, geracoes)) if geracoes > 0 else 1
+    n_epocas = max(1, math.ceil(geracoes / intervalo_migracao))
+    workers = min(n_ilhas, max_workers) if max_workers else n_ilhas
+
+    populacoes = [None] * n_ilhas
+    fitnesses = [None] * n_ilhas
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        for epoca in range(n_epocas):
+            geracoes_epoca = min(intervalo_migracao, geracoes - epoca * intervalo_migracao) if geracoes else 0
+            argumentos = [
+                (inicializar, evoluir, populacoes[ilha], geracoes_epoca, seed, ilha, epoca)
+                for ilha in range(n_ilhas)
+            ]
+            if executor is None:
+                resultados = [_executar_epoca(*args) for args in argumentos]
+            else:
+                resultados = list(executor.map(_executar_epoca, *zip(*argumentos)))
+            populacoes = [np.asarray(p) for p, _ in resultados]
+            fitnesses = [np.asarray(f, dtype=np.float64) for _, f in resultados]
+            if epoca + 1 < n_epocas:
+                populacoes, fitnesses = migrar(populacoes, fitnesses, n_migrantes)
+            if progresso is not None:
+                progresso((epoca + 1) / n_epocas)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    melhores_ilhas = [float(f.max()) for f in fitnesses]
+    ilha = int(np.argmax(melhores_ilhas))
+    melhor = int(np.argmax(fitnesses[ilha]))
+    logging.info(f"Modelo de ilhas: melhor fitness {melhores_ilhas[ilha]:.6f} na ilha {ilha}.")
+    return {
+        "individuo": populacoes[ilha][melhor],
+        "fitness": melhores_ilhas[ilha],
+        "ilha": ilha,
+        "fitness_ilhas": melhores_ilhas,
+    }
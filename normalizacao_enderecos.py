@@ -0,0 +1,146 @@
+"""
+Módulo de normalização de endereços
+
+Gera chaves canônicas para os endereços dos pedidos, de forma que variações
+como "Av. Brasil, 100" e "AVENIDA  BRASIL 100" resolvam para a mesma entrada
+do cache de geocodificação.
+
+- chave canônica: acentos removidos, caixa baixa, abreviações expandidas,
+  pontuação e espaços colapsados, CEP removido;
+- chave aproximada (fuzzy): conjunto ordenado das palavras relevantes da chave
+  canônica, que tolera troca de ordem e preposições ausentes;
+- CEP: extraído separadamente para restringir comparações por similaridade;
+- números: a similaridade só vale entre endereços com os mesmos números
+  ("rua x 100" e "rua x 108" são imóveis diferentes).
+"""
+
+import re
+import unicodedata
+from difflib import SequenceMatcher
+
+import pandas as pd
+
+# Abreviações comuns nos endereços das planilhas de pedidos
+ABREVIACOES = {
+    "av": "avenida", "avda": "avenida",
+    "r": "rua",
+    "al": "alameda",
+    "rod": "rodovia",
+    "estr": "estrada", "est": "estrada",
+    "pca": "praca", "pc": "praca",
+    "tv": "travessa", "trav": "travessa",
+    "lgo": "largo", "lg": "largo",
+    "jd": "jardim", "jdm": "jardim",
+    "vl": "vila",
+    "pq": "parque", "pque": "parque",
+    "res": "residencial",
+    "cj": "conjunto", "conj": "conjunto",
+    "ch": "chacara",
+    "fz": "fazenda", "faz": "fazenda",
+    "dist": "distrito",
+    "dr": "doutor",
+    "prof": "professor",
+    "eng": "engenheiro",
+    "gal": "general", "gen": "general",
+    "cel": "coronel",
+    "sta": "santa", "sto": "santo",
+}
+
+# Formas de "sem número" ("s/nº" vira "s/no" sem acentos); todas viram "sn"
+SEM_NUMERO = {"s/n", "s/no", "s/nro", "s/num", "s/numero"}
+
+# Marcadores de número que não fazem parte do endereço ("nº 100", "n. 100")
+MARCADORES_NUMERO = {"n", "no", "num", "numero", "nro"}
+
+# Tipos de logradouro: um marcador logo depois deles é o nome da rua ("Rua N, 100")
+TIPOS_LOGRADOURO = {"rua", "avenida", "alameda", "rodovia", "estrada", "praca", "travessa", "largo"}
+
+# Palavras ignoradas na chave aproximada
+PALAVRAS_IGNORADAS = {"de", "da", "do", "das", "dos", "e", "brasil"}
+
+PADRAO_CEP = re.compile(r"\b(\d{5})-?(\d{3})\b")
+PADRAO_NAO_ALFANUMERICO = re.compile(r"[^0-9a-z/]+")
+PADRAO_MILHAR = re.compile(r"(?<=\d)\.(?=\d{3}\b)")
+
+
+def remover_acentos(texto):
+    """
+    Remove acentos e diacríticos ("São João" -> "Sao Joao").
+    """
+    decomposto = unicodedata.normalize("NFKD", texto)
+    return "".join(c for c in decomposto if not unicodedata.combining(c))
+
+
+def extrair_cep(endereco):
+    """
+    Retorna o CEP do endereço no formato '00000000', ou None se não houver.
+    """
+    if endereco is None or pd.isnull(endereco):
+        return None
+    encontrado = PADRAO_CEP.search(str(endereco))
+    return encontrado.group(1) + encontrado.group(2) if encontrado else None
+
+
+def _tokens(endereco):
+    """
+    Quebra o endereço em palavras normalizadas, já sem o CEP.
+    """
+    texto = remover_acentos(PADRAO_CEP.sub(" ", str(endereco))).casefold()
+    texto = PADRAO_MILHAR.sub("", texto)
+    brutos = PADRAO_NAO_ALFANUMERICO.sub(" ", texto).split()
+
+    tokens = []
+    for i, token in enumerate(brutos):
+        if token in SEM_NUMERO:
+            tokens.append("sn")
+            continue
+        token = token.strip("/")
+        if not token:
+            continue
+        # "n 100", "no 100": descarta o marcador quando seguido de número e
+        # precedido do nome da rua (não só do tipo de logradouro)
+        if (token in MARCADORES_NUMERO and i + 1 < len(brutos) and brutos[i + 1][:1].isdigit()
+                and any(t not in TIPOS_LOGRADOURO for t in tokens)):
+            continue
+        tokens.append(ABREVIACOES.get(token, token))
+    return tokens
+
+
+def normalizar_endereco(endereco):
+    """
+    Retorna a chave canônica do endereço.
+
+    Exemplo:
+      "Av. São João, nº 1.000 - Centro, 01035-000" -> "avenida sao joao 1000 centro"
+    """
+    if endereco is None or pd.isnull(endereco):
+        return ""
+    return " ".join(_tokens(endereco))
+
+
+def chave_aproximada(endereco):
+    """
+    Retorna a chave aproximada do endereço: as palavras relevantes da chave
+    canônica, sem repetição e em ordem alfabética.
+    """
+    if endereco is None or pd.isnull(endereco):
+        return ""
+    return " ".join(sorted(set(_tokens(endereco)) - PALAVRAS_IGNORADAS))
+
+
+def similaridade(chave_1, chave_2):
+    """
+    Similaridade entre duas chaves canônicas, entre 0 e 1.
+    """
+    return SequenceMatcher(None, chave_1, chave_2).ratio()
+
+
+def numeros(chave):
+    """
+    Números da chave canônica (número do imóvel, "sn", numerais do
+    logradouro), na ordem em que aparecem.
+
+    Exemplo:
+      "rua 7 de setembro 100 centro" -> ("7", "100")
+    """
+    return tuple(token for token in chave.split() if token == "sn" or any(c.isdigit() for c in token))
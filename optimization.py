@@ -2,98 +2,196 @@
 Módulo de otimização
 
 Contém funções do algoritmo genético para otimização de cargas.
+
+A população é uma matriz inteira (indivíduos × pedidos) em que cada gene é o
+índice do caminhão que recebe o pedido. O fitness de toda a população é
+calculado em uma única passada vetorizada: as cargas por caminhão são somadas
+com np.bincount e as violações de capacidade (peso e caixas) são penalizadas.
+
+Com n_ilhas > 1 o algoritmo roda no modelo de ilhas (modelo_ilhas), com uma
+população por processo e migração periódica dos melhores indivíduos.
 """
 
-import random
 import numpy as np
 import logging
+from functools import partial
+
+from instrumentacao import etapa, incrementar
+from modelo_ilhas import executar_ilhas
 
 logging.basicConfig(level=logging.INFO, filename="optimization.log", filemode="a",
                     format="%(asctime)s - %(levelname)s - %(message)s")
 
-def populacao_inicial(pedidos_df, caminhoes_df, tamanho=50):
+# Peso da penalidade por excesso de capacidade (em frações da capacidade)
+PENALIDADE_EXCESSO = 10.0
+
+def preparar_dados(pedidos_df, caminhoes_df):
+    """
+    Extrai dos DataFrames os arrays usados pelo algoritmo genético.
+
+    Retorna:
+      dict: pesos e caixas por pedido (float64) e capacidades por caminhão.
+    """
+    if caminhoes_df.empty:
+        raise ValueError("Nenhum caminhão informado para o algoritmo genético.")
+    n_pedidos = len(pedidos_df)
+    n_caminhoes = len(caminhoes_df)
+
+    def coluna(df, nome, padrao, n):
+        if nome in df.columns:
+            return np.nan_to_num(df[nome].to_numpy(dtype=np.float64), nan=padrao)
+        return np.full(n, padrao, dtype=np.float64)
+
+    capac_kg = coluna(caminhoes_df, "Capac. Kg", np.inf, n_caminhoes)
+    capac_cx = coluna(caminhoes_df, "Capac. Cx", np.inf, n_caminhoes)
+    return {
+        "pesos": coluna(pedidos_df, "Peso dos Itens", 0.0, n_pedidos),
+        "caixas": coluna(pedidos_df, "Qtde. dos Itens", 0.0, n_pedidos),
+        "capac_kg": np.where(capac_kg > 0, capac_kg, 1e-9),
+        "capac_cx": np.where(capac_cx > 0, capac_cx, 1e-9),
+    }
+
+def populacao_inicial(n_pedidos, n_caminhoes, tamanho=50, rng=None):
     """
     Cria uma população inicial aleatória de soluções.
-    
-    Cada solução é um dicionário mapeando IDs de pedidos a IDs de caminhões.
-    
+
+    Cada solução é uma linha da matriz com o índice do caminhão de cada pedido.
+
     Retorna:
-      list: População de soluções.
-    """
-    population = []
-    pedidos_ids = pedidos_df.index.tolist()
-    caminhoes_ids = caminhoes_df.index.tolist()
-    for _ in range(tamanho):
-        sol = {pedido: random.choice(caminhoes_ids) for pedido in pedidos_ids}
-        population.append(sol)
-    return population
-
-def avaliacao_fitness(solucao, pedidos_df, caminhoes_df):
-    """
-    Calcula o fitness de uma solução.
-    
-    Exemplo: usa o inverso da soma dos 'Peso dos Itens'.
-    
+      np.ndarray: População (tamanho × n_pedidos) em int32.
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    return rng.integers(0, n_caminhoes, size=(tamanho, n_pedidos), dtype=np.int32)
+
+def cargas_por_caminhao(populacao, valores, n_caminhoes):
+    """
+    Soma 'valores' por caminhão para cada indivíduo da população.
+
+    Retorna:
+      np.ndarray: Matriz (indivíduos × caminhões).
+    """
+    tamanho = populacao.shape[0]
+    deslocamento = (np.arange(tamanho, dtype=np.int64) * n_caminhoes)[:, np.newaxis]
+    indices = (populacao + deslocamento).ravel()
+    somas = np.bincount(indices, weights=np.tile(valores, tamanho), minlength=tamanho * n_caminhoes)
+    return somas.reshape(tamanho, n_caminhoes)
+
+def avaliacao_fitness(populacao, dados):
+    """
+    Calcula o fitness de toda a população de uma vez.
+
+    A penalidade soma o excesso de peso e de caixas de cada caminhão (em frações
+    da sua capacidade) e a fração de caminhões utilizados, favorecendo soluções
+    viáveis e cargas consolidadas.
+
     Retorna:
-      float: Valor de fitness.
+      np.ndarray: Fitness de cada indivíduo (maior é melhor).
     """
-    fitness = 0
-    for pedido, caminhao in solucao.items():
-        fitness += pedidos_df.loc[pedido, "Peso dos Itens"]
-    return 1.0 / (fitness + 1e-6)
+    n_caminhoes = len(dados["capac_kg"])
+    carga_kg = cargas_por_caminhao(populacao, dados["pesos"], n_caminhoes)
+    carga_cx = cargas_por_caminhao(populacao, dados["caixas"], n_caminhoes)
+
+    excesso = (np.maximum(carga_kg - dados["capac_kg"], 0) / dados["capac_kg"]).sum(axis=1)
+    excesso += (np.maximum(carga_cx - dados["capac_cx"], 0) / dados["capac_cx"]).sum(axis=1)
+    usados = cargas_por_caminhao(populacao, np.ones(populacao.shape[1]), n_caminhoes) > 0
 
-def selecionar(population, fitnesses, num=10):
+    penalidade = PENALIDADE_EXCESSO * excesso + usados.sum(axis=1) / n_caminhoes
+    return 1.0 / (1.0 + penalidade)
+
+def selecionar(populacao, fitnesses, num=10):
     """
     Seleciona as melhores soluções com base em sua fitness.
-    
+
     Retorna:
-      list: Subconjunto da população.
+      np.ndarray: Subconjunto da população, do melhor para o pior.
     """
-    sorted_population = [sol for _, sol in sorted(zip(fitnesses, population), key=lambda x: x[0], reverse=True)]
-    return sorted_population[:num]
+    num = min(num, len(fitnesses))
+    melhores = np.argpartition(-fitnesses, num - 1)[:num]
+    melhores = melhores[np.argsort(-fitnesses[melhores])]
+    return populacao[melhores]
 
-def cruzar(sol1, sol2):
+def cruzar(pais, tamanho, rng):
     """
-    Realiza crossover entre duas soluções.
+    Gera 'tamanho' filhos por crossover uniforme entre pares aleatórios de pais.
     """
-    filho = {}
-    for key in sol1.keys():
-        filho[key] = sol1[key] if random.random() < 0.5 else sol2[key]
-    return filho
+    a = rng.integers(0, len(pais), size=tamanho)
+    b = (a + rng.integers(1, max(len(pais), 2), size=tamanho)) % len(pais)
+    mascara = rng.random((tamanho, pais.shape[1])) < 0.5
+    return np.where(mascara, pais[a], pais[b])
 
-def mutacao(solucao, caminhoes_ids, taxa=0.1):
+def mutacao(populacao, n_caminhoes, rng, taxa=0.1):
     """
-    Aplica mutação à solução, alterando mapeamentos aleatórios.
+    Aplica mutação à população, reatribuindo pedidos aleatórios a outros caminhões.
     """
-    for pedido in solucao.keys():
-        if random.random() < taxa:
-            solucao[pedido] = random.choice(caminhoes_ids)
-    return solucao
+    mascara = rng.random(populacao.shape) < taxa
+    populacao[mascara] = rng.integers(0, n_caminhoes, size=int(mascara.sum()), dtype=populacao.dtype)
+    return populacao
 
-def run_genetic_algorithm(pedidos_df, caminhoes_df, geracoes=100, tamanho_pop=50):
+def evoluir_populacao(populacao, dados, geracoes, rng, num_selecionados=10, n_elite=2, taxa_mutacao=0.1):
     """
-    Executa o algoritmo genético e retorna a melhor solução encontrada.
-    
+    Executa 'geracoes' gerações sobre a população informada.
+
+    Os 'n_elite' melhores indivíduos passam intactos para a geração seguinte.
+
     Retorna:
-      dict: Contendo a solução e o fitness.
+      tuple: (população final, fitness da população final).
     """
-    population = populacao_inicial(pedidos_df, caminhoes_df, tamanho=tamanho_pop)
-    pedidos_ids = pedidos_df.index.tolist()
-    caminhoes_ids = caminhoes_df.index.tolist()
-    melhor_solucao = None
-    melhor_fitness = -np.inf
+    n_caminhoes = len(dados["capac_kg"])
+    tamanho = populacao.shape[0]
+    fitnesses = avaliacao_fitness(populacao, dados)
     for _ in range(geracoes):
-        fitnesses = [avaliacao_fitness(sol, pedidos_df, caminhoes_df) for sol in population]
-        melhores = selecionar(population, fitnesses, num=10)
-        nova_pop = []
-        for _ in range(tamanho_pop):
-            sol1, sol2 = random.sample(melhores, 2)
-            filho = cruzar(sol1, sol2)
-            filho = mutacao(filho, caminhoes_ids)
-            nova_pop.append(filho)
-        population = nova_pop
-        melhor_iter = max(fitnesses)
-        if melhor_iter > melhor_fitness:
-            melhor_fitness = melhor_iter
-            melhor_solucao = population[fitnesses.index(melhor_iter)]
-    return {"solucao": melhor_solucao, "fitness": melhor_fitness}
\ No newline at end of file
+        melhores = selecionar(populacao, fitnesses, num=num_selecionados)
+        elite = melhores[:n_elite]
+        filhos = mutacao(cruzar(melhores, tamanho - len(elite), rng), n_caminhoes, rng, taxa=taxa_mutacao)
+        populacao = np.vstack([elite, filhos])
+        fitnesses = avaliacao_fitness(populacao, dados)
+    return populacao, fitnesses
+
+@etapa("alocacao_genetico")
+def run_genetic_algorithm(pedidos_df, caminhoes_df, geracoes=100, tamanho_pop=50, seed=None,
+                          n_ilhas=1, intervalo_migracao=10, max_workers=None, progresso=None):
+    """
+    Executa o algoritmo genético e retorna a melhor solução encontrada.
+
+    Parâmetros:
+      n_ilhas (int): Número de populações; acima de 1 usa o modelo de ilhas.
+      intervalo_migracao (int): Gerações entre migrações de elites entre ilhas.
+      max_workers (int): Processos usados pelas ilhas (padrão: uma por ilha).
+      progresso (callable): Recebe a fração concluída (0 a 1) durante a execução.
+
+    Retorna:
+      dict: Contendo a solução ({pedido: caminhão}), o fitness e a ilha vencedora.
+    """
+    dados = preparar_dados(pedidos_df, caminhoes_df)
+    if len(pedidos_df) == 0:
+        return {"solucao": {}, "fitness": 1.0, "ilha": 0}
+
+    if n_ilhas > 1:
+        resultado = executar_ilhas(
+            partial(populacao_inicial, len(pedidos_df), len(caminhoes_df), tamanho_pop),
+            partial(evoluir_populacao, dados=dados),
+            n_ilhas=n_ilhas, geracoes=geracoes, intervalo_migracao=intervalo_migracao,
+            seed=seed, max_workers=max_workers, progresso=progresso
+        )
+        melhor_individuo, melhor_fitness, ilha = resultado["individuo"], resultado["fitness"], resultado["ilha"]
+    else:
+        rng = np.random.default_rng(seed)
+        population = populacao_inicial(len(pedidos_df), len(caminhoes_df), tamanho=tamanho_pop, rng=rng)
+        # Evolui em blocos para informar o progresso; o resultado é o mesmo
+        # de uma única chamada, pois o gerador continua de onde parou
+        bloco = max(1, geracoes // 10) if progresso is not None else max(geracoes, 1)
+        feitas = 0
+        while True:
+            population, fitnesses = evoluir_populacao(population, dados, min(bloco, geracoes - feitas), rng)
+            feitas += min(bloco, geracoes - feitas)
+            if progresso is not None:
+                progresso(feitas / geracoes if geracoes else 1.0)
+            if feitas >= geracoes:
+                break
+        melhor = int(np.argmax(fitnesses))
+        melhor_individuo, melhor_fitness, ilha = population[melhor], float(fitnesses[melhor]), 0
+
+    incrementar("iteracoes_solver", geracoes * max(1, n_ilhas), solver="ga_alocacao")
+    caminhoes_ids = np.asarray(caminhoes_df.index.tolist(), dtype=object)
+    melhor_solucao = dict(zip(pedidos_df.index.tolist(), caminhoes_ids[melhor_individuo].tolist()))
+    return {"solucao": melhor_solucao, "fitness": melhor_fitness, "ilha": ilha}
@@ -1,47 +1,191 @@
+"""
+Módulo de aproveitamento da frota
+
+Aloca os pedidos de cada região aos caminhões disponíveis. Cada caminhão
+disponível pode receber uma carga por região. A alocação é um bin packing
+multidimensional (peso, caixas e número máximo de pedidos)
+resolvido de forma determinística:
+  - os pedidos são ordenados do maior para o menor (fração da maior capacidade);
+  - cada pedido vai para a carga já aberta mais justa em que cabe (best-fit)
+    ou para a primeira em que cabe (first-fit); se nenhuma servir, abre-se o
+    próximo caminhão, do maior para o menor.
+
+Opcionalmente, um modelo ILP (pulp/CBC) parte da solução heurística e tenta
+reduzir o número de cargas e de pedidos não alocados dentro de um tempo limite.
+"""
+
+import logging
+
+import numpy as np
 import streamlit as st
 
-def otimizar_aproveitamento_frota(pedidos_df, caminhoes_df, percentual_frota, max_pedidos, n_clusters=3):
+from instrumentacao import etapa
+
+def alocar_cargas(pesos, caixas, capac_kg, capac_cx, max_pedidos, modo="best_fit"):
+    """
+    Aloca pedidos em caminhões respeitando peso, caixas e máximo de pedidos.
+
+    Parâmetros:
+      pesos, caixas (np.ndarray): Demanda de cada pedido.
+      capac_kg, capac_cx (np.ndarray): Capacidade de cada caminhão.
+      max_pedidos (int): Máximo de pedidos por caminhão.
+      modo (str): "best_fit" ou "first_fit".
+
+    Retorna:
+      np.ndarray: Índice do caminhão de cada pedido (-1 se não couber em nenhum).
+    """
+    if modo not in ("best_fit", "first_fit"):
+        raise ValueError(f"Modo de alocação não suportado: {modo}")
+    pesos = np.asarray(pesos, dtype=np.float64)
+    caixas = np.asarray(caixas, dtype=np.float64)
+    capac_kg = np.asarray(capac_kg, dtype=np.float64)
+    capac_cx = np.asarray(capac_cx, dtype=np.float64)
+    alocacao = np.full(len(pesos), -1, dtype=np.int64)
+    if len(capac_kg) == 0 or len(pesos) == 0:
+        return alocacao
+
+    # Caminhões do maior para o menor; pedidos do maior para o menor
+    ordem_caminhoes = np.lexsort((-capac_cx, -capac_kg))
+    cap_kg = capac_kg[ordem_caminhoes]
+    cap_cx = capac_cx[ordem_caminhoes]
+    escala_kg = max(cap_kg.max(), 1e-9)
+    escala_cx = max(cap_cx.max(), 1e-9)
+    tamanho = np.maximum(pesos / escala_kg, caixas / escala_cx)
+    ordem_pedidos = np.lexsort((-pesos, -tamanho))
+
+    livre_kg = cap_kg.copy()
+    livre_cx = cap_cx.copy()
+    contagem = np.zeros(len(cap_kg), dtype=np.int64)
+    abertos = np.zeros(len(cap_kg), dtype=bool)
+
+    for pedido in ordem_pedidos:
+        cabe = (livre_kg >= pesos[pedido]) & (livre_cx >= caixas[pedido]) & (contagem < max_pedidos)
+        if not cabe.any():
+            continue
+        if modo == "first_fit":
+            escolhido = int(np.argmax(cabe))
+        else:
+            candidatos = cabe & abertos
+            if candidatos.any():
+                folga = (livre_kg - pesos[pedido]) / np.maximum(cap_kg, 1e-9) \
+                    + (livre_cx - caixas[pedido]) / np.maximum(cap_cx, 1e-9)
+                escolhido = int(np.argmin(np.where(candidatos, folga, np.inf)))
+            else:
+                escolhido = int(np.argmax(cabe))
+        abertos[escolhido] = True
+        livre_kg[escolhido] -= pesos[pedido]
+        livre_cx[escolhido] -= caixas[pedido]
+        contagem[escolhido] += 1
+        alocacao[pedido] = ordem_caminhoes[escolhido]
+    return alocacao
+
+def refinar_alocacao_ilp(pesos, caixas, capac_kg, capac_cx, max_pedidos, alocacao_inicial, tempo_limite=10):
+    """
+    Refina a alocação com programação inteira (pulp/CBC), partindo da solução
+    heurística. Minimiza, em ordem de prioridade, o peso não alocado e o
+    número de caminhões utilizados.
+
+    Retorna:
+      np.ndarray: Nova alocação, ou a inicial se o solver não a melhorar.
+    """
+    import pulp
+
+    n, m = len(pesos), len(capac_kg)
+    if n == 0 or m == 0:
+        return alocacao_inicial
+    problema = pulp.LpProblem("alocacao_frota", pulp.LpMinimize)
+    x = {(i, b): pulp.LpVariable(f"x_{i}_{b}", cat="Binary") for i in range(n) for b in range(m)}
+    y = [pulp.LpVariable(f"y_{b}", cat="Binary") for b in range(m)]
+    fora = [pulp.LpVariable(f"fora_{i}", cat="Binary") for i in range(n)]
+
+    peso_total = float(np.sum(pesos)) or 1.0
+    problema += (m + 1) * pulp.lpSum((1 + pesos[i] / peso_total) * fora[i] for i in range(n)) + pulp.lpSum(y)
+    for i in range(n):
+        problema += pulp.lpSum(x[i, b] for b in range(m)) + fora[i] == 1
+    for b in range(m):
+        problema += pulp.lpSum(pesos[i] * x[i, b] for i in range(n)) <= capac_kg[b] * y[b]
+        problema += pulp.lpSum(caixas[i] * x[i, b] for i in range(n)) <= capac_cx[b] * y[b]
+        problema += pulp.lpSum(x[i, b] for i in range(n)) <= max_pedidos * y[b]
+
+    # Solução inicial para o warm start do CBC
+    for i in range(n):
+        fora[i].setInitialValue(int(alocacao_inicial[i] < 0))
+        for b in range(m):
+            x[i, b].setInitialValue(int(alocacao_inicial[i] == b))
+    for b in range(m):
+        y[b].setInitialValue(int(np.any(alocacao_inicial == b)))
+
+    def custo(alocacao):
+        nao_alocados = alocacao < 0
+        return (m + 1) * float(np.sum(1 + pesos[nao_alocados] / peso_total)) + len(set(alocacao[~nao_alocados]))
+
+    status = problema.solve(pulp.PULP_CBC_CMD(msg=False, timeLimit=tempo_limite, warmStart=True))
+    if pulp.LpStatus[status] not in ("Optimal", "Not Solved") or problema.sol_status <= 0:
+        logging.info(f"ILP de alocação sem solução viável ({pulp.LpStatus[status]}); mantendo a heurística.")
+        return alocacao_inicial
+
+    alocacao = np.full(n, -1, dtype=np.int64)
+    for (i, b), variavel in x.items():
+        if (variavel.value() or 0) > 0.5:
+            alocacao[i] = b
+    return alocacao if custo(alocacao) < custo(alocacao_inicial) else alocacao_inicial
+
+@etapa("alocacao_frota")
+def otimizar_aproveitamento_frota(pedidos_df, caminhoes_df, percentual_frota, max_pedidos, n_clusters=3,
+                                  modo="best_fit", refinar_ilp=False, tempo_limite_ilp=10):
+    """
+    Agrupa os pedidos por região e aloca os pedidos de cada região aos
+    caminhões disponíveis, preenchendo as colunas 'Carga' e 'Placa'.
+
+    Pedidos que não cabem em nenhum caminhão ficam com Carga 0 e Placa vazia.
+    """
     # Inicializa as colunas de alocação
     pedidos_df['Carga'] = 0
     pedidos_df['Placa'] = ""
     carga_numero = 1
-    
-    # Ajusta a capacidade da frota com base no percentual informado
-    caminhoes_df['Capac. Kg'] *= (percentual_frota / 100)
-    caminhoes_df['Capac. Cx'] *= (percentual_frota / 100)
-    # Filtra somente os caminhões disponíveis ("Sim")
-    caminhoes_df = caminhoes_df[caminhoes_df['Disponível'] == 'Sim']
-    
-    # Agrupa os pedidos por região utilizando o valor informado em n_clusters (default=3)
-    from agrupar_por_regiao import agrupar_por_regiao
-    pedidos_df = agrupar_por_regiao(pedidos_df, n_clusters)
-    
+
+    # Filtra somente os caminhões disponíveis ("Sim") e ajusta a capacidade
+    # com base no percentual informado, sem alterar o DataFrame recebido
+    caminhoes_df = caminhoes_df[caminhoes_df['Disponível'] == 'Sim'].reset_index(drop=True)
+    capac_kg = caminhoes_df['Capac. Kg'].to_numpy(dtype=np.float64) * (percentual_frota / 100)
+    capac_cx = caminhoes_df['Capac. Cx'].to_numpy(dtype=np.float64) * (percentual_frota / 100)
+    placas = caminhoes_df['Placa'].to_numpy()
+
+    # Agrupa os pedidos por região utilizando o valor informado em n_clusters (default=3),
+    # a menos que já tenham sido agrupados antes
+    if 'Regiao' not in pedidos_df.columns:
+        from agrupar_por_regiao import agrupar_por_regiao
+        pedidos_df = agrupar_por_regiao(pedidos_df, n_clusters)
+
+    pesos = np.nan_to_num(pedidos_df['Peso dos Itens'].to_numpy(dtype=np.float64))
+    if 'Qtde. dos Itens' in pedidos_df.columns:
+        caixas = np.nan_to_num(pedidos_df['Qtde. dos Itens'].to_numpy(dtype=np.float64))
+    else:
+        caixas = np.zeros(len(pedidos_df))
+    regioes = pedidos_df['Regiao'].to_numpy()
+    cargas = np.zeros(len(pedidos_df), dtype=np.int64)
+    placas_pedidos = np.full(len(pedidos_df), "", dtype=object)
+
     # Para cada região, aloca os pedidos aos caminhões disponíveis
-    for regiao in pedidos_df['Regiao'].unique():
-        pedidos_regiao = pedidos_df[pedidos_df['Regiao'] == regiao]
-        for _, caminhao in caminhoes_df.iterrows():
-            capacidade_peso = caminhao['Capac. Kg']
-            capacidade_caixas = caminhao['Capac. Cx']
-            
-            # Seleciona pedidos que cabem nas capacidades do caminhão
-            pedidos_alocados = pedidos_regiao[
-                (pedidos_regiao['Peso dos Itens'] <= capacidade_peso) & 
-                (pedidos_regiao['Qtde. dos Itens'] <= capacidade_caixas)
-            ]
-            # Limita o número máximo de pedidos a serem alocados
-            pedidos_alocados = pedidos_alocados.sample(n=min(max_pedidos, len(pedidos_alocados)))
-            
-            if not pedidos_alocados.empty:
-                pedidos_df.loc[pedidos_alocados.index, 'Carga'] = carga_numero
-                pedidos_df.loc[pedidos_alocados.index, 'Placa'] = caminhao['Placa']
-                
-                # Atualiza as capacidades do caminhão
-                capacidade_peso -= pedidos_alocados['Peso dos Itens'].sum()
-                capacidade_caixas -= pedidos_alocados['Qtde. dos Itens'].sum()
-                carga_numero += 1
-
-    # Verifica se houve erro na alocação
-    if pedidos_df['Placa'].isnull().any() or pedidos_df['Carga'].isnull().any():
-        st.error("Não foi possível atribuir placas ou números de carga a alguns pedidos. Verifique os dados e tente novamente.")
-    
-    return pedidos_df
\ No newline at end of file
+    for regiao in sorted(set(regioes.tolist())):
+        posicoes = np.flatnonzero(regioes == regiao)
+        alocacao = alocar_cargas(pesos[posicoes], caixas[posicoes], capac_kg, capac_cx, max_pedidos, modo=modo)
+        if refinar_ilp:
+            alocacao = refinar_alocacao_ilp(pesos[posicoes], caixas[posicoes], capac_kg, capac_cx,
+                                            max_pedidos, alocacao, tempo_limite=tempo_limite_ilp)
+        for caminhao in sorted(set(alocacao[alocacao >= 0].tolist())):
+            selecionados = posicoes[alocacao == caminhao]
+            cargas[selecionados] = carga_numero
+            placas_pedidos[selecionados] = placas[caminhao]
+            carga_numero += 1
+
+    pedidos_df['Carga'] = cargas
+    pedidos_df['Placa'] = placas_pedidos
+
+    # Verifica se houve pedidos sem alocação
+    nao_alocados = int((cargas == 0).sum())
+    if nao_alocados:
+        st.warning(f"{nao_alocados} pedidos não couberam em nenhum caminhão disponível. "
+                   "Verifique a frota e o percentual de capacidade.")
+
+    return pedidos_df
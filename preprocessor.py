@@ -8,9 +8,12 @@ import pandas as pd
 import numpy as np
 import logging
 
+from instrumentacao import etapa
+
 logging.basicConfig(level=logging.INFO, filename="preprocessor.log", filemode="a",
                     format="%(asctime)s - %(levelname)s - %(message)s")
 
+@etapa("preprocessamento")
 def preprocessar_dados(df):
     """
     Pré-processa os dados:
@@ -0,0 +1,222 @@
+"""
+Módulo de reotimização incremental
+
+Atualiza a última roteirização quando pedidos entram ou são cancelados ao
+longo do dia, ou quando um caminhão sai da operação, sem refazer o
+agrupamento e a alocação de todos os pedidos:
+  1. os pedidos cancelados saem das rotas; os pedidos novos e os dos
+     caminhões indisponíveis ficam pendentes (os que já estavam sem
+     caminhão, somente se pedido);
+  2. cada pendente é inserido na posição viável mais barata, respeitando
+     capacidades e janelas de tempo (janelas_tempo.PlanoRotas);
+  3. uma busca local curta (realocação e troca de paradas) roda somente
+     entre as rotas alteradas; as demais mantêm a mesma sequência.
+
+As distâncias são calculadas somente para um subproblema: o depósito, os
+pendentes e as paradas das rotas candidatas (as alteradas, as donas das
+paradas mais próximas de cada pendente e as vazias). Assim a memória cresce
+com o tamanho da alteração, e não com o quadrado do número de pedidos do
+plano. Sem janelas de tempo, a matriz de durações não é montada.
+
+A solução vigente é guardada como snapshot (snapshot_planilhas) ao fim de
+cada roteirização e de cada reotimização.
+"""
+
+import logging
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+from agrupamento import projetar_coordenadas
+from busca_local_tsp import distancia_ciclo
+from cache_distancias import matriz_distancias_cache
+from config import METODO_DISTANCIA, endereco_partida_coords
+from exportacao import COLUNAS_ORDEM, coluna_manifesto, grupos_por_caminhao
+from instrumentacao import etapa
+from janelas_tempo import PlanoRotas, formatar_horario, janelas_nos, matriz_duracoes, tem_janelas
+from roteirizacao_vrp import dimensoes_capacidade
+from snapshot_planilhas import carregar_snapshot, salvar_snapshot
+
+NOME_SNAPSHOT = "solucao"
+
+# Paradas mais próximas de cada pendente cujas rotas entram no subproblema
+VIZINHOS_CANDIDATOS = 20
+
+
+def salvar_solucao(pedidos_df):
+    """
+    Guarda o DataFrame roteirizado como a solução vigente.
+    """
+    salvar_snapshot(NOME_SNAPSHOT, pedidos_df.reset_index(drop=True), datetime.now().strftime("%Y%m%d%H%M%S%f"))
+
+
+def carregar_solucao():
+    """
+    Retorna:
+      DataFrame: Cópia editável da solução vigente, ou None se não houver.
+    """
+    snapshot = carregar_snapshot(NOME_SNAPSHOT)
+    return None if snapshot is None else snapshot[0].copy()
+
+
+def _janelas(pedidos_df, coords, distancias):
+    # Sem janelas nos pedidos, o tempo não restringe as rotas (durações None)
+    if tem_janelas(pedidos_df):
+        return matriz_duracoes(coords, distancias=distancias / 1000), janelas_nos(pedidos_df)
+    n_nos = len(coords)
+    return None, (np.zeros(n_nos), np.full(n_nos, np.inf), np.zeros(n_nos))
+
+
+def _rotas_candidatas(rotas, pendentes, coords, vizinhos=VIZINHOS_CANDIDATOS):
+    """
+    Veículos que podem receber os pendentes: os donos das 'vizinhos' paradas
+    mais próximas de cada pendente (KD-tree nas coordenadas projetadas) e os
+    veículos ainda sem paradas.
+    """
+    candidatos = {v for v, rota in enumerate(rotas) if not rota}
+    em_rota = np.asarray([no for rota in rotas for no in rota], dtype=np.int64)
+    if not pendentes or not len(em_rota):
+        return candidatos
+    dono = np.repeat(np.arange(len(rotas)), [len(rota) for rota in rotas])
+    pontos = projetar_coordenadas(coords)
+    _, proximas = cKDTree(pontos[em_rota]).query(pontos[pendentes], k=min(vizinhos, len(em_rota)))
+    return candidatos | set(dono[np.ravel(proximas)].tolist())
+
+
+def _custo_rotas(coords, rotas):
+    """
+    Custo (m) das rotas fechadas no depósito (nó 0), rota a rota, pelo cache de distâncias.
+    """
+    total = 0.0
+    for rota in rotas:
+        if rota:
+            nos = np.asarray([0] + list(rota), dtype=np.int64)
+            matriz = matriz_distancias_cache(coords[nos], metodo=METODO_DISTANCIA).astype(np.float64)
+            total += distancia_ciclo(np.arange(len(nos)), matriz) * 1000
+    return total
+
+
+@etapa("reotimizacao")
+def reotimizar(solucao_df, caminhoes_df, novos_df=None, cancelados=(), indisponiveis=(), max_pedidos=None,
+               deposito=endereco_partida_coords, tempo_limite=5, reinserir_nao_atendidos=False):
+    """
+    Aplica pedidos novos, cancelamentos e caminhões indisponíveis à solução.
+
+    Parâmetros:
+      solucao_df (DataFrame): Última solução, com a placa ('Placa VRP' ou
+        'Placa') e a ordem de visita de cada pedido.
+      caminhoes_df (DataFrame): Frota com 'Placa', 'Capac. Kg', 'Capac. Cx' e 'Disponível'.
+      novos_df (DataFrame): Pedidos novos, já com 'Latitude' e 'Longitude'.
+      cancelados (iterable): 'Nº Pedido' dos pedidos cancelados (índices, sem essa coluna).
+      indisponiveis (iterable): Placas dos caminhões que saíram da operação.
+      max_pedidos (int): Máximo de pedidos por caminhão quando a frota não
+        tem a coluna 'Máx. Pedidos'.
+      deposito (tuple): Coordenadas do ponto de partida e chegada.
+      tempo_limite (float): Tempo máximo da busca local, em segundos.
+      reinserir_nao_atendidos (bool): Tenta inserir também os pedidos que já
+        estavam sem caminhão na solução anterior.
+
+    Retorna:
+      tuple: (DataFrame atualizado, resumo). O resumo traz 'rotas_alteradas'
+      (placas), 'inseridos', 'nao_atendidos' (índices no DataFrame),
+      'distancia_total' (m) e 'segundos'.
+    """
+    inicio = time.perf_counter()
+    coluna = coluna_manifesto(solucao_df)
+    coluna_ordem = next((c for c in COLUNAS_ORDEM if c in solucao_df.columns), "Ordem VRP")
+
+    identificadores = solucao_df["Nº Pedido"] if "Nº Pedido" in solucao_df.columns \
+        else pd.Series(solucao_df.index, index=solucao_df.index)
+    cancelados = list(cancelados)
+    cancelar = identificadores.isin(cancelados).to_numpy()
+    if int(cancelar.sum()) < len(set(cancelados)):
+        logging.warning("Reotimização: alguns pedidos cancelados não estão na solução.")
+
+    frota = caminhoes_df
+    if 'Disponível' in frota.columns:
+        frota = frota[frota['Disponível'] == 'Sim']
+    frota = frota[~frota['Placa'].astype(str).isin([str(p) for p in indisponiveis])]
+    if frota.empty:
+        raise ValueError("Nenhum caminhão disponível para a reotimização.")
+    placas = frota['Placa'].astype(str).tolist()
+
+    # Nós: depósito em 0, pedidos mantidos e depois os novos (posição + 1)
+    grupos = grupos_por_caminhao(solucao_df, coluna)
+    mantidos = solucao_df[~cancelar].copy()
+    mantidos[coluna] = mantidos[coluna].astype(object)
+    partes = [mantidos] if novos_df is None or novos_df.empty else [mantidos, novos_df]
+    pedidos_df = pd.concat(partes, ignore_index=True)
+    pedidos_df[coluna] = pedidos_df[coluna].astype(object)
+    nova_posicao = np.cumsum(~cancelar) - 1
+
+    rotas = []
+    afetados = set()
+    for veiculo, placa in enumerate(placas):
+        posicoes = grupos.get(placa, np.empty(0, dtype=np.int64))
+        if cancelar[posicoes].any():
+            afetados.add(veiculo)
+        rotas.append([int(nova_posicao[p]) + 1 for p in posicoes if not cancelar[p]])
+    em_rota = {no for rota in rotas for no in rota}
+    sem_caminhao = mantidos[coluna].isna().to_numpy() | (mantidos[coluna].astype(str).str.strip() == "").to_numpy()
+    pendentes = [no for no in range(1, len(pedidos_df) + 1) if no not in em_rota
+                 and (reinserir_nao_atendidos or no > len(mantidos) or not sem_caminhao[no - 1])]
+
+    coords = np.vstack([np.asarray(deposito, dtype=np.float64).reshape(1, 2),
+                        pedidos_df[['Latitude', 'Longitude']].to_numpy(dtype=np.float64)])
+
+    # Subproblema: depósito, pendentes e paradas das rotas candidatas (índices locais no plano)
+    candidatos = sorted(afetados | _rotas_candidatas(rotas, pendentes, coords))
+    nos = np.asarray([0] + sorted(set(pendentes).union(*(rotas[v] for v in candidatos))), dtype=np.int64)
+    local = {no: i for i, no in enumerate(nos.tolist())}
+    distancias = matriz_distancias_cache(coords[nos], metodo=METODO_DISTANCIA).astype(np.float64) * 1000
+    duracoes, janelas = _janelas(pedidos_df.iloc[nos[1:] - 1], coords[nos], distancias)
+    dimensoes = dimensoes_capacidade(pedidos_df, frota, max_pedidos)
+    plano = PlanoRotas([[local[no] for no in rotas[v]] for v in candidatos], distancias, duracoes, *janelas,
+                       np.column_stack([d for _, d, _ in dimensoes])[nos],
+                       np.column_stack([c for _, _, c in dimensoes])[candidatos])
+    inviaveis = [placas[candidatos[i]] for i, agenda in enumerate(plano.agendas) if not agenda.viavel]
+    if inviaveis:
+        logging.warning(f"Reotimização: rotas fora das janelas de tempo na solução anterior: {inviaveis}.")
+
+    antes = [list(rota) for rota in plano.rotas]
+    sobras = nos[plano.inserir_pendentes([local[no] for no in pendentes])].tolist()
+    alterados = {i for i, v in enumerate(candidatos) if v in afetados or plano.rotas[i] != antes[i]}
+    if alterados:
+        plano.busca_local(veiculos=sorted(alterados), tempo_limite=tempo_limite)
+    afetados = {candidatos[i] for i in alterados}
+
+    for i in sorted(alterados):
+        linhas = nos[plano.rotas[i]] - 1
+        if len(linhas):
+            pedidos_df.loc[linhas, coluna] = placas[candidatos[i]]
+            pedidos_df.loc[linhas, coluna_ordem] = np.arange(1, len(linhas) + 1)
+    nao_atendidos = sorted(set(sobras) | (set(np.flatnonzero(sem_caminhao) + 1) - set(pendentes)))
+    if sobras:
+        linhas = np.asarray(sobras, dtype=np.int64) - 1
+        pedidos_df.loc[linhas, coluna] = None
+        pedidos_df.loc[linhas, coluna_ordem] = np.nan
+        if 'Horário VRP' in pedidos_df.columns:
+            pedidos_df.loc[linhas, 'Horário VRP'] = ""
+    if tem_janelas(pedidos_df):
+        # As rotas fora do subproblema mantêm os horários da solução anterior
+        for i in sorted(alterados):
+            if plano.rotas[i]:
+                pedidos_df.loc[nos[plano.rotas[i]] - 1, 'Horário VRP'] = \
+                    [formatar_horario(h) for h in plano.agendas[i].chegadas()]
+
+    no_plano = set(candidatos)
+    fora_do_plano = [rota for v, rota in enumerate(rotas) if v not in no_plano]
+    resumo = {
+        "rotas_alteradas": [placas[v] for v in sorted(afetados)],
+        "inseridos": len(pendentes) - len(sobras),
+        "nao_atendidos": [no - 1 for no in nao_atendidos],
+        "distancia_total": plano.custo_total() + _custo_rotas(coords, fora_do_plano),
+        "segundos": time.perf_counter() - inicio,
+    }
+    logging.info(f"Reotimização: {int(cancelar.sum())} cancelados, {resumo['inseridos']} inseridos, "
+                 f"{len(nao_atendidos)} sem caminhão; {len(afetados)} de {len(placas)} rotas alteradas "
+                 f"em {resumo['segundos']:.2f} s.")
+    return pedidos_df, resumo
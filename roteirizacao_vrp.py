@@ -0,0 +1,259 @@
+"""
+Módulo de roteirização VRP
+
+Resolve o problema de roteirização de veículos com capacidade (CVRP) usando
+o solver de roteamento do OR-Tools sobre a matriz de distâncias inteira
+(em metros) calculada por distancias.py.
+
+Dimensões de capacidade de cada veículo:
+  - peso ('Capac. Kg' x 'Peso dos Itens');
+  - caixas ('Capac. Cx' x 'Qtde. dos Itens');
+  - número máximo de pedidos (coluna 'Máx. Pedidos' da frota, se existir,
+    ou o parâmetro max_pedidos).
+
+Com janelas de entrega ou tempos de descarga (colunas 'Janela Início',
+'Janela Fim' e 'Tempo de Descarga', ver janelas_tempo), o problema passa a ser
+um VRPTW: uma dimensão de tempo soma a duração da viagem e a descarga de cada
+parada, limita o atendimento à janela do pedido e a rota à jornada
+(HORARIO_SAIDA a HORARIO_RETORNO). Se o OR-Tools não encontrar solução, as
+rotas são montadas por inserção mais barata e busca local com verificação
+das janelas em O(1) (janelas_tempo.PlanoRotas).
+
+Pedidos que não cabem em nenhum veículo (ou em nenhuma janela) podem ser
+descartados com uma penalidade alta e são retornados em 'nao_atendidos'.
+"""
+
+import logging
+
+import numpy as np
+from ortools.constraint_solver import pywrapcp, routing_enums_pb2
+
+from config import METODO_DISTANCIA, endereco_partida_coords
+from distancias import matriz_distancias
+from instrumentacao import etapa
+from janelas_tempo import PlanoRotas, janelas_nos, matriz_duracoes, tem_janelas
+
+# Pesos são convertidos para inteiros em décimos de kg e tempos em décimos de minuto
+ESCALA_PESO = 10
+ESCALA_TEMPO = 10
+
+
+def _capacidades(caminhoes_df, coluna, escala=1):
+    valores = caminhoes_df[coluna].to_numpy(dtype=np.float64) if coluna in caminhoes_df.columns \
+        else np.full(len(caminhoes_df), np.inf)
+    valores = np.nan_to_num(valores, nan=0.0, posinf=1e12)
+    return [int(v) for v in np.floor(valores * escala)]
+
+
+def _demandas(pedidos_df, coluna, escala=1):
+    if coluna not in pedidos_df.columns:
+        return [0] * len(pedidos_df)
+    valores = np.nan_to_num(pedidos_df[coluna].to_numpy(dtype=np.float64), nan=0.0)
+    return [int(v) for v in np.ceil(valores * escala)]
+
+
+def dimensoes_capacidade(pedidos_df, caminhoes_df, max_pedidos=None):
+    """
+    Demandas (depósito no índice 0) e capacidades dos veículos, em inteiros,
+    de cada dimensão de capacidade: peso, caixas e número de pedidos.
+
+    Retorna:
+      list: Tuplas (nome, demandas, capacidades).
+    """
+    if 'Máx. Pedidos' in caminhoes_df.columns:
+        limite_pedidos = _capacidades(caminhoes_df, 'Máx. Pedidos')
+    else:
+        limite_pedidos = [int(max_pedidos) if max_pedidos else len(pedidos_df) + 1] * len(caminhoes_df)
+    return [
+        ("Peso", [0] + _demandas(pedidos_df, 'Peso dos Itens', ESCALA_PESO),
+         _capacidades(caminhoes_df, 'Capac. Kg', ESCALA_PESO)),
+        ("Caixas", [0] + _demandas(pedidos_df, 'Qtde. dos Itens'),
+         _capacidades(caminhoes_df, 'Capac. Cx')),
+        ("Pedidos", [0] + [1] * len(pedidos_df), limite_pedidos),
+    ]
+
+
+def _adicionar_dimensao_tempo(routing, manager, n_veiculos, duracoes, inicio, fim, servico):
+    """
+    Dimensão "Tempo": viagem + descarga do nó de origem, com espera permitida
+    e o atendimento de cada nó limitado à sua janela.
+    """
+    tempos = (np.rint(np.asarray(duracoes, dtype=np.float64) * ESCALA_TEMPO)
+              + np.rint(servico * ESCALA_TEMPO)[:, np.newaxis]).astype(np.int64).tolist()
+    callback = routing.RegisterTransitCallback(
+        lambda origem, destino: tempos[manager.IndexToNode(origem)][manager.IndexToNode(destino)]
+    )
+    inicio = np.ceil(inicio * ESCALA_TEMPO).astype(np.int64).tolist()
+    fim = np.floor(fim * ESCALA_TEMPO).astype(np.int64).tolist()
+    routing.AddDimension(callback, fim[0], fim[0], False, "Tempo")
+    dimensao = routing.GetDimensionOrDie("Tempo")
+    for no in range(1, len(inicio)):
+        if inicio[no] <= fim[no]:
+            dimensao.CumulVar(manager.NodeToIndex(no)).SetRange(inicio[no], fim[no])
+    for veiculo in range(n_veiculos):
+        for indice in (routing.Start(veiculo), routing.End(veiculo)):
+            dimensao.CumulVar(indice).SetRange(inicio[0], fim[0])
+            routing.AddVariableMinimizedByFinalizer(dimensao.CumulVar(indice))
+
+
+def _resolver_por_insercao(pedidos_df, caminhoes_df, matriz, duracoes, janelas, dimensoes, tempo_limite):
+    """
+    VRPTW por inserção mais barata seguida de busca local (janelas_tempo.PlanoRotas),
+    com o mesmo formato de retorno de resolver_vrp.
+    """
+    demandas = np.column_stack([d for _, d, _ in dimensoes])
+    capacidades = np.column_stack([c for _, _, c in dimensoes])
+    plano = PlanoRotas([[] for _ in range(len(caminhoes_df))], matriz, duracoes, *janelas, demandas, capacidades)
+    sobras = plano.inserir_pendentes(range(1, len(pedidos_df) + 1))
+    plano.busca_local(tempo_limite=tempo_limite)
+
+    indices_pedidos = pedidos_df.index.tolist()
+    placas = caminhoes_df['Placa'].tolist() if 'Placa' in caminhoes_df.columns else caminhoes_df.index.tolist()
+    rotas = []
+    for veiculo, paradas in enumerate(plano.rotas):
+        if paradas:
+            rotas.append({
+                "placa": placas[veiculo],
+                "pedidos": [indices_pedidos[no - 1] for no in paradas],
+                "distancia": int(round(plano.custo_rota(veiculo))),
+                "peso": plano.cargas[veiculo][0] / ESCALA_PESO,
+                "caixas": int(plano.cargas[veiculo][1]),
+                "horarios": plano.agendas[veiculo].chegadas(),
+            })
+    nao_atendidos = [indices_pedidos[no - 1] for no in sorted(sobras)]
+    if nao_atendidos:
+        logging.warning(f"VRP: {len(nao_atendidos)} pedidos sem veículo com capacidade ou janela disponível.")
+    return {"rotas": rotas, "distancia_total": sum(r["distancia"] for r in rotas), "nao_atendidos": nao_atendidos}
+
+
+@etapa("vrp")
+def resolver_vrp(pedidos_df, caminhoes_df, max_pedidos=None, deposito=endereco_partida_coords,
+                 estrategia_inicial="PATH_CHEAPEST_ARC", metaheuristica="GUIDED_LOCAL_SEARCH",
+                 tempo_limite=30, permitir_descartes=True, matriz=None, janelas=None, duracoes=None):
+    """
+    Resolve o CVRP para os pedidos e caminhões disponíveis.
+
+    Parâmetros:
+      pedidos_df (DataFrame): Pedidos com 'Latitude', 'Longitude', 'Peso dos Itens'
+        e, opcionalmente, 'Qtde. dos Itens'.
+      caminhoes_df (DataFrame): Frota com 'Placa', 'Capac. Kg', 'Capac. Cx' e 'Disponível'.
+      max_pedidos (int): Máximo de pedidos por veículo quando a frota não tem
+        a coluna 'Máx. Pedidos'.
+      deposito (tuple): Coordenadas do ponto de partida e chegada.
+      estrategia_inicial (str): Nome de routing_enums_pb2.FirstSolutionStrategy.
+      metaheuristica (str): Nome de routing_enums_pb2.LocalSearchMetaheuristic.
+      tempo_limite (int): Tempo máximo de busca, em segundos.
+      permitir_descartes (bool): Permite deixar pedidos sem veículo (com penalidade).
+      matriz (np.ndarray): Matriz de distâncias em metros (depósito no índice 0);
+        se None, é calculada a partir das coordenadas.
+      janelas (bool): Considera janelas de entrega e descarga; se None, somente
+        quando os pedidos têm as colunas preenchidas.
+      duracoes (np.ndarray): Matriz de durações em minutos (depósito no índice 0);
+        se None, é calculada por janelas_tempo.matriz_duracoes.
+
+    Retorna:
+      dict: 'rotas' (uma por veículo utilizado; com janelas, também os
+      'horarios' de atendimento em minutos desde a meia-noite),
+      'distancia_total' (m) e 'nao_atendidos' (índices dos pedidos sem veículo).
+    """
+    if 'Disponível' in caminhoes_df.columns:
+        caminhoes_df = caminhoes_df[caminhoes_df['Disponível'] == 'Sim']
+    if caminhoes_df.empty:
+        raise ValueError("Nenhum caminhão disponível para o VRP.")
+    if pedidos_df.empty:
+        return {"rotas": [], "distancia_total": 0, "nao_atendidos": []}
+
+    coords = np.vstack([np.asarray(deposito, dtype=np.float64).reshape(1, 2),
+                        pedidos_df[['Latitude', 'Longitude']].to_numpy(dtype=np.float64)])
+    if matriz is None:
+        matriz = matriz_distancias(coords, metodo=METODO_DISTANCIA) * 1000
+    distancias = np.rint(matriz).astype(np.int64).tolist()
+    usar_janelas = tem_janelas(pedidos_df) if janelas is None else janelas
+
+    n_nos = len(pedidos_df) + 1
+    n_veiculos = len(caminhoes_df)
+    manager = pywrapcp.RoutingIndexManager(n_nos, n_veiculos, 0)
+    routing = pywrapcp.RoutingModel(manager)
+
+    def distancia_callback(origem, destino):
+        return distancias[manager.IndexToNode(origem)][manager.IndexToNode(destino)]
+
+    transito = routing.RegisterTransitCallback(distancia_callback)
+    routing.SetArcCostEvaluatorOfAllVehicles(transito)
+
+    dimensoes = dimensoes_capacidade(pedidos_df, caminhoes_df, max_pedidos)
+    for nome, demandas, capacidades in dimensoes:
+        callback = routing.RegisterUnaryTransitCallback(
+            lambda indice, demandas=demandas: demandas[manager.IndexToNode(indice)]
+        )
+        routing.AddDimensionWithVehicleCapacity(callback, 0, capacidades, True, nome)
+
+    if usar_janelas:
+        if duracoes is None:
+            duracoes = matriz_duracoes(coords, distancias=np.asarray(matriz) / 1000)
+        inicio, fim, servico = janelas_nos(pedidos_df)
+        impossiveis = np.flatnonzero(fim < inicio)
+        if len(impossiveis) and not permitir_descartes:
+            raise ValueError(f"{len(impossiveis)} pedidos têm janela fora da jornada dos caminhões.")
+        _adicionar_dimensao_tempo(routing, manager, n_veiculos, duracoes, inicio, fim, servico)
+
+    if permitir_descartes:
+        penalidade = int(np.max(distancias)) * n_nos + 1
+        for no in range(1, n_nos):
+            routing.AddDisjunction([manager.NodeToIndex(no)], penalidade)
+        if usar_janelas:
+            for no in impossiveis.tolist():
+                routing.ActiveVar(manager.NodeToIndex(no)).SetValue(0)
+
+    parametros = pywrapcp.DefaultRoutingSearchParameters()
+    parametros.first_solution_strategy = getattr(routing_enums_pb2.FirstSolutionStrategy, estrategia_inicial)
+    parametros.local_search_metaheuristic = getattr(routing_enums_pb2.LocalSearchMetaheuristic, metaheuristica)
+    parametros.time_limit.FromSeconds(int(tempo_limite))
+
+    solucao = routing.SolveWithParameters(parametros)
+    if solucao is None and usar_janelas:
+        logging.warning("O OR-Tools não encontrou solução com janelas; usando inserção mais barata.")
+        return _resolver_por_insercao(pedidos_df, caminhoes_df, matriz, duracoes, (inicio, fim, servico),
+                                      dimensoes, tempo_limite)
+    if solucao is None:
+        raise RuntimeError("O OR-Tools não encontrou solução para o VRP.")
+
+    indices_pedidos = pedidos_df.index.tolist()
+    placas = caminhoes_df['Placa'].tolist() if 'Placa' in caminhoes_df.columns else caminhoes_df.index.tolist()
+    dimensao_peso = routing.GetDimensionOrDie("Peso")
+    dimensao_caixas = routing.GetDimensionOrDie("Caixas")
+    dimensao_tempo = routing.GetDimensionOrDie("Tempo") if usar_janelas else None
+
+    rotas = []
+    atendidos = set()
+    distancia_total = 0
+    for veiculo in range(n_veiculos):
+        indice = routing.Start(veiculo)
+        paradas = []
+        horarios = []
+        distancia = 0
+        while not routing.IsEnd(indice):
+            no = manager.IndexToNode(indice)
+            if no != 0:
+                paradas.append(indices_pedidos[no - 1])
+                atendidos.add(no)
+                if usar_janelas:
+                    horarios.append(solucao.Min(dimensao_tempo.CumulVar(indice)) / ESCALA_TEMPO)
+            anterior, indice = indice, solucao.Value(routing.NextVar(indice))
+            distancia += routing.GetArcCostForVehicle(anterior, indice, veiculo)
+        if paradas:
+            rotas.append({
+                "placa": placas[veiculo],
+                "pedidos": paradas,
+                "distancia": distancia,
+                "peso": solucao.Value(dimensao_peso.CumulVar(indice)) / ESCALA_PESO,
+                "caixas": solucao.Value(dimensao_caixas.CumulVar(indice)),
+            })
+            if usar_janelas:
+                rotas[-1]["horarios"] = horarios
+            distancia_total += distancia
+
+    nao_atendidos = [indices_pedidos[no - 1] for no in range(1, n_nos) if no not in atendidos]
+    if nao_atendidos:
+        logging.warning(f"VRP: {len(nao_atendidos)} pedidos sem veículo com capacidade disponível.")
+    return {"rotas": rotas, "distancia_total": distancia_total, "nao_atendidos": nao_atendidos}
@@ -0,0 +1,157 @@
+"""
+Módulo de snapshots das planilhas
+
+Guarda um DataFrame já lido, validado e geocodificado em formato colunar
+(um arquivo .npy por coluna e um manifesto JSON), identificado pelo hash do
+conteúdo da planilha de origem. Os endpoints de leitura carregam as colunas
+numéricas por memory-map em vez de reprocessar o Excel a cada requisição.
+
+Cada snapshot fica em <pasta>/<nome>/<hash>/ e o arquivo <pasta>/<nome>/atual.json
+aponta para o snapshot vigente; um novo upload troca o ponteiro de forma
+atômica e remove os snapshots anteriores.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+
+import numpy as np
+import pandas as pd
+
+from config import DATABASE_FOLDER
+
+PASTA_SNAPSHOTS = os.path.join(DATABASE_FOLDER, "snapshots")
+
+_memoria = {}
+_lock = threading.Lock()
+
+
+def hash_arquivo(caminho):
+    """
+    Hash SHA-256 do conteúdo de um arquivo.
+    """
+    h = hashlib.sha256()
+    with open(caminho, "rb") as f:
+        for bloco in iter(lambda: f.read(1 << 20), b""):
+            h.update(bloco)
+    return h.hexdigest()
+
+
+def _origem(caminho):
+    info = os.stat(caminho)
+    return {"tamanho": info.st_size, "modificado_em": info.st_mtime_ns}
+
+
+def salvar_snapshot(nome, df, chave, caminho_origem=None, pasta=PASTA_SNAPSHOTS):
+    """
+    Grava o DataFrame como snapshot colunar e o torna o snapshot vigente.
+
+    Parâmetros:
+      nome (str): Nome lógico (ex.: "pedidos").
+      df (DataFrame): Dados já validados.
+      chave (str): Hash do conteúdo de origem.
+      caminho_origem (str): Arquivo de origem; seu tamanho e data de
+        modificação são usados para detectar alterações fora do upload.
+    """
+    base = os.path.join(pasta, nome)
+    destino = os.path.join(base, chave)
+    temporario = destino + ".tmp"
+    shutil.rmtree(temporario, ignore_errors=True)
+    os.makedirs(temporario)
+
+    colunas = []
+    for i, coluna in enumerate(df.columns):
+        serie = df[coluna]
+        descricao = {"nome": str(coluna), "arquivo": f"c{i}.npy", "nulos": None, "texto": False,
+                     "categoria": isinstance(serie.dtype, pd.CategoricalDtype)}
+        valores = serie.to_numpy()
+        if valores.dtype == object and pd.api.types.is_numeric_dtype(serie.dtype):
+            # Inteiros anuláveis (Int64) com nulos viram float64 com NaN
+            valores = serie.to_numpy(dtype=np.float64, na_value=np.nan)
+        # Colunas de texto (ou mistas) viram arrays de texto de largura fixa
+        if valores.dtype == object or pd.api.types.is_string_dtype(serie.dtype) \
+                or isinstance(serie.dtype, pd.CategoricalDtype):
+            nulos = serie.isna().to_numpy()
+            valores = serie.astype(object).where(~nulos, "").astype(str).to_numpy(dtype=str)
+            descricao["texto"] = True
+            if nulos.any():
+                descricao["nulos"] = f"c{i}_nulos.npy"
+                np.save(os.path.join(temporario, descricao["nulos"]), nulos)
+        np.save(os.path.join(temporario, descricao["arquivo"]), valores, allow_pickle=False)
+        colunas.append(descricao)
+
+    manifesto = {"chave": chave, "linhas": len(df), "colunas": colunas,
+                 "origem": _origem(caminho_origem) if caminho_origem else None}
+    with open(os.path.join(temporario, "manifesto.json"), "w", encoding="utf-8") as f:
+        json.dump(manifesto, f, ensure_ascii=False)
+
+    shutil.rmtree(destino, ignore_errors=True)
+    os.replace(temporario, destino)
+    ponteiro = os.path.join(base, "atual.json")
+    with open(ponteiro + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({"chave": chave}, f)
+    os.replace(ponteiro + ".tmp", ponteiro)
+
+    # Remove snapshots anteriores
+    for entrada in os.listdir(base):
+        caminho = os.path.join(base, entrada)
+        if entrada != chave and os.path.isdir(caminho):
+            shutil.rmtree(caminho, ignore_errors=True)
+    with _lock:
+        _memoria.pop((pasta, nome), None)
+    logging.info(f"Snapshot '{nome}' gravado ({len(df)} linhas, chave {chave[:12]}).")
+
+
+def carregar_snapshot(nome, caminho_origem=None, pasta=PASTA_SNAPSHOTS, mmap=True):
+    """
+    Carrega o snapshot vigente.
+
+    As colunas numéricas são abertas por memory-map (somente leitura); quem for
+    alterar os dados deve trabalhar sobre uma cópia. O DataFrame fica em
+    memória enquanto o ponteiro não mudar.
+
+    Retorna:
+      tuple: (DataFrame, chave), ou None se não houver snapshot válido.
+    """
+    base = os.path.join(pasta, nome)
+    try:
+        with open(os.path.join(base, "atual.json"), encoding="utf-8") as f:
+            chave = json.load(f)["chave"]
+        with open(os.path.join(base, chave, "manifesto.json"), encoding="utf-8") as f:
+            manifesto = json.load(f)
+    except (OSError, ValueError, KeyError):
+        return None
+
+    # Planilha alterada sem passar pelo upload: o snapshot não vale mais
+    if caminho_origem is not None and manifesto.get("origem") is not None:
+        try:
+            if _origem(caminho_origem) != manifesto["origem"]:
+                return None
+        except OSError:
+            return None
+
+    with _lock:
+        em_memoria = _memoria.get((pasta, nome))
+    if em_memoria is not None and em_memoria[1] == chave:
+        return em_memoria
+
+    pasta_snapshot = os.path.join(base, chave)
+    dados = {}
+    for coluna in manifesto["colunas"]:
+        if coluna["texto"]:
+            valores = np.load(os.path.join(pasta_snapshot, coluna["arquivo"])).astype(object)
+            if coluna["nulos"]:
+                valores[np.load(os.path.join(pasta_snapshot, coluna["nulos"]))] = None
+            if coluna.get("categoria"):
+                valores = pd.Categorical(valores)
+        else:
+            valores = np.load(os.path.join(pasta_snapshot, coluna["arquivo"]),
+                              mmap_mode="r" if mmap else None, allow_pickle=False)
+        dados[coluna["nome"]] = valores
+    df = pd.DataFrame(dados, copy=False)
+    with _lock:
+        _memoria[(pasta, nome)] = (df, chave)
+    return df, chave
@@ -1,52 +1,57 @@
 import streamlit as st
 import pandas as pd
 from io import BytesIO
+from cache_geocodificacao import obter_cache
+from cache_sessao import etapa_em_cache, hash_conteudo
+from instrumentacao import etapa
+from ingestao import PARQUET_DISPONIVEL, concatenar_lotes, formato_arquivo, ler_em_lotes, montar_endereco_completo
+from janelas_tempo import preparar_janelas
 
 REQUIRED_COLUMNS = ["Endereço de Entrega", "Bairro de Entrega", "Cidade de Entrega"]
 
+@etapa("leitura_pedidos")
+def _ler_pedidos(conteudo, nome_arquivo):
+    """
+    Lê a planilha enviada em lotes, cria a coluna 'Endereço Completo' e
+    consulta no cache as coordenadas de cada lote assim que ele é lido.
+    As colunas opcionais de janela de entrega e tempo de descarga são
+    convertidas para durações (timedelta). Retorna o DataFrame e as coordenadas já conhecidas.
+    """
+    lotes = []
+    coordenadas_salvas = {}
+    cache = obter_cache()
+    for lote in ler_em_lotes(BytesIO(conteudo), obrigatorias=REQUIRED_COLUMNS, formato=formato_arquivo(nome_arquivo)):
+        lote['Endereço Completo'] = montar_endereco_completo(lote)
+        coordenadas_salvas.update(cache.buscar_lote(lote['Endereço Completo'].unique()))
+        lotes.append(lote)
+    return preparar_janelas(concatenar_lotes(lotes)), coordenadas_salvas
+
 def processar_pedidos():
-    uploaded_pedidos = st.file_uploader("Escolha o arquivo Excel de Pedidos", type=["xlsx", "xlsm"])
+    tipos = ["xlsx", "xlsm", "csv"] + (["parquet"] if PARQUET_DISPONIVEL else [])
+    uploaded_pedidos = st.file_uploader("Escolha o arquivo de Pedidos (Excel, CSV"
+                                        + (" ou Parquet)" if PARQUET_DISPONIVEL else ")"), type=tipos)
     if uploaded_pedidos is None:
         st.info("Envie a planilha de pedidos para continuação.")
         return None
 
+    # A leitura só é refeita quando o conteúdo enviado muda
+    conteudo = uploaded_pedidos.getvalue()
+    chave = hash_conteudo(conteudo, uploaded_pedidos.name)
     try:
-        pedidos_df = pd.read_excel(uploaded_pedidos, engine='openpyxl')
+        pedidos_df, coordenadas_salvas = etapa_em_cache(
+            "leitura_pedidos", chave, lambda: _ler_pedidos(conteudo, uploaded_pedidos.name)
+        )
+    except ValueError as e:
+        # Colunas obrigatórias ausentes ou formato não suportado
+        st.error(str(e))
+        return None
     except Exception as e:
         st.error("Erro ao ler a planilha: " + str(e))
         return None
 
-    # Verifica se as colunas necessárias estão presentes
-    missing_cols = [col for col in REQUIRED_COLUMNS if col not in pedidos_df.columns]
-    if missing_cols:
-        st.error(f"As seguintes colunas necessárias não foram encontradas: {', '.join(missing_cols)}")
-        return None
-
-    # Cria a coluna 'Endereço Completo'
-    pedidos_df['Endereço Completo'] = (
-        pedidos_df['Endereço de Entrega'].astype(str) + ', ' +
-        pedidos_df['Bairro de Entrega'].astype(str) + ', ' +
-        pedidos_df['Cidade de Entrega'].astype(str)
-    )
-    
-    # Carrega coordenadas salvas (se houver)
-    try:
-        coordenadas_salvas_df = pd.read_excel("database/coordenadas_salvas.xlsx", engine='openpyxl')
-        coordenadas_salvas = dict(zip(
-            coordenadas_salvas_df['Endereço'],
-            zip(coordenadas_salvas_df['Latitude'], coordenadas_salvas_df['Longitude'])
-        ))
-    except FileNotFoundError:
-        coordenadas_salvas = {}
-    
-    return pedidos_df, coordenadas_salvas
+    # Cópia para que as etapas seguintes não alterem o resultado guardado
+    return pedidos_df.copy(), coordenadas_salvas
 
 def salvar_coordenadas(coordenadas_salvas):
-    # Salva as coordenadas atualizadas num arquivo Excel
-    coordenadas_salvas_df = pd.DataFrame(coordenadas_salvas.items(), columns=['Endereço', 'Coordenadas'])
-    coordenadas_salvas_df[['Latitude','Longitude']] = pd.DataFrame(
-        coordenadas_salvas_df['Coordenadas'].tolist(),
-        index=coordenadas_salvas_df.index
-    )
-    coordenadas_salvas_df.drop(columns=['Coordenadas'], inplace=True)
-    coordenadas_salvas_df.to_excel("database/coordenadas_salvas.xlsx", index=False)
\ No newline at end of file
+    # Grava no cache apenas as coordenadas novas ou alteradas
+    obter_cache().salvar_lote(coordenadas_salvas)
\ No newline at end of file
@@ -0,0 +1,118 @@
+"""
+Módulo do algoritmo genético para o TSP
+
+Versão matricial do algoritmo genético usado por resolver_tsp_genetico:
+cada indivíduo é uma permutação de índices da matriz de distâncias e o
+tamanho de todas as rotas da população é calculado de uma vez.
+
+As funções são de módulo para que possam ser executadas em processos
+separados pelo modelo de ilhas (modelo_ilhas).
+"""
+
+from functools import partial
+
+import numpy as np
+
+from instrumentacao import incrementar
+from modelo_ilhas import executar_ilhas
+
+
+def populacao_inicial_tsp(n_nos, tamanho=100, rng=None):
+    """
+    Cria 'tamanho' permutações aleatórias de n_nos índices.
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    return np.argsort(rng.random((tamanho, n_nos)), axis=1).astype(np.int32)
+
+
+def distancias_populacao(populacao, matriz):
+    """
+    Distância total (rota fechada) de cada indivíduo da população.
+    """
+    proximos = np.roll(populacao, -1, axis=1)
+    return matriz[populacao, proximos].sum(axis=1, dtype=np.float64)
+
+
+def crossover_ordenado(pai_1, pai_2, rng):
+    """
+    Order crossover (OX): copia um trecho do primeiro pai e completa com os
+    nós restantes na ordem em que aparecem no segundo, em O(n).
+    """
+    tamanho = len(pai_1)
+    inicio, fim = np.sort(rng.choice(tamanho, 2, replace=False))
+    presentes = np.zeros(tamanho, dtype=bool)
+    presentes[pai_1[inicio:fim]] = True
+    restantes = pai_2[~presentes[pai_2]]
+    filho = np.empty_like(pai_1)
+    filho[inicio:fim] = pai_1[inicio:fim]
+    filho[:inicio] = restantes[:inicio]
+    filho[fim:] = restantes[inicio:]
+    return filho
+
+
+def evoluir_tsp(populacao, matriz, geracoes, rng, taxa_mutacao=0.01, n_elite=2, n_pais=10):
+    """
+    Executa 'geracoes' gerações: os 'n_elite' melhores passam intactos e os
+    demais filhos são gerados por OX entre dois dos 'n_pais' melhores, com
+    mutação por troca de dois nós.
+
+    Retorna:
+      tuple: (população, fitness), com fitness = -distância (maior é melhor).
+    """
+    tamanho, n_nos = populacao.shape
+    distancias = distancias_populacao(populacao, matriz)
+    if n_nos < 3:
+        return populacao, -distancias
+    for _ in range(geracoes):
+        ordem = np.argsort(distancias)
+        pais = populacao[ordem[:min(n_pais, tamanho)]]
+        nova = np.empty_like(populacao)
+        nova[:n_elite] = populacao[ordem[:n_elite]]
+        for k in range(n_elite, tamanho):
+            a, b = rng.choice(len(pais), 2, replace=len(pais) < 2)
+            filho = crossover_ordenado(pais[a], pais[b], rng)
+            if rng.random() < taxa_mutacao:
+                i, j = rng.choice(n_nos, 2, replace=False)
+                filho[i], filho[j] = filho[j], filho[i]
+            nova[k] = filho
+        populacao = nova
+        distancias = distancias_populacao(populacao, matriz)
+    return populacao, -distancias
+
+
+def resolver_tsp_genetico_matriz(matriz, geracoes=100, tamanho=100, taxa_mutacao=0.01, seed=None,
+                                 n_ilhas=1, intervalo_migracao=10, max_workers=None, inicio=0):
+    """
+    Resolve o TSP sobre a matriz de distâncias com o algoritmo genético.
+
+    Parâmetros:
+      matriz (np.ndarray): Matriz de distâncias N×N.
+      n_ilhas (int): Número de populações; acima de 1 usa o modelo de ilhas.
+      inicio (int): Índice em que a rota retornada deve começar (ex.: a partida).
+
+    Retorna:
+      tuple: (rota como lista de índices, distância total, ilha vencedora).
+    """
+    matriz = np.asarray(matriz)
+    n_nos = len(matriz)
+    if n_nos == 0:
+        return [], 0.0, 0
+
+    inicializar = partial(populacao_inicial_tsp, n_nos, tamanho)
+    evoluir = partial(evoluir_tsp, matriz=matriz, taxa_mutacao=taxa_mutacao)
+    if n_ilhas > 1:
+        resultado = executar_ilhas(inicializar, evoluir, n_ilhas=n_ilhas, geracoes=geracoes,
+                                   intervalo_migracao=intervalo_migracao, seed=seed,
+                                   max_workers=max_workers)
+        rota, fitness, ilha = resultado["individuo"], resultado["fitness"], resultado["ilha"]
+    else:
+        rng = np.random.default_rng(seed)
+        populacao, fitness = evoluir(inicializar(rng=rng), geracoes=geracoes, rng=rng)
+        melhor = int(np.argmax(fitness))
+        rota, fitness, ilha = populacao[melhor], float(fitness[melhor]), 0
+
+    incrementar("iteracoes_solver", geracoes * max(1, n_ilhas), solver="tsp_genetico")
+
+    # A rota é um ciclo: rotaciona para começar no nó de início
+    rota = np.roll(rota, -int(np.flatnonzero(rota == inicio)[0]))
+    return rota.tolist(), -float(fitness), ilha